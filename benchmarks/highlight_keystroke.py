@@ -0,0 +1,55 @@
+"""Benchmark lexing the current line for syntax highlighting per keystroke.
+
+Compares lexing the line with Pygments' Python lexer, as Repl.tokenize used
+to do, with the line token cache lexing it with Pygments and with the
+scanner. Each keystroke appends a character to a line of the given length.
+
+Usage: PYTHONPATH=. python benchmarks/highlight_keystroke.py [lengths...]
+"""
+
+import sys
+import timeit
+
+from pygments.lexers import Python3Lexer
+
+from bpython.highlight import LineTokenCache
+
+SNIPPET = "value = compute(alpha, 'beta %s' % gamma, 0x1f) + self.items[2]; "
+
+
+def keystrokes(length: int, count: int) -> list[str]:
+    """The line after each of the last `count` keystrokes typing a line of
+    `length` characters."""
+    line = (SNIPPET * (length // len(SNIPPET) + 1))[:length]
+    return [line[: length - i] for i in reversed(range(count))]
+
+
+def main() -> None:
+    lengths = [int(arg) for arg in sys.argv[1:]] or [200, 5000]
+    count = 50
+    for length in lengths:
+        lines = keystrokes(length, count)
+        pygments_cache = LineTokenCache(fast=False)
+        scanner_cache = LineTokenCache()
+        assert [
+            token for token in pygments_cache.tokens(lines[-1:]) if token[1]
+        ] == scanner_cache.tokens(lines[-1:])
+
+        timers = {
+            "pygments": lambda: [
+                list(Python3Lexer().get_tokens(line)) for line in lines
+            ],
+            "cached pygments": lambda: [
+                pygments_cache.tokens([line]) for line in lines
+            ],
+            "scanner": lambda: [scanner_cache.tokens([line]) for line in lines],
+        }
+        results = []
+        for name, timer in timers.items():
+            seconds = min(timeit.repeat(timer, number=1, repeat=5))
+            results.append(f"{name}: {seconds / count * 1e3:8.3f} ms")
+        print(f"{length:6} chars   " + "   ".join(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark import completion lookups on a large synthetic module corpus.
+
+Compares a linear scan over a flat set of names, as ModuleGatherer used to do,
+with the ModuleNames trie.
+
+Usage: PYTHONPATH=. python benchmarks/import_completion_lookup.py [size]
+"""
+
+import sys
+import timeit
+
+from bpython.importcompletion import ModuleNames
+
+
+def synthetic_corpus(size: int) -> list[str]:
+    """Generate `size` dotted module names, three levels deep."""
+    names = []
+    for i in range(size):
+        top, rest = divmod(i, 250)
+        sub, leaf = divmod(rest, 25)
+        names.append(f"package{top:05d}.sub{sub:02d}.module{leaf:02d}")
+    return names
+
+
+def flat_matches(modules: set[str], full: str) -> set[str]:
+    return {
+        name
+        for name in modules
+        if name.startswith(full) and name.find(".", len(full)) == -1
+    }
+
+
+def trie_matches(modules: ModuleNames, full: str) -> set[str]:
+    package, _, name_after_dot = full.rpartition(".")
+    return {
+        f"{package}.{name}" if package else name
+        for name in modules.children(package, name_after_dot)
+    }
+
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    corpus = synthetic_corpus(size)
+    flat = set(corpus)
+    trie = ModuleNames(corpus)
+    queries = ("package0", "package00123.sub0", "package00123.sub04.mod", "zz")
+
+    print(f"{size} modules")
+    for query in queries:
+        assert flat_matches(flat, query) == trie_matches(trie, query)
+        n = 5
+        flat_time = timeit.timeit(lambda: flat_matches(flat, query), number=n)
+        trie_time = timeit.timeit(lambda: trie_matches(trie, query), number=n)
+        print(
+            f"{query!r:28} flat: {flat_time / n * 1e3:9.3f} ms"
+            f"   trie: {trie_time / n * 1e3:9.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
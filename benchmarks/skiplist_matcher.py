@@ -0,0 +1,96 @@
+"""Benchmark the import completion skiplist on a large synthetic tree.
+
+Compares checking every directory entry against each pattern with fnmatch,
+as ModuleGatherer used to do, with the compiled skiplist matcher. Both the
+per-entry filter cost and the time to scan the whole tree are reported.
+
+Usage: PYTHONPATH=. python benchmarks/skiplist_matcher.py [packages]
+"""
+
+import fnmatch
+import os
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+
+from bpython.config import Config
+from bpython.importcompletion import ModuleGatherer, _compile_skiplist
+
+
+class FnmatchModuleGatherer(ModuleGatherer):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        skiplist = self.skiplist
+        self._skiplist_match = lambda name: any(
+            fnmatch.fnmatch(name, entry) for entry in skiplist
+        )
+
+
+def make_tree(root: Path, packages: int) -> list[str]:
+    """Create `packages` packages with 20 modules each and return the names
+    of all directory entries."""
+    names = []
+    for i in range(packages):
+        package = root / f"package{i:05d}"
+        package.mkdir()
+        (package / "__init__.py").touch()
+        names.append(package.name)
+        names.append("__init__.py")
+        for j in range(20):
+            (package / f"module{j:02d}.py").touch()
+            names.append(f"module{j:02d}.py")
+    return names
+
+
+def scan(cls: type[ModuleGatherer], root: Path, skiplist: list[str]) -> float:
+    start = time.perf_counter()
+    module_gatherer = cls((root,), skiplist=skiplist, max_workers=0)
+    while module_gatherer.find_coroutine():
+        pass
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    packages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    config = Config(Path(os.devnull))
+    # the default skiplist and a few patterns with wildcards
+    skiplist = config.import_completion_skiplist + ["*.egg-info", "test_*"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        names = make_tree(root, packages)
+        print(f"{len(names)} entries, {len(skiplist)} skiplist patterns")
+
+        compiled = _compile_skiplist(skiplist)
+        n = 3
+        fnmatch_time = timeit.timeit(
+            lambda: [
+                any(fnmatch.fnmatch(name, entry) for entry in skiplist)
+                for name in names
+            ],
+            number=n,
+        )
+        compiled_time = timeit.timeit(
+            lambda: [compiled(name) for name in names], number=n
+        )
+        print(
+            f"per entry      fnmatch: {fnmatch_time / n / len(names) * 1e9:9.1f} ns"
+            f"   compiled: {compiled_time / n / len(names) * 1e9:9.1f} ns"
+        )
+
+        fnmatch_scan = min(
+            scan(FnmatchModuleGatherer, root, skiplist) for _ in range(n)
+        )
+        compiled_scan = min(
+            scan(ModuleGatherer, root, skiplist) for _ in range(n)
+        )
+        print(
+            f"tree scan      fnmatch: {fnmatch_scan * 1e3:9.1f} ms"
+            f"   compiled: {compiled_scan * 1e3:9.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -27,7 +27,12 @@
 
 import __main__
 import abc
-import glob
+import ast
+import bisect
+import codeop
+import collections
+import functools
+import inspect
 import itertools
 import keyword
 import logging
@@ -35,20 +40,27 @@ import os
 import re
 import rlcompleter
 import builtins
+import threading
+import types
+import weakref
 
+from concurrent.futures import Future
+from dataclasses import dataclass, field
 from enum import Enum
 from typing import (
     Any,
     Optional,
 )
-from collections.abc import Iterator, Sequence
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from collections.abc import Set as AbstractSet
 
 from . import inspection
+from .completionstats import CompletionStats
 from . import line as lineparts
 from .line import LinePart
 from .lazyre import LazyReCompile
 from .simpleeval import safe_eval, evaluate_current_expression, EvaluationError
-from .importcompletion import ModuleGatherer
+from .importcompletion import ModuleGatherer, with_prefix
 
 
 logger = logging.getLogger(__name__)
@@ -173,6 +185,7 @@ MAGIC_METHODS = tuple(
 )
 
 KEYWORDS = frozenset(keyword.kwlist)
+_SORTED_KEYWORDS = sorted(KEYWORDS)
 
 
 def _after_last_dot(name: str) -> str:
@@ -193,6 +206,21 @@ def _few_enough_underscores(current: str, match: str) -> bool:
     return not match.startswith("_")
 
 
+_word_chars_re = LazyReCompile(r"\w*")
+
+
+def _extends(word: str, new_word: str) -> bool:
+    """Whether new_word is word followed by nothing but word characters."""
+    return new_word.startswith(word) and bool(
+        _word_chars_re.fullmatch(new_word, len(word))
+    )
+
+
+def _underscores(name: str) -> int:
+    """Number of leading underscores that matter to _few_enough_underscores"""
+    return 2 if name.startswith("__") else 1 if name.startswith("_") else 0
+
+
 def _method_match_none(word: str, size: int, text: str) -> bool:
     return False
 
@@ -205,9 +233,78 @@ def _method_match_substring(word: str, size: int, text: str) -> bool:
     return text in word
 
 
+@functools.lru_cache(maxsize=64)
+def _fuzzy_pattern(text: str) -> re.Pattern[str]:
+    return re.compile(".*?".join(re.escape(c) for c in text))
+
+
 def _method_match_fuzzy(word: str, size: int, text: str) -> bool:
-    s = r".*{}.*".format(".*".join(c for c in text))
-    return re.search(s, word) is not None
+    return _fuzzy_pattern(text).search(word) is not None
+
+
+# Scores used to rank fuzzy matches, following fzf
+_SCORE_MATCH = 16
+_SCORE_GAP_START = -3
+_SCORE_GAP_EXTENSION = -1
+# bonus for matching the first character or the one after a non-word char
+_BONUS_BOUNDARY = 8
+# bonus for matching an upper case letter after a lower case one or a digit
+# after a non-digit
+_BONUS_CAMEL = 7
+_BONUS_CONSECUTIVE = 4
+_BONUS_FIRST_CHAR_MULTIPLIER = 2
+
+
+def _fuzzy_bonus(word: str, i: int) -> int:
+    if i == 0:
+        return _BONUS_BOUNDARY
+    prev, c = word[i - 1], word[i]
+    if not prev.isalnum() and c.isalnum():
+        return _BONUS_BOUNDARY
+    if (prev.islower() and c.isupper()) or (not prev.isdigit() and c.isdigit()):
+        return _BONUS_CAMEL
+    return 0
+
+
+def _fuzzy_score(word: str, text: str) -> int | None:
+    """Score how well the characters of text match word in order, or None if
+    they do not.
+
+    As in fzf, the shortest window of word containing the characters is
+    searched for and matches at word boundaries and consecutive matches are
+    rewarded while gaps are penalized."""
+    end = -1
+    for c in text:
+        end = word.find(c, end + 1)
+        if end == -1:
+            return None
+    start = end + 1
+    for c in reversed(text):
+        start = word.rfind(c, 0, start)
+
+    score = 0
+    ti = 0
+    in_gap = False
+    consecutive = False
+    chunk_bonus = 0
+    for i in range(start, end + 1):
+        if ti < len(text) and word[i] == text[ti]:
+            bonus = _fuzzy_bonus(word, i)
+            if consecutive:
+                bonus = max(bonus, chunk_bonus, _BONUS_CONSECUTIVE)
+            else:
+                chunk_bonus = bonus
+            if ti == 0:
+                bonus *= _BONUS_FIRST_CHAR_MULTIPLIER
+            score += _SCORE_MATCH + bonus
+            ti += 1
+            in_gap = False
+            consecutive = True
+        else:
+            score += _SCORE_GAP_EXTENSION if in_gap else _SCORE_GAP_START
+            in_gap = True
+            consecutive = False
+    return score
 
 
 _MODES_MAP = {
@@ -218,15 +315,32 @@ _MODES_MAP = {
 }
 
 
+class TruncatedMatches(set[str]):
+    """Matches found without searching all candidates, e.g. because there
+    were too many. Completers return them instead of a plain set then."""
+
+
+class TruncatedMatchList(list[str]):
+    """The sorted matches of TruncatedMatches."""
+
+
 class BaseCompletionType:
     """Describes different completion types"""
 
+    # Whether finding matches might take long, e.g. because it lists
+    # directories or runs Jedi. If so, get_completer can run it on the
+    # completion worker. Completers which evaluate objects of the user must
+    # run on the main thread, since e.g. inspection.AttrCleaner patches their
+    # classes while it looks up attributes.
+    background = False
+
     def __init__(
         self,
         shown_before_tab: bool = True,
         mode: AutocompleteModes = AutocompleteModes.SIMPLE,
     ) -> None:
         self._shown_before_tab = shown_before_tab
+        self.mode = mode
         self.method_match = _MODES_MAP[mode]
 
     @abc.abstractmethod
@@ -259,9 +373,39 @@ class BaseCompletionType:
         the cursor."""
         raise NotImplementedError
 
+    def context(self, cursor_offset: int, line: str) -> str:
+        """What the matches depend on besides the word under the cursor if
+        it is not part of them, e.g. the dict whose keys are completed.
+        Completions are ranked separately in each context."""
+        return ""
+
+    def applies(self, cursor_offset: int, line: str, **kwargs: Any) -> bool:
+        """Whether matches might be found, without searching them. Called
+        on the main thread before a completer which might take long is run
+        in the background, so it must be cheap.
+
+        By default, whether there is a target under the cursor."""
+        return self.locate(cursor_offset, line) is not None
+
     def format(self, word: str) -> str:
         return word
 
+    def warm_up(self) -> None:
+        """Prepare for the first completion. Called on the completion worker
+        when bpython starts."""
+
+    def narrowable(self, word: str, new_word: str) -> bool:
+        """Whether the matches for `new_word` can be found by filtering the
+        matches found for `word` with `still_matches` instead of computing
+        them again.
+
+        Only asked if the namespace has not changed in between."""
+        return False
+
+    def still_matches(self, match: str, word: str) -> bool:
+        """Whether a match found for a prefix of `word` also matches `word`."""
+        return match.startswith(word)
+
     def substitute(
         self, cursor_offset: int, line: str, match: str
     ) -> tuple[int, str]:
@@ -292,6 +436,7 @@ class CumulativeCompleter(BaseCompletionType):
                 "CumulativeCompleter requires at least one completer"
             )
         self._completers: Sequence[BaseCompletionType] = completers
+        self.background = any(c.background for c in completers)
 
         super().__init__(True, mode)
 
@@ -305,6 +450,22 @@ class CumulativeCompleter(BaseCompletionType):
     def format(self, word: str) -> str:
         return self._completers[0].format(word)
 
+    def narrowable(self, word: str, new_word: str) -> bool:
+        return all(
+            completer.narrowable(word, new_word)
+            for completer in self._completers
+        )
+
+    def still_matches(self, match: str, word: str) -> bool:
+        return any(
+            completer.still_matches(match, word)
+            for completer in self._completers
+        )
+
+    def warm_up(self) -> None:
+        for completer in self._completers:
+            completer.warm_up()
+
     def matches(
         self, cursor_offset: int, line: str, **kwargs: Any
     ) -> set[str] | None:
@@ -338,17 +499,121 @@ class ImportCompletion(BaseCompletionType):
     def locate(self, cursor_offset: int, line: str) -> LinePart | None:
         return lineparts.current_word(cursor_offset, line)
 
+    def context(self, cursor_offset: int, line: str) -> str:
+        # the names imported from a module do not include the module
+        from_import_from = lineparts.current_from_import_from(
+            cursor_offset, line
+        )
+        if (
+            from_import_from is None
+            or lineparts.current_from_import_import(cursor_offset, line) is None
+        ):
+            return ""
+        return from_import_from.word
+
     def format(self, word: str) -> str:
         return _after_last_dot(word)
 
+    def narrowable(self, word: str, new_word: str) -> bool:
+        # modules found since the matches were computed would be missing
+        return self.module_gatherer.fully_loaded and _extends(word, new_word)
+
+
+@dataclass
+class _FilenameListing:
+    mtime_ns: int
+    # sorted names of the entries and those of the directories among them
+    names: list[str]
+    directories: frozenset[str]
+
+
+def _is_dir(entry: os.DirEntry) -> bool:
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+class _DirectoryCache:
+    """Listings of recently completed directories. A listing is used as
+    long as the modification time of its directory stays the same."""
+
+    def __init__(self, size: int = 16, max_entries: int = 250000) -> None:
+        self.size = size
+        # bound on the number of entries of all listings together, larger
+        # directories are listed again every time
+        self.max_entries = max_entries
+        self._entries = 0
+        self._listings: collections.OrderedDict[str, _FilenameListing] = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def _listing(self, directory: str) -> _FilenameListing | None:
+        path = os.path.abspath(directory)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            listing = self._listings.get(path)
+            if listing is not None and listing.mtime_ns == mtime_ns:
+                self._listings.move_to_end(path)
+                return listing
+
+        names = []
+        directories = set()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    names.append(entry.name)
+                    # scandir knows the type of most entries without a stat
+                    if _is_dir(entry):
+                        directories.add(entry.name)
+        except OSError:
+            return None
+        names.sort()
+        listing = _FilenameListing(mtime_ns, names, frozenset(directories))
+        if len(names) <= self.max_entries:
+            with self._lock:
+                old = self._listings.pop(path, None)
+                if old is not None:
+                    self._entries -= len(old.names)
+                self._listings[path] = listing
+                self._entries += len(names)
+                while (
+                    len(self._listings) > self.size
+                    or self._entries > self.max_entries
+                ):
+                    _, evicted = self._listings.popitem(last=False)
+                    self._entries -= len(evicted.names)
+        return listing
+
+    def entries(
+        self, directory: str, prefix: str
+    ) -> Iterator[tuple[str, bool]]:
+        """The names of the entries of directory which start with prefix in
+        sorted order and whether they are directories. Like glob, hidden
+        entries are only included if the prefix starts with a dot."""
+        listing = self._listing(directory)
+        if listing is None:
+            return
+        for name in with_prefix(listing.names, prefix):
+            if prefix or not name.startswith("."):
+                yield name, name in listing.directories
 
-def _safe_glob(pathname: str) -> Iterator[str]:
-    return glob.iglob(glob.escape(pathname) + "*")
+
+# Maximum number of files and directories found by filename completion
+FILENAME_MATCHES_LIMIT = 1000
 
 
 class FilenameCompletion(BaseCompletionType):
+    # listing a directory might take long, e.g. on network file systems
+    background = True
+
     def __init__(self, mode: AutocompleteModes = AutocompleteModes.SIMPLE):
         super().__init__(False, mode)
+        self._directories = _DirectoryCache()
 
     def matches(
         self, cursor_offset: int, line: str, **kwargs: Any
@@ -359,17 +624,33 @@ class FilenameCompletion(BaseCompletionType):
         matches = set()
         username = cs.word.split(os.path.sep, 1)[0]
         user_dir = os.path.expanduser(username)
-        for filename in _safe_glob(os.path.expanduser(cs.word)):
-            if os.path.isdir(filename):
+        path = os.path.expanduser(cs.word)
+        seps = os.path.sep + (os.path.altsep or "")
+        directory = path[: max(path.rfind(sep) for sep in seps) + 1]
+        prefix = path[len(directory) :]
+        entries = list(
+            itertools.islice(
+                self._directories.entries(directory or os.path.curdir, prefix),
+                FILENAME_MATCHES_LIMIT + 1,
+            )
+        )
+        for name, is_dir in entries[:FILENAME_MATCHES_LIMIT]:
+            filename = directory + name
+            if is_dir:
                 filename += os.path.sep
             if cs.word.startswith("~"):
                 filename = username + filename[len(user_dir) :]
             matches.add(filename)
+        if len(entries) > FILENAME_MATCHES_LIMIT:
+            return TruncatedMatches(matches)
         return matches
 
     def locate(self, cursor_offset: int, line: str) -> LinePart | None:
         return lineparts.current_string(cursor_offset, line)
 
+    def narrowable(self, word: str, new_word: str) -> bool:
+        return _extends(word, new_word)
+
     def format(self, filename: str) -> str:
         if os.sep in filename[:-1]:
             return filename[filename.rindex(os.sep, 0, -1) + 1 :]
@@ -377,6 +658,92 @@ class FilenameCompletion(BaseCompletionType):
             return filename
 
 
+# Py_TPFLAGS_IMMUTABLETYPE, set for types whose attributes cannot be changed
+_IMMUTABLE_TYPE = 1 << 8
+
+_object_class = object.__dict__["__class__"]
+
+
+@dataclass
+class _ClassMembers:
+    # ids of the classes in the MRO and the attribute names of those which
+    # can be changed, when the members were listed
+    classes: tuple[int, ...]
+    names: tuple[frozenset[str] | None, ...]
+    members: frozenset[str]
+
+
+_class_members_cache: "weakref.WeakKeyDictionary[type, _ClassMembers]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _class_names(klass: type) -> frozenset[str] | None:
+    if klass.__flags__ & _IMMUTABLE_TYPE:
+        return None
+    return frozenset(klass.__dict__)
+
+
+def _class_members(klass: type) -> frozenset[str] | None:
+    """Names of the attributes of klass and its bases, as listed by dir(),
+    cached until the attributes of one of the classes are added or removed.
+
+    Returns None for classes whose metaclass customises attribute lookup or
+    dir(), whose members cannot be cached."""
+    metaclass = type(klass)
+    if (
+        metaclass.__dir__ is not type.__dir__
+        or metaclass.__getattribute__ is not type.__getattribute__
+    ):
+        return None
+    mro = klass.__mro__
+    entry = _class_members_cache.get(klass)
+    if (
+        entry is not None
+        and entry.classes == tuple(map(id, mro))
+        and all(
+            names is None or names == c.__dict__.keys()
+            for names, c in zip(entry.names, mro)
+        )
+    ):
+        return entry.members
+    members = frozenset(dir(klass))
+    _class_members_cache[klass] = _ClassMembers(
+        tuple(map(id, mro)), tuple(map(_class_names, mro)), members
+    )
+    return members
+
+
+def _instance_names(obj: Any) -> AbstractSet[str] | None:
+    """Names of the attributes of obj as listed by dir(), using the cached
+    members of its class. Returns None if dir() has to be called."""
+    klass = type(obj)
+    if (
+        klass.__dir__ is not object.__dir__
+        # attribute lookup implemented in Python, see inspection.AttrCleaner
+        or not isinstance(klass.__getattribute__, types.WrapperDescriptorType)
+        or inspection.hasattr_safe(klass, "__getattr__")
+        or inspect.getattr_static(obj, "__class__") is not _object_class
+    ):
+        return None
+    members = _class_members(klass)
+    if members is None:
+        return None
+    for c in klass.__mro__:
+        descriptor = c.__dict__.get("__dict__")
+        if descriptor is not None:
+            # only the __dict__ slot can be read without side effects
+            if not isinstance(descriptor, types.GetSetDescriptorType):
+                return None
+            instance_dict = descriptor.__get__(obj, klass)
+            if instance_dict:
+                return members.union(
+                    name for name in instance_dict if isinstance(name, str)
+                )
+            break
+    return members
+
+
 class AttrCompletion(BaseCompletionType):
     attr_matches_re = LazyReCompile(r"(\w+(\.\w+)*)\.(\w*)")
 
@@ -416,6 +783,16 @@ class AttrCompletion(BaseCompletionType):
     def format(self, word: str) -> str:
         return _after_last_dot(word)
 
+    def narrowable(self, word: str, new_word: str) -> bool:
+        # which private names are shown depends on the leading underscores
+        return _extends(word, new_word) and _underscores(
+            word.rpartition(".")[2]
+        ) == _underscores(new_word.rpartition(".")[2])
+
+    def still_matches(self, match: str, word: str) -> bool:
+        attr = word.rpartition(".")[2]
+        return self.method_match(match.rpartition(".")[2], len(attr), attr)
+
     def attr_matches(
         self, text: str, namespace: dict[str, Any]
     ) -> Iterator[str]:
@@ -438,16 +815,31 @@ class AttrCompletion(BaseCompletionType):
 
     def attr_lookup(self, obj: Any, expr: str, attr: str) -> Iterator[str]:
         """Second half of attr_matches."""
-        words = self.list_attributes(obj)
-        if inspection.hasattr_safe(obj, "__class__"):
-            words.append("__class__")
+        words: AbstractSet[str] | None
+        # isinstance would look up __class__ on obj
+        if issubclass(type(obj), type):
+            words = _class_members(obj)
+            if words is None:
+                words = self.list_attributes(obj)
+            # looking up __class__ on a class finds the descriptor for its
+            # instances, whose members like __name__ are listed as well
+            add_class_members = True
+        else:
+            words = _instance_names(obj)
+            # if dir() has not been customised, it already lists __class__
+            # and the members of the class
+            add_class_members = words is None
+            if words is None:
+                words = self.list_attributes(obj)
+        if add_class_members and inspection.hasattr_safe(obj, "__class__"):
             klass = inspection.getattr_safe(obj, "__class__")
-            words = words + rlcompleter.get_class_members(klass)
-            if not isinstance(klass, abc.ABCMeta):
-                try:
-                    words.remove("__abstractmethods__")
-                except ValueError:
-                    pass
+            words = words | {"__class__"}
+            words |= set(rlcompleter.get_class_members(klass))
+            if (
+                not isinstance(klass, abc.ABCMeta)
+                and "__abstractmethods__" in words
+            ):
+                words = words - {"__abstractmethods__"}
 
         n = len(attr)
         return (
@@ -456,21 +848,73 @@ class AttrCompletion(BaseCompletionType):
             if self.method_match(word, n, attr) and word != "__builtins__"
         )
 
-    def list_attributes(self, obj: Any) -> list[str]:
+    def list_attributes(self, obj: Any) -> set[str]:
         # TODO: re-implement dir without AttrCleaner here
         #
         # Note: accessing `obj.__dir__` via `getattr_static` is not side-effect free.
         with inspection.AttrCleaner(obj):
-            return dir(obj)
+            return set(dir(obj))
+
+
+# Maximum number of keys of a dict whose reprs are searched for key completion
+DICT_KEY_SCAN_BUDGET = 100000
+
+
+@dataclass
+class _DictKeyIndex:
+    # the dict, its length and the generation of the namespace when the
+    # keys were indexed
+    obj: dict
+    size: int
+    generation: int
+    # sorted reprs of the keys
+    reprs: list[str]
 
 
 class DictKeyCompletion(BaseCompletionType):
+    def __init__(
+        self,
+        shown_before_tab: bool = True,
+        mode: AutocompleteModes = AutocompleteModes.SIMPLE,
+    ) -> None:
+        super().__init__(shown_before_tab, mode)
+        self._index: _DictKeyIndex | None = None
+
+    def _key_reprs(
+        self, obj: dict, generation: int | None
+    ) -> tuple[list[str], bool]:
+        """The sorted reprs of the keys of obj which are searched and whether
+        these are not all of them.
+
+        They are kept as long as obj is not replaced and no code is run, so
+        they are only reused if generation is known."""
+        index = self._index
+        if (
+            index is None
+            or generation is None
+            or index.obj is not obj
+            or index.size != len(obj)
+            or index.generation != generation
+        ):
+            reprs = sorted(
+                repr(k)
+                for k in itertools.islice(obj.keys(), DICT_KEY_SCAN_BUDGET)
+            )
+            self._index = (
+                _DictKeyIndex(obj, len(obj), generation, reprs)
+                if generation is not None
+                else None
+            )
+            return reprs, len(reprs) < len(obj)
+        return index.reprs, len(index.reprs) < index.size
+
     def matches(
         self,
         cursor_offset: int,
         line: str,
         *,
         locals_: dict[str, Any] | None = None,
+        generation: int | None = None,
         **kwargs: Any,
     ) -> set[str] | None:
         if locals_ is None:
@@ -489,16 +933,24 @@ class DictKeyCompletion(BaseCompletionType):
         except EvaluationError:
             return None
         if isinstance(obj, dict) and obj.keys():
-            matches = {
-                f"{k!r}]" for k in obj.keys() if repr(k).startswith(r.word)
-            }
-            return matches if matches else None
+            reprs, truncated = self._key_reprs(obj, generation)
+            matches = {f"{k}]" for k in with_prefix(reprs, r.word)}
+            if not matches:
+                return None
+            return TruncatedMatches(matches) if truncated else matches
         else:
             return None
 
     def locate(self, cursor_offset: int, line: str) -> LinePart | None:
         return lineparts.current_dict_key(cursor_offset, line)
 
+    def context(self, cursor_offset: int, line: str) -> str:
+        r = lineparts.current_dict(cursor_offset, line)
+        return r.word if r is not None else ""
+
+    def narrowable(self, word: str, new_word: str) -> bool:
+        return _extends(word, new_word)
+
     def format(self, match: str) -> str:
         return match[:-1]
 
@@ -530,14 +982,95 @@ class MagicMethodCompletion(BaseCompletionType):
     def locate(self, cursor_offset: int, line: str) -> LinePart | None:
         return lineparts.current_method_definition_name(cursor_offset, line)
 
+    def narrowable(self, word: str, new_word: str) -> bool:
+        return _extends(word, new_word)
+
+
+class _NamespaceIndex:
+    """The names of a namespace in sorted order, kept up to date by adding
+    and removing the names which changed since the last update."""
+
+    # rebuild the index instead of updating it if more names changed
+    MAX_CHANGES = 64
+
+    def __init__(self) -> None:
+        self.names: list[str] = []
+        self._keys: set[Any] = set()
+        self._namespace: dict[str, Any] | None = None
+        self._generation: int | None = None
+        # completion of each name with the type of the value it was computed
+        # for, as whether a value is callable only depends on its type
+        self._completions: dict[str, tuple[type, str]] = {}
+
+    def update(
+        self, namespace: dict[str, Any], generation: int | None = None
+    ) -> None:
+        """Update the index to the names of namespace. If generation is
+        given, the namespace is assumed not to have changed as long as it
+        stays the same."""
+        if (
+            generation is not None
+            and generation == self._generation
+            and namespace is self._namespace
+        ):
+            return
+        keys = namespace.keys()
+        added = keys - self._keys
+        removed = self._keys - keys
+        if len(added) + len(removed) > self.MAX_CHANGES:
+            self._keys = set(keys)
+            self.names = sorted(k for k in self._keys if isinstance(k, str))
+            self._completions = {
+                name: completion
+                for name, completion in self._completions.items()
+                if name in self._keys
+            }
+        else:
+            for name in removed:
+                self._keys.discard(name)
+                self._completions.pop(name, None)
+                if isinstance(name, str):
+                    del self.names[bisect.bisect_left(self.names, name)]
+            for name in added:
+                self._keys.add(name)
+                if isinstance(name, str):
+                    bisect.insort(self.names, name)
+        self._namespace = namespace
+        self._generation = generation
+
+    def completion(self, name: str, value: Any) -> str:
+        """The name with the postfix for the value, see _callable_postfix."""
+        cached = self._completions.get(name)
+        if cached is not None and cached[0] is type(value):
+            return cached[1]
+        completion = _callable_postfix(value, name)
+        self._completions[name] = (type(value), completion)
+        return completion
+
 
 class GlobalCompletion(BaseCompletionType):
+    def __init__(
+        self,
+        shown_before_tab: bool = True,
+        mode: AutocompleteModes = AutocompleteModes.SIMPLE,
+    ) -> None:
+        super().__init__(shown_before_tab, mode)
+        self._builtins_index = _NamespaceIndex()
+        self._locals_index = _NamespaceIndex()
+
+    def _candidates(self, names: Sequence[str], word: str) -> Iterable[str]:
+        if self.mode == AutocompleteModes.SIMPLE:
+            return with_prefix(names, word)
+        n = len(word)
+        return (name for name in names if self.method_match(name, n, word))
+
     def matches(
         self,
         cursor_offset: int,
         line: str,
         *,
         locals_: dict[str, Any] | None = None,
+        generation: int | None = None,
         **kwargs: Any,
     ) -> set[str] | None:
         """Compute matches when text is a simple name.
@@ -551,25 +1084,35 @@ class GlobalCompletion(BaseCompletionType):
         if r is None:
             return None
 
-        n = len(r.word)
-        matches = {
-            word for word in KEYWORDS if self.method_match(word, n, r.word)
-        }
-        for nspace in (builtins.__dict__, locals_):
-            for word, val in nspace.items():
-                # if identifier isn't ascii, don't complete (syntax error)
-                if word is None:
+        matches = set(self._candidates(_SORTED_KEYWORDS, r.word))
+        for index, nspace in (
+            (self._builtins_index, builtins.__dict__),
+            (self._locals_index, locals_),
+        ):
+            index.update(nspace, generation)
+            for word in self._candidates(index.names, r.word):
+                if word == "__builtins__":
                     continue
-                if (
-                    self.method_match(word, n, r.word)
-                    and word != "__builtins__"
-                ):
-                    matches.add(_callable_postfix(val, word))
+                try:
+                    value = nspace[word]
+                except KeyError:
+                    # removed by code running since the update
+                    continue
+                matches.add(index.completion(word, value))
         return matches if matches else None
 
     def locate(self, cursor_offset: int, line: str) -> LinePart | None:
         return lineparts.current_single_word(cursor_offset, line)
 
+    def narrowable(self, word: str, new_word: str) -> bool:
+        return _extends(word, new_word)
+
+    def still_matches(self, match: str, word: str) -> bool:
+        # parameter names, which end in =, are not global names
+        return not match.endswith("=") and self.method_match(
+            match.rstrip("("), len(word), word
+        )
+
 
 class ParameterNameCompletion(BaseCompletionType):
     def matches(
@@ -607,6 +1150,12 @@ class ParameterNameCompletion(BaseCompletionType):
             return lineparts.LinePart(r.stop, r.stop, "")
         return r
 
+    def narrowable(self, word: str, new_word: str) -> bool:
+        return _extends(word, new_word)
+
+    def still_matches(self, match: str, word: str) -> bool:
+        return match.endswith("=") and match.startswith(word)
+
 
 class ExpressionAttributeCompletion(AttrCompletion):
     # could replace attr completion as a more general case with some work
@@ -637,6 +1186,159 @@ class ExpressionAttributeCompletion(AttrCompletion):
         return {m for m in matches if _few_enough_underscores(attr.word, m)}
 
 
+# Maximum size of the source given to Jedi besides the current block
+JEDI_CONTEXT_SIZE = 20000
+# Number of the latest statements binding a name that are given to Jedi
+JEDI_DEFINITIONS_PER_NAME = 3
+
+_identifier_re = LazyReCompile(r"[^\W\d]\w*")
+# lines which continue the statement before them
+_continuation_re = LazyReCompile(r"(else|elif|except|finally)\b|[ \t)\]}]")
+
+
+def _bound_and_used_names(tree: ast.AST) -> tuple[set[str], set[str], bool]:
+    """Names bound at the top level of tree, names it uses, and whether it
+    contains a star import."""
+    bound: set[str] = set()
+    used: set[str] = set()
+    star = False
+    todo: list[tuple[ast.AST, bool]] = [(tree, True)]
+    while todo:
+        node, top_level = todo.pop()
+        if isinstance(node, ast.Name):
+            if not isinstance(node.ctx, ast.Store):
+                used.add(node.id)
+            elif top_level:
+                bound.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name == "*":
+                    star = True
+                elif top_level:
+                    bound.add(alias.asname or alias.name.partition(".")[0])
+        elif top_level and isinstance(
+            node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+        ):
+            bound.add(node.name)
+        # names bound in functions, classes and lambdas are local to them
+        inner = top_level and not isinstance(
+            node,
+            (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda),
+        )
+        todo.extend((child, inner) for child in ast.iter_child_nodes(node))
+    return bound, used, star
+
+
+class _HistoryIndex:
+    """Top-level statements of the session history, indexed by the names
+    they bind, to give Jedi only the statements the current block can
+    refer to.
+
+    The index is extended as the history grows, and only built again from
+    scratch if the history changed otherwise, e.g. because of undo."""
+
+    def __init__(self) -> None:
+        self._reset()
+
+    def _reset(self) -> None:
+        self.statements: list[str] = []
+        # indexes of the statements binding a name, in order
+        self.definitions: dict[str, list[int]] = {}
+        # the names in definitions, sorted
+        self.names: list[str] = []
+        self.uses: list[set[str]] = []
+        self.star_imports: list[int] = []
+        self._pending: list[str] = []
+        self._length = 0
+        self._last: str | None = None
+
+    def update(self, history: Sequence[str]) -> None:
+        n = self._length
+        if n and (len(history) < n or history[n - 1] is not self._last):
+            self._reset()
+            n = 0
+        for line in history[n:]:
+            self._add_line(line)
+        if len(history) > n:
+            self._length = len(history)
+            self._last = history[-1]
+            # the history before the current block ends with a complete
+            # statement
+            self._flush()
+
+    def _add_line(self, line: str) -> None:
+        if (
+            self._pending
+            and line.strip()
+            and not _continuation_re.match(line)
+            and not self._pending[-1].startswith("@")
+        ):
+            self._flush()
+        self._pending.append(line)
+
+    def _flush(self) -> None:
+        """Index the pending lines if they form complete statements."""
+        source = "\n".join(self._pending)
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError):
+            try:
+                incomplete = (
+                    codeop.compile_command(source, symbol="exec") is None
+                )
+            except (SyntaxError, ValueError, OverflowError):
+                incomplete = False
+            if not incomplete:
+                # give up on statements which cannot be parsed
+                self._pending = []
+            return
+        self._pending = []
+        if not tree.body:
+            return
+        bound, used, star = _bound_and_used_names(tree)
+        i = len(self.statements)
+        self.statements.append(source)
+        self.uses.append(used)
+        for name in bound:
+            if name not in self.definitions:
+                self.definitions[name] = []
+                bisect.insort(self.names, name)
+            self.definitions[name].append(i)
+        if star:
+            self.star_imports.append(i)
+
+    def context(self, block: str, prefix: str = "") -> str:
+        """The statements of the history the block might refer to, directly
+        or through other statements, latest definitions first, as long as
+        they fit into JEDI_CONTEXT_SIZE.
+
+        Names starting with prefix, the name being completed, are looked up
+        first."""
+        selected = set(self.star_imports)
+        size = sum(len(self.statements[i]) for i in selected)
+        todo: collections.deque[str] = collections.deque()
+        if prefix:
+            todo.extend(with_prefix(self.names, prefix))
+        todo.extend(_identifier_re.findall(block))
+        seen: set[str] = set()
+        while todo and size < JEDI_CONTEXT_SIZE:
+            name = todo.popleft()
+            if name in seen:
+                continue
+            seen.add(name)
+            for i in reversed(
+                self.definitions.get(name, ())[-JEDI_DEFINITIONS_PER_NAME:]
+            ):
+                if i in selected:
+                    continue
+                if size + len(self.statements[i]) > JEDI_CONTEXT_SIZE:
+                    break
+                selected.add(i)
+                size += len(self.statements[i])
+                todo.extend(self.uses[i])
+        return "\n".join(self.statements[i] for i in sorted(selected))
+
+
 try:
     import jedi
 except ImportError:
@@ -653,7 +1355,45 @@ except ImportError:
 else:
 
     class MultilineJediCompletion(BaseCompletionType):  # type: ignore [no-redef]
-        _orig_start: int | None
+        background = True
+
+        def __init__(
+            self,
+            shown_before_tab: bool = True,
+            mode: AutocompleteModes = AutocompleteModes.SIMPLE,
+        ) -> None:
+            super().__init__(shown_before_tab, mode)
+            # Jedi is not thread-safe, and matches may be called on the
+            # completion worker and for tab completion at the same time
+            self._lock = threading.Lock()
+            # start of the completed word by cursor offset and line, since
+            # locate may be called for earlier matches while the matches for
+            # a newer line are found in the background
+            self._orig_starts: dict[tuple[int, str], int] = {}
+            # the statements of the history before the current block
+            self._history_index = _HistoryIndex()
+
+        def warm_up(self) -> None:
+            # the first completion loads the stubs of the builtins, which
+            # takes a while
+            with self._lock:
+                jedi.Script("str.", path="fake.py").complete(1, 4)
+
+        def applies(
+            self,
+            cursor_offset: int,
+            line: str,
+            *,
+            current_block: str | None = None,
+            history: list[str] | None = None,
+            **kwargs: Any,
+        ) -> bool:
+            return (
+                current_block is not None
+                and history is not None
+                and "\n" in current_block
+                and bool(lineparts.current_word(cursor_offset, line))
+            )
 
         def matches(
             self,
@@ -664,11 +1404,12 @@ else:
             history: list[str] | None = None,
             **kwargs: Any,
         ) -> set[str] | None:
+            word = lineparts.current_word(cursor_offset, line)
             if (
                 current_block is None
                 or history is None
                 or "\n" not in current_block
-                or not lineparts.current_word(cursor_offset, line)
+                or not word
             ):
                 return None
 
@@ -677,25 +1418,40 @@ else:
                 line,
             )
 
-            combined_history = "\n".join(itertools.chain(history, (line,)))
-            try:
-                script = jedi.Script(combined_history, path="fake.py")
-                completions = script.complete(
-                    combined_history.count("\n") + 1, cursor_offset
+            # the lines of the block before the current one are part of the
+            # history already
+            block_start = len(history) - current_block.count("\n")
+            if (
+                block_start >= 0
+                and list(history[block_start:])
+                == current_block.split("\n")[:-1]
+            ):
+                history = history[:block_start]
+
+            with self._lock:
+                self._history_index.update(history)
+                # only the names of the history are needed to complete a
+                # name, not those of attributes
+                context = self._history_index.context(
+                    current_block, "" if "." in word.word else word.word
                 )
-            except (jedi.NotFoundError, IndexError, KeyError):
-                # IndexError for #483
-                # KeyError for #544
-                self._orig_start = None
-                return None
-
-            if completions:
-                diff = len(completions[0].name) - len(completions[0].complete)
-                self._orig_start = cursor_offset - diff
-            else:
-                self._orig_start = None
+                source = (
+                    f"{context}\n{current_block}" if context else current_block
+                )
+                try:
+                    script = jedi.Script(source, path="fake.py")
+                    completions = script.complete(
+                        source.count("\n") + 1, cursor_offset
+                    )
+                except (jedi.NotFoundError, IndexError, KeyError):
+                    # IndexError for #483
+                    # KeyError for #544
+                    return None
+
+            if not completions:
                 return None
-            assert isinstance(self._orig_start, int)
+            diff = len(completions[0].name) - len(completions[0].complete)
+            orig_start = cursor_offset - diff
 
             matches = [c.name for c in completions]
             if any(
@@ -705,17 +1461,176 @@ else:
                 # letters
                 return None
             else:
+                if len(self._orig_starts) >= 16:
+                    del self._orig_starts[next(iter(self._orig_starts))]
+                self._orig_starts[cursor_offset, line] = orig_start
                 # case-sensitive matches only
-                first_letter = line[self._orig_start]
+                first_letter = line[orig_start]
                 return {m for m in matches if m.startswith(first_letter)}
 
-        def locate(self, cursor_offset: int, line: str) -> LinePart:
-            assert self._orig_start is not None
-            start = self._orig_start
+        def context(self, cursor_offset: int, line: str) -> str:
+            # Jedi completes attributes without the expression before them
+            word = lineparts.current_word(cursor_offset, line)
+            return word.word.rpartition(".")[0] if word is not None else ""
+
+        def locate(self, cursor_offset: int, line: str) -> LinePart | None:
+            start = self._orig_starts.get((cursor_offset, line))
+            if start is None:
+                return lineparts.current_word(cursor_offset, line)
             end = cursor_offset
             return LinePart(start, end, line[start:end])
 
 
+def stats_kind(
+    completer: BaseCompletionType, cursor_offset: int, line: str
+) -> str:
+    """The kind of completion the matches of completer are ranked as in
+    CompletionStats, i.e. the completer and the context of the matches."""
+    kind = type(completer).__name__
+    context = completer.context(cursor_offset, line)
+    return f"{kind}:{context}" if context else kind
+
+
+def sort_matches(
+    matches: Iterable[str],
+    completer: BaseCompletionType,
+    cursor_offset: int,
+    line: str,
+    stats: CompletionStats | None = None,
+) -> list[str]:
+    """Sort the matches of completer in the order they should be shown.
+    TruncatedMatches are returned as a TruncatedMatchList.
+
+    If stats are given, the matches chosen most often and most recently are
+    shown first."""
+    kind = stats_kind(completer, cursor_offset, line) if stats else ""
+
+    def _rank(x: str) -> float:
+        return -stats.rank(kind, x) if stats is not None else 0
+
+    def _cmpl_sort(x: str) -> tuple[bool, float, str]:
+        """
+        Function used to sort the matches.
+        """
+        # put parameters above everything in completion
+        return (
+            x[-1] != "=",
+            _rank(x),
+            x,
+        )
+
+    def _fuzzy_sort(
+        text: str,
+    ) -> Callable[[str], tuple[bool, int, float, int, str]]:
+        """
+        Function used to sort fuzzy matches, best matches first.
+        """
+
+        def key(x: str) -> tuple[bool, int, float, int, str]:
+            name = x.rpartition(".")[2]
+            score = _fuzzy_score(name, text)
+            return (
+                x[-1] != "=",
+                -score if score is not None else 0,
+                _rank(x),
+                len(name),
+                x,
+            )
+
+        return key
+
+    key: Callable[[str], tuple[Any, ...]] = _cmpl_sort
+    if completer.mode == AutocompleteModes.FUZZY:
+        lpart = completer.locate(cursor_offset, line)
+        if lpart is not None:
+            key = _fuzzy_sort(lpart.word.rpartition(".")[2])
+    if isinstance(matches, TruncatedMatches):
+        return TruncatedMatchList(sorted(matches, key=key))
+    return sorted(matches, key=key)
+
+
+@dataclass(eq=False)
+class CompletionRequest:
+    """Completers to run in the background for a line and cursor position.
+
+    state describes everything else the matches depend on, to tell whether
+    they still apply once they are found."""
+
+    cursor_offset: int
+    line: str
+    state: tuple[Any, ...]
+    # the matches and the completer, or None if the completer does not apply
+    run: Callable[[], tuple[list[str], BaseCompletionType | None] | None]
+    future: "Future[tuple[list[str], BaseCompletionType | None] | None]" = (
+        field(default_factory=Future)
+    )
+    # whether the matches were used as soon as they were found
+    claimed: bool = False
+
+
+class CompletionWorker:
+    """Runs completers in the background on a separate thread.
+
+    Only the latest request is run. A request that has not been started
+    when the next one is submitted is cancelled. Since threads cannot be
+    interrupted, a request that has been started runs to completion, and
+    it is up to the caller to discard its matches if they do not apply
+    anymore. on_ready is called on the worker thread whenever a request
+    is done and can be collected with `done`."""
+
+    def __init__(self, on_ready: Callable[[], None]) -> None:
+        self._on_ready = on_ready
+        self._condition = threading.Condition()
+        self._request: CompletionRequest | None = None
+        self._done: list[CompletionRequest] = []
+        self._thread: threading.Thread | None = None
+
+    def submit(self, request: CompletionRequest) -> None:
+        with self._condition:
+            if self._request is not None:
+                self._request.future.cancel()
+            self._request = request
+            if self._thread is None:
+                # a daemon thread, so that a completer which never returns
+                # does not keep bpython from exiting
+                self._thread = threading.Thread(
+                    target=self._run, name="bpython-completion", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+
+    def warm_up(self, completers: Iterable[BaseCompletionType]) -> None:
+        """Let completers prepare for their first completion."""
+
+        def run() -> None:
+            for completer in completers:
+                completer.warm_up()
+
+        self.submit(CompletionRequest(0, "", (), run))
+
+    def done(self) -> list[CompletionRequest]:
+        """Requests which have been run since the last call."""
+        with self._condition:
+            done, self._done = self._done, []
+        return done
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._request is None:
+                    self._condition.wait()
+                request, self._request = self._request, None
+            if not request.future.set_running_or_notify_cancel():
+                continue
+            try:
+                request.future.set_result(request.run())
+            except Exception as e:
+                request.future.set_exception(e)
+            with self._condition:
+                self._done.append(request)
+            self._on_ready()
+
+
 def get_completer(
     completers: Sequence[BaseCompletionType],
     cursor_offset: int,
@@ -726,6 +1641,15 @@ def get_completer(
     history: list[str] | None = None,
     current_block: str | None = None,
     complete_magic_methods: bool | None = None,
+    generation: int | None = None,
+    stats: CompletionStats | None = None,
+    run_in_background: (
+        Callable[
+            [Sequence[BaseCompletionType]],
+            tuple[list[str], BaseCompletionType | None] | None,
+        ]
+        | None
+    ) = None,
 ) -> tuple[list[str], BaseCompletionType | None]:
     """Returns a list of matches and an applicable completer
 
@@ -741,43 +1665,69 @@ def get_completer(
             code which the current line is part of
         complete_magic_methods is a bool of whether we ought to complete
             double underscore methods like __len__ in method signatures
+        generation is the number of times code was run in locals_, so that
+            completers can tell whether it might have changed
+        stats are the CompletionStats used to rank the matches
+        run_in_background is called with the remaining completers once a
+            completer which might take long and applies is reached. It runs
+            only the first of them instead of get_completer, and returns
+            None if that one does not apply so that the others are tried
     """
 
-    def _cmpl_sort(x: str) -> tuple[bool, str]:
-        """
-        Function used to sort the matches.
-        """
-        # put parameters above everything in completion
-        return (
-            x[-1] != "=",
-            x,
-        )
-
-    for completer in completers:
-        try:
-            matches = completer.matches(
+    for i, completer in enumerate(completers):
+        if completer.background and run_in_background is not None:
+            if not completer.applies(
                 cursor_offset,
                 line,
+                current_block=current_block,
+                history=history,
+            ):
+                continue
+            result = run_in_background(completers[i:])
+        else:
+            result = run_completer(
+                completer,
+                cursor_offset,
+                line,
+                stats=stats,
                 locals_=locals_,
                 funcprops=argspec,
                 history=history,
                 current_block=current_block,
                 complete_magic_methods=complete_magic_methods,
+                generation=generation,
             )
-        except Exception as e:
-            # Instead of crashing the UI, log exceptions from autocompleters.
-            logger.debug(
-                "Completer %r failed with unhandled exception: %s", completer, e
-            )
-            continue
-        if matches is not None:
-            return sorted(matches, key=_cmpl_sort), (
-                completer if matches else None
-            )
+        if result is not None:
+            return result
 
     return [], None
 
 
+def run_completer(
+    completer: BaseCompletionType,
+    cursor_offset: int,
+    line: str,
+    *,
+    stats: CompletionStats | None = None,
+    **kwargs: Any,
+) -> tuple[list[str], BaseCompletionType | None] | None:
+    """The sorted matches of a single completer and the completer if there
+    are any, or None if the completer does not apply."""
+    try:
+        matches = completer.matches(cursor_offset, line, **kwargs)
+    except Exception as e:
+        # Instead of crashing the UI, log exceptions from autocompleters.
+        logger.debug(
+            "Completer %r failed with unhandled exception: %s", completer, e
+        )
+        return None
+    if matches is None:
+        return None
+    return sort_matches(matches, completer, cursor_offset, line, stats), (
+        completer if matches else None
+    )
+
+
 def get_default_completer(
     mode: AutocompleteModes, module_gatherer: ModuleGatherer
 ) -> tuple[BaseCompletionType, ...]:
@@ -0,0 +1,142 @@
+"""Statistics of the completions chosen, to rank matches.
+
+Each time a completion is chosen, its score decays by half for every
+HALF_LIFE seconds since it was last chosen and then increases by one. Matches
+are ranked by their current score, i.e. by how often and how recently they
+were chosen. The statistics are stored in a file next to the history file and
+shared by all sessions."""
+
+import json
+import math
+import os
+import stat
+import time
+from pathlib import Path
+from typing import Any
+
+from .filelock import FileLock
+
+# Version of the file format. Bump whenever the format changes.
+STATS_VERSION = 1
+
+# Seconds after which the score of a completion is halved
+HALF_LIFE = 7 * 24 * 60 * 60
+
+# Maximum number of completions kept, those with the lowest score are dropped
+MAX_ENTRIES = 10000
+
+
+def default_stats_path(hist_file: Path) -> Path:
+    """Path of the statistics kept next to the history file."""
+    return hist_file.with_name(f"{hist_file.name}.completions")
+
+
+class CompletionStats:
+    """How often and how recently completions were chosen, by kind of
+    completion and match."""
+
+    def __init__(
+        self, half_life: float = HALF_LIFE, max_entries: int = MAX_ENTRIES
+    ) -> None:
+        self.half_life = half_life
+        self.max_entries = max_entries
+        # score of each completion and when it was last chosen
+        self._entries: dict[tuple[str, str], tuple[float, float]] = {}
+        # log2 of the score the completions would have at time 0, which
+        # orders them like their current scores without depending on the time
+        self._ranks: dict[tuple[str, str], float] = {}
+        # completions chosen since the statistics were last saved
+        self._pending: list[tuple[str, str, float]] = []
+
+    def rank(self, kind: str, match: str) -> float:
+        """Rank of the match, higher is better. Matches never chosen are
+        ranked last."""
+        return self._ranks.get((kind, match), -math.inf)
+
+    def record(self, kind: str, match: str, when: float | None = None) -> None:
+        """Record that the match was chosen."""
+        if when is None:
+            when = time.time()
+        self._pending.append((kind, match, when))
+        score, last = self._add(self._entries, kind, match, when)
+        self._ranks[kind, match] = self._rank(score, last)
+
+    def _rank(self, score: float, last: float) -> float:
+        return math.log2(score) + last / self.half_life
+
+    def _add(
+        self,
+        entries: dict[tuple[str, str], tuple[float, float]],
+        kind: str,
+        match: str,
+        when: float,
+    ) -> tuple[float, float]:
+        score, last = entries.get((kind, match), (0.0, when))
+        score = score * 2 ** (-max(0.0, when - last) / self.half_life) + 1
+        entries[kind, match] = score, max(last, when)
+        return entries[kind, match]
+
+    def load(self, filename: Path) -> None:
+        with open(filename, encoding="utf-8") as f:
+            with FileLock(f, filename=str(filename)):
+                self._set_entries(self._load_from(f.read()))
+
+    def _load_from(
+        self, data: str
+    ) -> dict[tuple[str, str], tuple[float, float]]:
+        try:
+            content = json.loads(data) if data else {}
+            if content.get("version") != STATS_VERSION:
+                return {}
+            return {
+                (str(kind), str(match)): (float(score), float(last))
+                for kind, match, score, last in content["entries"]
+                if float(score) > 0
+            }
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return {}
+
+    def _set_entries(
+        self, entries: dict[tuple[str, str], tuple[float, float]]
+    ) -> None:
+        ranks = {
+            key: self._rank(score, last)
+            for key, (score, last) in entries.items()
+        }
+        if len(ranks) > self.max_entries:
+            kept = sorted(ranks, key=ranks.__getitem__)[-self.max_entries :]
+            ranks = {key: ranks[key] for key in kept}
+            entries = {key: entries[key] for key in kept}
+        self._entries = entries
+        self._ranks = ranks
+
+    def reload_and_write(self, filename: Path) -> None:
+        """Add the completions chosen since the last call to the statistics
+        stored in filename, which might have been changed by other sessions,
+        and use those."""
+        if not self._pending:
+            return
+        fd = os.open(
+            filename,
+            os.O_RDWR | os.O_CREAT,
+            stat.S_IRUSR | stat.S_IWUSR,
+        )
+        with open(fd, "r+", encoding="utf-8") as f:
+            with FileLock(f, filename=str(filename)):
+                entries = self._load_from(f.read())
+                for kind, match, when in self._pending:
+                    self._add(entries, kind, match, when)
+                self._set_entries(entries)
+
+                entries = self._entries
+                data: dict[str, Any] = {
+                    "version": STATS_VERSION,
+                    "entries": [
+                        [kind, match, score, last]
+                        for (kind, match), (score, last) in entries.items()
+                    ],
+                }
+                f.seek(0, os.SEEK_SET)
+                f.truncate()
+                json.dump(data, f)
+        self._pending = []
@@ -74,6 +74,11 @@ def get_config_home() -> Path:
     return Path(BaseDirectory.xdg_config_home) / "bpython"
 
 
+def get_cache_home() -> Path:
+    """Returns the base directory for bpython's cache files."""
+    return Path(BaseDirectory.xdg_cache_home) / "bpython"
+
+
 def default_config_path() -> Path:
     """Returns bpython's default configuration file path."""
     return get_config_home() / "config"
@@ -120,7 +125,9 @@ class Config:
         "general": {
             "arg_spec": True,
             "auto_display_list": True,
+            "autocomplete_budget": 50,
             "autocomplete_mode": default_completion,
+            "autocomplete_ranking": True,
             "color_scheme": "default",
             "complete_magic_methods": True,
             "dedent_after": 1,
@@ -147,6 +154,9 @@ class Config:
                     "__pycache__",
                 )
             ),
+            "import_completion_budget": 10,
+            "import_completion_cache": True,
+            "import_completion_server": True,
             "highlight_show_source": True,
             "hist_duplicates": True,
             "hist_file": "~/.pythonhist",
@@ -271,6 +281,21 @@ class Config:
         self.import_completion_skiplist = config.get(
             "general", "import_completion_skiplist"
         ).split(":")
+        self.autocomplete_budget = config.getfloat(
+            "general", "autocomplete_budget"
+        )
+        self.autocomplete_ranking = config.getboolean(
+            "general", "autocomplete_ranking"
+        )
+        self.import_completion_budget = config.getfloat(
+            "general", "import_completion_budget"
+        )
+        self.import_completion_cache = config.getboolean(
+            "general", "import_completion_cache"
+        )
+        self.import_completion_server = config.getboolean(
+            "general", "import_completion_server"
+        )
 
         self.pastebin_key = get_key_no_doublebind("pastebin")
         self.copy_clipboard_key = get_key_no_doublebind("copy_clipboard")
@@ -6,6 +6,7 @@ import argparse
 import collections
 import logging
 import sys
+import time
 
 import curtsies
 import curtsies.events
@@ -78,6 +79,16 @@ class FullCurtsiesRepl(BaseRepl):
         self._interrupting_refresh_callback = (
             self.input_generator.threadsafe_event_trigger(lambda: None)
         )
+        self._request_completion_refresh_callback = (
+            self.input_generator.threadsafe_event_trigger(
+                events.CompletionReadyEvent
+            )
+        )
+        self._request_import_paths_refresh_callback = (
+            self.input_generator.threadsafe_event_trigger(
+                events.ImportPathsChangedEvent
+            )
+        )
         self._request_undo_callback = self.input_generator.event_trigger(
             events.UndoEvent
         )
@@ -103,6 +114,12 @@ class FullCurtsiesRepl(BaseRepl):
     def _request_reload(self, files_modified: Sequence[str]) -> None:
         return self._request_reload_callback(files_modified=files_modified)
 
+    def request_completion_refresh(self) -> None:
+        return self._request_completion_refresh_callback()
+
+    def request_import_paths_refresh(self) -> None:
+        return self._request_import_paths_refresh_callback()
+
     def interrupting_refresh(self) -> None:
         return self._interrupting_refresh_callback()
 
@@ -167,13 +184,25 @@ class FullCurtsiesRepl(BaseRepl):
         # do a display before waiting for first event
         self.process_event_and_paint(None)
         inputs = combined_events(self.input_generator)
-        while self.module_gatherer.find_coroutine():
-            e = inputs.send(0)
-            if e is not None:
-                self.process_event_and_paint(e)
-
-        for e in inputs:
-            self.process_event_and_paint(e)
+        # search for modules in between checking for input whenever a search
+        # is running, and only report progress if it takes a while
+        budget = self.config.import_completion_budget / 1000
+        show_progress_after = time.monotonic() + 0.5
+        while True:
+            if self.module_gatherer.find_coroutine(budget):
+                e = inputs.send(0)
+                if e is not None:
+                    self.process_event_and_paint(e)
+                elif (
+                    time.monotonic() > show_progress_after
+                    and self.update_import_completion_progress()
+                ):
+                    self.process_event_and_paint(None)
+            else:
+                if self.update_import_completion_progress():
+                    self.process_event_and_paint(None)
+                self.process_event_and_paint(inputs.send(None))
+                show_progress_after = time.monotonic() + 0.5
 
 
 def main(
@@ -16,6 +16,22 @@ class ReloadEvent(curtsies.events.Event):
         return "<ReloadEvent from {}>".format(" & ".join(self.files_modified))
 
 
+class ImportPathsChangedEvent(curtsies.events.Event):
+    """Request to search for modules again because the directories on the
+    module search path changed"""
+
+    def __repr__(self) -> str:
+        return "<ImportPathsChangedEvent>"
+
+
+class CompletionReadyEvent(curtsies.events.Event):
+    """Request to show the matches found by completers running in the
+    background"""
+
+    def __repr__(self) -> str:
+        return "<CompletionReadyEvent>"
+
+
 class RefreshRequestEvent(curtsies.events.Event):
     """Request to refresh REPL display ASAP"""
 
@@ -12,6 +12,9 @@ except ImportError:
     def ModuleChangedEventHandler(*args):
         return None
 
+    def ImportPathsChangedEventHandler(*args):
+        return None
+
 else:
 
     class ModuleChangedEventHandler(FileSystemEventHandler):  # type: ignore [no-redef]
@@ -85,3 +88,51 @@ else:
                 event.src_path == f"{path}.py" for path in self.dirs[dirpath]
             ):
                 self.on_change((event.src_path,))
+
+    class ImportPathsChangedEventHandler(FileSystemEventHandler):  # type: ignore [no-redef]
+        """Report files and directories being added to or removed from the
+        directories searched for modules, e.g. by installing a package."""
+
+        def __init__(self, on_change: Callable[[], None]) -> None:
+            self.on_change = on_change
+            self.dirs: set[str] = set()
+            self.observer = Observer()
+            self.started = False
+
+            super().__init__()
+
+        def watch(self, paths: Iterable[str]) -> None:
+            """Replace the watched directories with paths."""
+            dirs = {path for path in paths if os.path.isdir(path)}
+            if dirs == self.dirs:
+                return
+            self.observer.unschedule_all()
+            for dirname in dirs:
+                self.observer.schedule(self, dirname, recursive=False)
+            self.dirs = dirs
+            if not self.started:
+                self.started = True
+                self.observer.start()
+
+        def stop(self) -> None:
+            """Stop watching and wait for the observer thread to finish."""
+            if self.started:
+                self.observer.stop()
+                self.observer.join()
+                self.started = False
+
+        def on_any_event(self, event: FileSystemEvent) -> None:
+            if event.event_type not in ("created", "deleted", "moved"):
+                return
+            # ignore files which cannot be imported, like editor swap files
+            # or bytecode, which would restart the search all the time
+            paths = (event.src_path, getattr(event, "dest_path", ""))
+            if any(
+                path
+                and importcompletion.module_name(
+                    os.path.basename(os.fsdecode(path)), event.is_directory
+                )
+                is not None
+                for path in paths
+            ):
+                self.on_change()
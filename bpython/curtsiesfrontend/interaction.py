@@ -38,6 +38,7 @@ class StatusBar(Interaction):
         self.waiting_for_refresh = False
         self.prompt = ""
         self._message = ""
+        self._progress = ""
         self.message_start_time = time.time()
         self.message_time = 3.0
         self.permanent_stack = []
@@ -60,6 +61,16 @@ class StatusBar(Interaction):
         else:
             raise ValueError("Message %r was not in permanent_stack" % msg)
 
+    def progress(self, msg):
+        """Sets a progress message, shown while there is no other message
+
+        An empty msg removes the progress message."""
+        self._progress = msg
+
+    @property
+    def progress_message(self):
+        return self._progress
+
     @property
     def has_focus(self):
         return self.in_prompt or self.in_confirm or self.waiting_for_refresh
@@ -142,6 +153,8 @@ class StatusBar(Interaction):
             return self._message
         if self.permanent_stack:
             return self.permanent_stack[-1]
+        if self._progress:
+            return self._progress
         return ""
 
     @property
@@ -1,16 +1,18 @@
 import re
 from functools import partial
 from typing import Any
-from collections.abc import Callable
+from collections.abc import Callable, Iterable, Mapping
 
-from curtsies.formatstring import fmtstr, FmtStr
+from curtsies.formatstring import Chunk, fmtstr, FmtStr
 from curtsies.termformatconstants import (
     FG_COLORS,
     BG_COLORS,
     colors as CURTSIES_COLORS,
 )
+from pygments.token import _TokenType
 
 from ..config import COLOR_LETTERS
+from ..formatter import Parenthesis, theme_map
 from ..lazyre import LazyReCompile
 
 
@@ -49,54 +51,72 @@ def color_for_letter(letter_color_code: str, default: str = "k") -> str:
 
 def parse(s: str) -> FmtStr:
     """Returns a FmtStr object from a bpython-formatted colored string"""
-    rest = s
-    stuff = []
-    while rest:
-        start, rest = peel_off_string(rest)
-        stuff.append(start)
-    return (
-        sum((fs_from_match(d) for d in stuff[1:]), fs_from_match(stuff[0]))
-        if len(stuff) > 0
-        else FmtStr()
-    )
-
-
-def fs_from_match(d: dict[str, Any]) -> FmtStr:
-    atts = {}
+    chunks: list[Chunk] = []
+    pos = 0
+    match = formatted_string_re.compiled.match
+    while pos < len(s):
+        m = match(s, pos)
+        assert m, repr(s[pos:])
+        atts = atts_from_codes(m["fg"], m["bg"], bool(m["bold"]))
+        add_chunks(chunks, m["string"], atts)
+        pos = m.end()
+    return FmtStr(*chunks)
+
+
+def atts_from_codes(fg: str, bg: str, bold: bool) -> dict[str, Any]:
+    """The FmtStr attributes of bpython-style foreground and background
+    color codes"""
+    atts: dict[str, Any] = {}
     color = "default"
-    if d["fg"]:
+    if fg:
         # this isn't according to spec as I understand it
-        if d["fg"].isupper():
-            d["bold"] = True
+        if fg.isupper():
+            bold = True
         # TODO figure out why boldness isn't based on presence of \x02
 
-        color = CNAMES[d["fg"].lower()]
+        color = CNAMES[fg.lower()]
         if color != "default":
             atts["fg"] = FG_COLORS[color]
-    if d["bg"]:
-        if d["bg"] == "I":
+    if bg:
+        if bg == "I":
             # hack for finding the "inverse"
             color = INVERSE_COLORS[color]
         else:
-            color = CNAMES[d["bg"].lower()]
+            color = CNAMES[bg.lower()]
         if color != "default":
             atts["bg"] = BG_COLORS[color]
-    if d["bold"]:
+    if bold:
         atts["bold"] = True
+    return atts
+
+
+def add_chunks(chunks: list[Chunk], text: str, atts: dict[str, Any]) -> None:
+    """Append the chunks of fmtstr(text, **atts) to chunks"""
+    if "\x1b[" in text:
+        # the text is parsed for escape sequences
+        chunks.extend(fmtstr(text, **atts).chunks)
+    else:
+        chunks.append(Chunk(text, atts))
+
+
+def fs_from_match(d: dict[str, Any]) -> FmtStr:
+    atts = atts_from_codes(d["fg"], d["bg"], bool(d["bold"]))
     return fmtstr(d["string"], **atts)
 
 
-peel_off_string_re = LazyReCompile(
-    r"""(?P<colormarker>\x01
+_formatted_string = r"""(?P<colormarker>\x01
             (?P<fg>[krgybmcwdKRGYBMCWD]?)
             (?P<bg>[krgybmcwdKRGYBMCWDI]?)?)
         (?P<bold>\x02?)
         \x03
         (?P<string>[^\x04]*)
         \x04
-        (?P<rest>.*)
-        """,
-    re.VERBOSE | re.DOTALL,
+        """
+
+formatted_string_re = LazyReCompile(_formatted_string, re.VERBOSE | re.DOTALL)
+
+peel_off_string_re = LazyReCompile(
+    _formatted_string + "(?P<rest>.*)", re.VERBOSE | re.DOTALL
 )
 
 
@@ -107,3 +127,43 @@ def peel_off_string(s: str) -> tuple[dict[str, Any], str]:
     rest = d["rest"]
     del d["rest"]
     return d, rest
+
+
+class FmtStrFormatter:
+    """Formats Pygments tokens as FmtStr with the colors of a color scheme.
+
+    The result is the same as formatting the tokens with
+    bpython.formatter.BPythonFormatter and parsing the result, but the
+    chunks of the FmtStr are built directly from the tokens."""
+
+    def __init__(self, color_scheme: Mapping[str, str]) -> None:
+        self._atts: dict[_TokenType, dict[str, Any]] = {}
+        for token, name in theme_map.items():
+            code = color_scheme[name]
+            if token is Parenthesis:
+                # FIXME: Find a way to make this the inverse of the current
+                # background colour
+                code += "I"
+            m = formatted_string_re.fullmatch(f"\x01{code}\x03\x04")
+            assert m, repr(code)
+            self._atts[token] = atts_from_codes(
+                m["fg"], m["bg"], bool(m["bold"])
+            )
+
+    def _token_atts(self, token: _TokenType) -> dict[str, Any]:
+        try:
+            return self._atts[token]
+        except KeyError:
+            parent = token
+            while parent not in self._atts and parent.parent is not None:
+                parent = parent.parent
+            atts = self._atts[token] = self._atts[parent]
+            return atts
+
+    def format(self, tokens: Iterable[tuple[_TokenType, str]]) -> FmtStr:
+        chunks: list[Chunk] = []
+        for token, text in tokens:
+            if text == "\n":
+                continue
+            add_chunks(chunks, text, self._token_atts(token))
+        return FmtStr(*chunks)
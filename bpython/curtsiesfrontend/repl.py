@@ -42,7 +42,10 @@ from .coderunner import (
     CodeRunner,
     FakeOutput,
 )
-from .filewatch import ModuleChangedEventHandler
+from .filewatch import (
+    ImportPathsChangedEventHandler,
+    ModuleChangedEventHandler,
+)
 from .interaction import StatusBar
 from .interpreter import (
     Interp,
@@ -53,11 +56,10 @@ from .manual_readline import (
     cursor_on_closing_char_pair,
     AbstractEdits,
 )
-from .parse import parse as bpythonparse, func_for_letter, color_for_letter
+from .parse import FmtStrFormatter, func_for_letter, color_for_letter
 from .preprocess import preprocess
-from .. import __version__
+from .. import __version__, autocomplete
 from ..config import getpreferredencoding
-from ..formatter import BPythonFormatter
 from ..pager import get_pager_command
 from ..repl import (
     Repl,
@@ -372,7 +374,7 @@ class BaseRepl(Repl):
         # implements the methods of Interpreter!
         super().__init__(interp, config)
 
-        self.formatter = BPythonFormatter(config.color_scheme)
+        self.formatter = FmtStrFormatter(config.color_scheme)
 
         # overwriting what bpython.Repl put there
         # interact is called to interact with the status bar,
@@ -474,6 +476,14 @@ class BaseRepl(Repl):
         self.watcher = ModuleChangedEventHandler([], self.request_reload)
         if self.watcher and config.default_autoreload:
             self.watcher.activate()
+        self.import_paths_watcher = ImportPathsChangedEventHandler(
+            self.request_import_paths_refresh
+        )
+        if config.autocomplete_budget > 0:
+            self.completion_worker = autocomplete.CompletionWorker(
+                self.request_completion_refresh
+            )
+            self.completion_worker.warm_up(self.completers)
 
     # The methods below should be overridden, but the default implementations
     # below can be used as well.
@@ -501,6 +511,14 @@ class BaseRepl(Repl):
         is only having an out of date UI until the user enters input, a
         default NOP implementation is provided."""
 
+    def request_import_paths_refresh(self) -> None:
+        """Arrange for an ImportPathsChangedEvent to be passed into
+        process_event soon.
+
+        This method is called from the thread watching the module search
+        path. Since refresh_import_completion is also called after running
+        code, a default NOP implementation is provided."""
+
     # The methods below must be overridden in subclasses.
 
     def _request_refresh(self):
@@ -518,6 +536,14 @@ class BaseRepl(Repl):
         """Like request_refresh, but for reload requests events."""
         raise NotImplementedError
 
+    def request_completion_refresh(self) -> None:
+        """Arrange for a CompletionReadyEvent to be passed into process_event
+        soon.
+
+        This method is called from the thread running completers in the
+        background."""
+        raise NotImplementedError
+
     def request_undo(self, n=1):
         """Like request_refresh, but for undo request events."""
         raise NotImplementedError
@@ -573,6 +599,9 @@ class BaseRepl(Repl):
             signal.signal(signal.SIGWINCH, self.sigwinch_handler)
             signal.signal(signal.SIGTSTP, self.sigtstp_handler)
 
+        if self.import_paths_watcher:
+            self.import_paths_watcher.watch(self.module_gatherer.search_paths)
+
         self.orig_meta_path = sys.meta_path
         if self.watcher:
             meta_path = []
@@ -599,6 +628,9 @@ class BaseRepl(Repl):
             signal.signal(signal.SIGTSTP, self.orig_sigtstp_handler)
 
         sys.meta_path = self.orig_meta_path
+        if self.import_paths_watcher:
+            self.import_paths_watcher.stop()
+        self.module_gatherer.save_index()
         return False
 
     def sigwinch_handler(self, signum: int, frame: FrameType | None) -> None:
@@ -625,6 +657,27 @@ class BaseRepl(Repl):
         self.after_suspend()
         self.__enter__()
 
+    def update_import_completion_progress(self) -> bool:
+        """Show how far the search for modules has come in the status bar.
+
+        Returns whether the status bar changed."""
+        if self.module_gatherer.fully_loaded:
+            msg = ""
+        else:
+            msg = (
+                _("Searching modules for import completion (%d/%d paths)...")
+                % self.module_gatherer.progress
+            )
+        if msg == self.status_bar.progress_message:
+            return False
+        self.status_bar.progress(msg)
+        return True
+
+    def refresh_import_completion(self) -> None:
+        """Search for modules again if the module search path changed."""
+        if self.module_gatherer.refresh() and self.import_paths_watcher:
+            self.import_paths_watcher.watch(self.module_gatherer.search_paths)
+
     def clean_up_current_line_for_exit(self):
         """Called when trying to exit to prep for final paint"""
         logger.debug("unhighlighting paren for exit")
@@ -658,6 +711,11 @@ class BaseRepl(Repl):
                 assert self.coderunner.code_is_waiting
                 self.run_code_and_maybe_finish()
 
+        elif isinstance(e, bpythonevents.CompletionReadyEvent):
+            visible = self.show_background_matches()
+            if visible is not None:
+                self.list_win_visible = visible
+
         elif self.status_bar.has_focus:
             self.status_bar.process_event(e)
 
@@ -698,6 +756,9 @@ class BaseRepl(Repl):
         elif isinstance(e, bpythonevents.UndoEvent):
             self.undo(n=e.n)
 
+        elif isinstance(e, bpythonevents.ImportPathsChangedEvent):
+            self.refresh_import_completion()
+
         elif self.stdin.has_focus:
             self.stdin.process_event(e)
 
@@ -1257,9 +1318,7 @@ class BaseRepl(Repl):
             self.saved_indent = self.predicted_indent(line)
 
         if self.config.syntax:
-            display_line = bpythonparse(
-                pygformat(self.tokenize(line), self.formatter)
-            )
+            display_line = self.formatter.format(self.tokenize(line))
             # self.tokenize requires that the line not be in self.buffer yet
 
             logger.debug(
@@ -1297,6 +1356,8 @@ class BaseRepl(Repl):
         r = self.coderunner.run_code(for_code=for_code)
         if r:
             logger.debug("----- Running finish command stuff -----")
+            # the code might have changed sys.path or installed packages
+            self.refresh_import_completion()
             logger.debug("saved_indent: %r", self.saved_indent)
             err = self.saved_predicted_parse_error
             self.saved_predicted_parse_error = False
@@ -1341,7 +1402,7 @@ class BaseRepl(Repl):
             self.highlighted_paren = None
             logger.debug("trying to unhighlight a paren on line %r", lineno)
             logger.debug("with these tokens: %r", saved_tokens)
-            new = bpythonparse(pygformat(saved_tokens, self.formatter))
+            new = self.formatter.format(saved_tokens)
             self.display_buffer[lineno] = self.display_buffer[
                 lineno
             ].setslice_with_length(
@@ -1418,9 +1479,7 @@ class BaseRepl(Repl):
     def current_line_formatted(self):
         """The colored current line (no prompt, not wrapped)"""
         if self.config.syntax:
-            fs = bpythonparse(
-                pygformat(self.tokenize(self.current_line), self.formatter)
-            )
+            fs = self.formatter.format(self.tokenize(self.current_line))
             if self.incr_search_mode != SearchMode.NO_SEARCH:
                 if self.incr_search_target in self.current_line:
                     fs = fmtfuncs.on_magenta(self.incr_search_target).join(
@@ -1792,6 +1851,9 @@ class BaseRepl(Repl):
                     if self.matches_iter.completer
                     else None
                 ),
+                truncated=isinstance(
+                    self.matches_iter.matches, autocomplete.TruncatedMatchList
+                ),
             )
 
             if (
@@ -1933,9 +1995,7 @@ class BaseRepl(Repl):
     def reprint_line(self, lineno, tokens):
         logger.debug("calling reprint line with %r %r", lineno, tokens)
         if self.config.syntax:
-            self.display_buffer[lineno] = bpythonparse(
-                pygformat(tokens, self.formatter)
-            )
+            self.display_buffer[lineno] = self.formatter.format(tokens)
 
     def take_back_buffer_line(self):
         assert len(self.buffer) > 0
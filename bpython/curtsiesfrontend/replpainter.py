@@ -6,6 +6,7 @@ from curtsies.formatstring import linesplit
 from curtsies.fmtfuncs import bold
 
 from .parse import func_for_letter
+from ..translations import _
 
 logger = logging.getLogger(__name__)
 
@@ -194,8 +195,11 @@ def paint_infobox(
     docstring,
     config,
     match_format,
+    truncated=False,
 ):
-    """Returns painted completions, funcprops, match, docstring etc."""
+    """Returns painted completions, funcprops, match, docstring etc.
+
+    If truncated, the matches are marked as not being all there are."""
     if not (rows and columns):
         return FSArray(0, 0)
     width = columns - 4
@@ -209,7 +213,7 @@ def paint_infobox(
     )
     from_matches = (
         matches_lines(
-            max(1, rows - len(from_argspec) - 2),
+            max(1, rows - len(from_argspec) - 2 - truncated),
             width,
             matches,
             match,
@@ -219,6 +223,9 @@ def paint_infobox(
         if matches
         else []
     )
+    if from_matches and truncated:
+        comment_color = func_for_letter(config.color_scheme["comment"])
+        from_matches.append(comment_color(_("(search truncated)")))
 
     lines = from_argspec + from_matches + from_doc
 
@@ -0,0 +1,655 @@
+"""Incremental lexing of the lines of a block for syntax highlighting.
+
+Lines are lexed on their own with Pygments, starting in the state of the
+lexer at the end of the previous line, so that the lines before the current
+one do not need to be lexed again on every keystroke.
+
+Most lines start in the root state of the lexer and only contain names,
+numbers, operators and simple strings. Those are scanned by scan_line, which
+finds the same tokens as Pygments' Python lexer, but much faster."""
+
+import bisect
+import functools
+import re
+from collections.abc import Callable, Sequence
+from typing import NamedTuple
+
+from pygments.lexer import RegexLexer
+from pygments.lexers import Python3Lexer
+from pygments.token import (
+    Comment,
+    Error,
+    Keyword,
+    Name,
+    Number,
+    Operator,
+    Punctuation,
+    String,
+    Text,
+    Whitespace,
+    _TokenType,
+)
+
+from .lazyre import LazyReCompile
+
+# State of the lexer at the start of a block
+ROOT_STATE: tuple[str, ...] = ("root",)
+
+
+def _token_defs(lexer: RegexLexer) -> dict[str, list] | None:
+    """The compiled rules of each state of lexer, which RegexLexer keeps in
+    its private `_tokens` attribute, or None if they cannot be found there,
+    e.g. with a future version of Pygments."""
+    tokendefs = getattr(lexer, "_tokens", None)
+    if not isinstance(tokendefs, dict) or "root" not in tokendefs:
+        return None
+    return tokendefs
+
+
+def lex_line(
+    lexer: RegexLexer, line: str, state: tuple[str, ...] = ROOT_STATE
+) -> tuple[list[tuple[_TokenType, str]], tuple[str, ...]]:
+    """Tokens of line including its newline, lexed starting in state, and the
+    state of the lexer at the end of the line.
+
+    Follows RegexLexer.get_tokens_unprocessed, which does not expose the
+    state it ends in. Raises ValueError if the rules of the lexer cannot be
+    found, see `_token_defs`."""
+    text = line + "\n"
+    tokens: list[tuple[_TokenType, str]] = []
+    pos = 0
+    tokendefs = _token_defs(lexer)
+    if tokendefs is None:
+        raise ValueError(f"the rules of {lexer!r} cannot be found")
+    statestack = list(state)
+    statetokens = tokendefs[statestack[-1]]
+    while True:
+        for rexmatch, action, new_state in statetokens:
+            m = rexmatch(text, pos)
+            if m:
+                if action is not None:
+                    if type(action) is _TokenType:
+                        tokens.append((action, m.group()))
+                    else:
+                        tokens.extend(
+                            (token, value)
+                            for _, token, value in action(lexer, m)
+                        )
+                pos = m.end()
+                if new_state is not None:
+                    if isinstance(new_state, tuple):
+                        for s in new_state:
+                            if s == "#pop":
+                                if len(statestack) > 1:
+                                    statestack.pop()
+                            elif s == "#push":
+                                statestack.append(statestack[-1])
+                            else:
+                                statestack.append(s)
+                    elif isinstance(new_state, int):
+                        # pop, but keep at least one state on the stack
+                        if abs(new_state) >= len(statestack):
+                            del statestack[1:]
+                        else:
+                            del statestack[new_state:]
+                    elif new_state == "#push":
+                        statestack.append(statestack[-1])
+                    statetokens = tokendefs[statestack[-1]]
+                break
+        else:
+            if pos >= len(text):
+                break
+            if text[pos] == "\n":
+                # at the end of the line, reset the state to root
+                statestack = ["root"]
+                statetokens = tokendefs["root"]
+                tokens.append((Whitespace, "\n"))
+            else:
+                tokens.append((Error, text[pos]))
+            pos += 1
+    return tokens, tuple(statestack)
+
+
+# The rules below follow those of the root state of Pygments' Python lexer, in
+# the same order where they overlap. Strings with an f prefix, triple quoted
+# strings and a few other constructs are left to Pygments.
+_token_re = LazyReCompile(
+    r"""
+    (?P<fstring>(?:[rR][fF]|[fF][rR]?)["'])
+    |(?P<string>(?:[rR][bB]|[bB][rR]|[rRuUbB])?(?P<quote>["']))
+    |(?P<name>[A-Za-z_]\w*)
+    |(?P<text>[^\S\n]+|\\)
+    |(?P<comment>\#.*)
+    |(?P<float>(?:\d(?:_?\d)*\.(?:\d(?:_?\d)*)?|(?:\d(?:_?\d)*)?\.\d(?:_?\d)*)
+        (?:[eE][+-]?\d(?:_?\d)*)?
+        |\d(?:_?\d)*[eE][+-]?\d(?:_?\d)*j?)
+    |(?P<oct>0[oO](?:_?[0-7])+)
+    |(?P<bin>0[bB](?:_?[01])+)
+    |(?P<hex>0[xX](?:_?[a-fA-F0-9])+)
+    |(?P<integer>\d(?:_?\d)*)
+    |(?P<operator>!=|==|<<|>>|:=|[-~+/*%=<>&^|.])
+    |(?P<punctuation>[]{}:(),;[])
+    |(?P<decorator>@[A-Za-z_]\w*)
+    |(?P<at>@)
+    """,
+    re.VERBOSE | re.ASCII,
+)
+
+_simple_tokens = {
+    "text": Text,
+    "comment": Comment.Single,
+    "float": Number.Float,
+    "oct": Number.Oct,
+    "bin": Number.Bin,
+    "hex": Number.Hex,
+    "integer": Number.Integer,
+    "operator": Operator,
+    "punctuation": Punctuation,
+    "decorator": Name.Decorator,
+    "at": Operator,
+}
+
+# whitespace after def, class, from and import
+_keyword_space_re = LazyReCompile(r"(?:\s|\\\s)+")
+_yield_from_re = LazyReCompile(r" from\b")
+_name_re = LazyReCompile(r"[A-Za-z_]\w*", re.ASCII)
+_from_import_re = LazyReCompile(r"(\s+)(import)\b")
+_import_as_re = LazyReCompile(r"(\s+)(as)(\s+)")
+_import_comma_re = LazyReCompile(r"(\s*)(,)(\s*)")
+
+_escape = r"\\([\\abfnrtv\"\']|\n|x[a-fA-F0-9]{2}|[0-7]{1,3})"
+_unicode_escape = r"\\(N\{.*?\}|u[a-fA-F0-9]{4}|U[a-fA-F0-9]{8})"
+
+
+def _string_re(quote: str, escapes: Sequence[str]) -> LazyReCompile:
+    """The rules inside a string, following the string states of Pygments'
+    Python lexer."""
+    return LazyReCompile(
+        "|".join(
+            [f"(?P<escape{i}>{escape})" for i, escape in enumerate(escapes)]
+            + [
+                f"(?P<close>{quote})",
+                rf"(?P<escape>\\\\|\\{quote})",
+                r"(?P<interpol>%(\(\w+\))?[-#0 +]*([0-9]+|[*])?"
+                r"(\.([0-9]+|[*]))?[hlL]?[E-GXc-giorsaux%]"
+                r"|\{((\w+)((\.\w+)|(\[[^\]]+\]))*)?(\![sra])?"
+                r"(\:(.?[<>=\^])?[-+ ]?#?0?(\d+)?,?(\.\d+)?"
+                r"[E-GXb-gnosx%]?)?\})",
+                r"(?P<string>[^\\\'\"%{\n]+|[\'\"\\]|%|\{{1,2})",
+            ]
+        )
+    )
+
+
+# rules inside strings by quote and whether the string is a str, bytes or raw
+_string_res = {
+    (quote, prefix): _string_re(quote, escapes)
+    for quote in "\"'"
+    for prefix, escapes in (
+        ("", (_unicode_escape, _escape)),
+        ("u", (_unicode_escape, _escape)),
+        ("b", (_escape,)),
+        ("r", ()),
+        ("rb", ()),
+        ("br", ()),
+    )
+}
+
+_fast_lexer = Python3Lexer()
+
+
+@functools.lru_cache(maxsize=4096)
+def _name_token(before: str, name: str) -> _TokenType | None:
+    """Token Pygments finds for name after before, or None if Pygments does
+    not find name as a single token there."""
+    tokens, state = lex_line(_fast_lexer, f"{before}{name};")
+    tokens = [(token, value) for token, value in tokens if value]
+    if state != ROOT_STATE or len(tokens) < 3 or tokens[-3][1] != name:
+        return None
+    if "".join(value for _, value in tokens[:-3]) != before:
+        return None
+    return tokens[-3][0]
+
+
+def scan_line(line: str) -> list[tuple[_TokenType, str]] | None:
+    """Tokens of line including its newline, like those lex_line finds for
+    Pygments' Python lexer starting in the root state, or None if the line
+    is not simple enough to be scanned.
+
+    Empty tokens are left out."""
+    if (
+        not line.isascii()
+        or line.endswith("\\")
+        or '"""' in line
+        or "'''" in line
+        or line.lstrip(" \t").startswith(("match", "case"))
+    ):
+        return None
+    text = line + "\n"
+    end = len(line)
+    tokens: list[tuple[_TokenType, str]] = []
+    append = tokens.append
+    match = _token_re.compiled.match
+    pos = 0
+    while pos < end:
+        m = match(text, pos)
+        if m is None:
+            append((Error, text[pos]))
+            pos += 1
+            continue
+        kind = m.lastgroup
+        value = m.group()
+        if kind == "name":
+            pos = m.end()
+            if value in ("def", "class", "from", "import"):
+                space = _keyword_space_re.match(text, pos)
+                if space is not None:
+                    pos = space.end()
+                    if pos >= end:
+                        # the lexer would end in another state
+                        return None
+                    if value in ("def", "class"):
+                        append((Keyword, value))
+                        append((Whitespace, space.group()))
+                        name = _name_re.match(text, pos)
+                        if name is None:
+                            if value == "class":
+                                return None
+                            continue
+                        token = _name_token(f"{value} ", name.group())
+                        if token is None:
+                            return None
+                        append((token, name.group()))
+                        pos = name.end()
+                    else:
+                        append((Keyword.Namespace, value))
+                        append((Whitespace, space.group()))
+                        if value == "from":
+                            pos = _scan_from(text, pos, append)
+                        else:
+                            pos = _scan_import(text, pos, end, append)
+                            if pos < 0:
+                                return None
+                    continue
+            elif value == "yield" and _yield_from_re.match(text, pos):
+                value = "yield from"
+                pos += 5
+            token = _name_token(
+                "." if m.start() and text[m.start() - 1] == "." else "(",
+                value,
+            )
+            if token is None:
+                return None
+            append((token, value))
+        elif kind == "string":
+            quote = m.group("quote")
+            if len(value) > 1:
+                append((String.Affix, value[:-1]))
+            ttype = String.Double if quote == '"' else String.Single
+            append((ttype, quote))
+            pos = _scan_string(
+                text,
+                m.end(),
+                _string_res[quote, value[:-1].lower()].compiled.match,
+                ttype,
+                append,
+            )
+        elif kind == "fstring":
+            return None
+        elif kind == "comment" and pos == 0 and value[:2] == "#!" and end > 2:
+            append((Comment.Hashbang, value))
+            pos = m.end()
+        else:
+            append((_simple_tokens[kind], value))  # type: ignore[index]
+            pos = m.end()
+    append((Whitespace, "\n"))
+    return tokens
+
+
+def _scan_string(
+    text: str,
+    pos: int,
+    match: Callable[[str, int], re.Match[str] | None],
+    ttype: _TokenType,
+    append: Callable[[tuple[_TokenType, str]], None],
+) -> int:
+    """Scan the rest of a string, like the string states of Pygments'
+    Python lexer."""
+    while True:
+        m = match(text, pos)
+        if m is None:
+            # an unclosed string ends at the end of the line
+            return pos
+        kind = m.lastgroup
+        if kind == "string":
+            append((ttype, m.group()))
+        elif kind == "interpol":
+            append((String.Interpol, m.group()))
+        elif kind == "close":
+            append((ttype, m.group()))
+            return m.end()
+        else:
+            append((String.Escape, m.group()))
+        pos = m.end()
+
+
+def _scan_from(
+    text: str, pos: int, append: Callable[[tuple[_TokenType, str]], None]
+) -> int:
+    """Scan the module of `from module`, like the fromimport state of
+    Pygments' Python lexer."""
+    while True:
+        m = _from_import_re.match(text, pos)
+        if m is not None:
+            append((Whitespace, m.group(1)))
+            append((Keyword.Namespace, m.group(2)))
+            return m.end()
+        if text[pos] == ".":
+            append((Name.Namespace, "."))
+            pos += 1
+            continue
+        m = _name_re.match(text, pos)
+        if m is None:
+            return pos
+        if m.group() == "None":
+            append((Keyword.Constant, "None"))
+            return m.end()
+        append((Name.Namespace, m.group()))
+        pos = m.end()
+
+
+def _scan_import(
+    text: str,
+    pos: int,
+    end: int,
+    append: Callable[[tuple[_TokenType, str]], None],
+) -> int:
+    """Scan the modules of `import modules`, like the import state of
+    Pygments' Python lexer. Returns -1 if the state does not end on this
+    line."""
+    while True:
+        m = _import_as_re.match(text, pos)
+        if m is not None:
+            tokens = ((Whitespace, m.group(1)), (Keyword, m.group(2)))
+            space = m.group(3)
+        else:
+            m = _import_comma_re.match(text, pos)
+            if m is not None:
+                tokens = ((Whitespace, m.group(1)), (Operator, m.group(2)))
+                space = m.group(3)
+        if m is not None:
+            if m.end() > end:
+                return -1
+            for token in tokens:
+                if token[1]:
+                    append(token)
+            if space:
+                append((Whitespace, space))
+            pos = m.end()
+            continue
+        if text[pos] == ".":
+            append((Name.Namespace, "."))
+            pos += 1
+            continue
+        m = _name_re.match(text, pos)
+        if m is None:
+            return pos
+        append((Name.Namespace, m.group()))
+        pos = m.end()
+
+
+class LineTokenCache:
+    """Tokens of the lines of a block, each with the states of the lexer at
+    its start and end.
+
+    A line is only lexed again if it or the state at its start changed, so
+    while the last line of a block is edited, only that line is lexed.
+
+    Without a lexer, lines are lexed with Pygments' Python lexer and, unless
+    fast is False, scanned with scan_line where possible.
+
+    If lines cannot be lexed on their own since the rules of the lexer cannot
+    be found, the whole block is lexed every time instead."""
+
+    def __init__(
+        self, lexer: RegexLexer | None = None, fast: bool = True
+    ) -> None:
+        self.lexer = lexer if lexer is not None else _fast_lexer
+        self.incremental = _token_defs(self.lexer) is not None
+        self.fast = fast and lexer is None and self.incremental
+        self._lines: list[str] = []
+        self._start_states: list[tuple[str, ...]] = []
+        self._end_states: list[tuple[str, ...]] = []
+        self._tokens: list[list[tuple[_TokenType, str]]] = []
+
+    def update(
+        self, lines: Sequence[str]
+    ) -> list[list[tuple[_TokenType, str]]]:
+        """Tokens of each line of lines, including their newlines."""
+        if not self.incremental:
+            return self._lex_all(lines)
+        state = ROOT_STATE
+        for i, line in enumerate(lines):
+            if (
+                i < len(self._lines)
+                and self._lines[i] == line
+                and self._start_states[i] == state
+            ):
+                state = self._end_states[i]
+                continue
+            tokens, end_state = self._lex(line, state)
+            if i < len(self._lines):
+                self._lines[i] = line
+                self._start_states[i] = state
+                self._end_states[i] = end_state
+                self._tokens[i] = tokens
+            else:
+                self._lines.append(line)
+                self._start_states.append(state)
+                self._end_states.append(end_state)
+                self._tokens.append(tokens)
+            state = end_state
+        del self._lines[len(lines) :]
+        del self._start_states[len(lines) :]
+        del self._end_states[len(lines) :]
+        del self._tokens[len(lines) :]
+        return self._tokens
+
+    def _lex(
+        self, line: str, state: tuple[str, ...]
+    ) -> tuple[list[tuple[_TokenType, str]], tuple[str, ...]]:
+        if self.fast and state == ROOT_STATE:
+            tokens = scan_line(line)
+            if tokens is not None:
+                return tokens, ROOT_STATE
+        return lex_line(self.lexer, line, state)
+
+    def _lex_all(
+        self, lines: Sequence[str]
+    ) -> list[list[tuple[_TokenType, str]]]:
+        """Lex lines as a whole with the public API of the lexer and split
+        the tokens at the newlines."""
+        self._tokens = []
+        if not lines:
+            return self._tokens
+        current: list[tuple[_TokenType, str]] = []
+        text = "\n".join(lines) + "\n"
+        for _, token, value in self.lexer.get_tokens_unprocessed(text):
+            start = 0
+            end = value.find("\n") + 1
+            while end:
+                current.append((token, value[start:end]))
+                self._tokens.append(current)
+                current = []
+                start = end
+                end = value.find("\n", start) + 1
+            if start < len(value):
+                current.append((token, value[start:]))
+        if current:
+            self._tokens.append(current)
+        return self._tokens
+
+    def tokens(self, lines: Sequence[str]) -> list[tuple[_TokenType, str]]:
+        """Tokens of lines joined by newlines, like those Pygments finds
+        for the source without the trailing newline."""
+        all_tokens = self.update(lines)
+        if not all_tokens:
+            return []
+        return [
+            token for tokens in all_tokens[:-1] for token in tokens
+        ] + line_tokens(all_tokens[-1])
+
+
+def line_tokens(
+    tokens: Sequence[tuple[_TokenType, str]],
+) -> list[tuple[_TokenType, str]]:
+    """Tokens of a line as found by LineTokenCache.update, without the
+    newline at its end."""
+    result = list(tokens)
+    while result and not result[-1][1]:
+        result.pop()
+    if result:
+        token, value = result.pop()
+        if value != "\n":
+            result.append((token, value[:-1]))
+    return result
+
+
+# closing bracket of each opening bracket
+BRACKETS = dict(zip("([{", ")]}"))
+
+
+class _Opening(NamedTuple):
+    """An opening bracket on the stack of unclosed brackets."""
+
+    lineno: int
+    token_index: int
+    value: str
+    # position in the brackets of its line
+    position: int
+    below: "_Opening | None"
+
+
+class Bracket(NamedTuple):
+    """A bracket token of a line."""
+
+    token_index: int
+    value: str
+    # line number, token index and value of the matching bracket
+    partner: tuple[int, int, str] | None
+
+
+# stack after a closing bracket without an opening one, which stops bracket
+# matching for the rest of the block
+_STOPPED = _Opening(-1, -1, "", -1, None)
+
+
+class BracketIndex:
+    """Matching brackets of the lines of a block.
+
+    Brackets are matched with a stack of unclosed opening brackets, which is
+    carried from line to line. The stack at the end of each line is kept, so
+    that only the lines whose tokens or start stack changed are scanned
+    again. A closing bracket is matched with the nearest unclosed opening
+    bracket of the same kind. If there is none it is ignored, unless no
+    bracket is open at all, in which case the rest of the block is not
+    matched."""
+
+    def __init__(self) -> None:
+        self._tokens: list[Sequence[tuple[_TokenType, str]]] = []
+        self._start: list[_Opening | None] = []
+        self._end: list[_Opening | None] = []
+        # columns of the brackets of each line, and the brackets
+        self._columns: list[list[int]] = []
+        self._brackets: list[list[Bracket]] = []
+
+    def update(
+        self, lines_tokens: Sequence[Sequence[tuple[_TokenType, str]]]
+    ) -> None:
+        """Match the brackets of lines with the tokens of each line as found
+        by LineTokenCache.update.
+
+        Lines are only scanned if their list of tokens is not the one
+        passed for them before, or the brackets open at their start
+        changed."""
+        stack: _Opening | None = None
+        for lineno, tokens in enumerate(lines_tokens):
+            if (
+                lineno < len(self._tokens)
+                and self._tokens[lineno] is tokens
+                and self._start[lineno] is stack
+            ):
+                stack = self._end[lineno]
+                continue
+            columns, brackets, end = self._scan(lineno, tokens, stack)
+            if lineno < len(self._tokens):
+                self._tokens[lineno] = tokens
+                self._start[lineno] = stack
+                self._end[lineno] = end
+                self._columns[lineno] = columns
+                self._brackets[lineno] = brackets
+            else:
+                self._tokens.append(tokens)
+                self._start.append(stack)
+                self._end.append(end)
+                self._columns.append(columns)
+                self._brackets.append(brackets)
+            stack = end
+        del self._tokens[len(lines_tokens) :]
+        del self._start[len(lines_tokens) :]
+        del self._end[len(lines_tokens) :]
+        del self._columns[len(lines_tokens) :]
+        del self._brackets[len(lines_tokens) :]
+
+    @staticmethod
+    def _scan(
+        lineno: int,
+        tokens: Sequence[tuple[_TokenType, str]],
+        stack: _Opening | None,
+    ) -> tuple[list[int], list[Bracket], _Opening | None]:
+        columns: list[int] = []
+        brackets: list[Bracket] = []
+        if stack is _STOPPED:
+            return columns, brackets, stack
+        column = 0
+        for index, (token, value) in enumerate(line_tokens(tokens)):
+            if token is Punctuation:
+                if value in BRACKETS:
+                    stack = _Opening(lineno, index, value, len(brackets), stack)
+                    columns.append(column)
+                    brackets.append(Bracket(index, value, None))
+                elif value in BRACKETS.values():
+                    opening = stack
+                    while (
+                        opening is not None and BRACKETS[opening.value] != value
+                    ):
+                        opening = opening.below
+                    partner = None
+                    if opening is not None:
+                        stack = opening.below
+                        partner = (
+                            opening.lineno,
+                            opening.token_index,
+                            opening.value,
+                        )
+                        if opening.lineno == lineno:
+                            brackets[opening.position] = brackets[
+                                opening.position
+                            ]._replace(partner=(lineno, index, value))
+                    elif stack is None:
+                        return columns, brackets, _STOPPED
+                    columns.append(column)
+                    brackets.append(Bracket(index, value, partner))
+            column += len(value)
+        return columns, brackets, stack
+
+    def bracket_at(self, lineno: int, column: int) -> Bracket | None:
+        """The bracket at column of the line, if any. The partner of an
+        opening bracket is only known if it is on the same line."""
+        if not 0 <= lineno < len(self._columns):
+            return None
+        columns = self._columns[lineno]
+        i = bisect.bisect_left(columns, column)
+        if i < len(columns) and columns[i] == column:
+            return self._brackets[lineno][i]
+        return None
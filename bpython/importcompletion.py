@@ -21,14 +21,35 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import ast
+import bisect
 import fnmatch
 import importlib.machinery
+import json
+import logging
+import os
+import re
+import stat
 import sys
-import warnings
-from dataclasses import dataclass
+import tempfile
+import threading
+import time
+import tokenize
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
 from pathlib import Path
-from collections.abc import Generator, Sequence, Iterable
+from typing import TYPE_CHECKING, Any, TypeVar
+from collections.abc import (
+    Callable,
+    Generator,
+    Iterable,
+    Iterator,
+    MutableSet,
+    Sequence,
+)
 
+from .filelock import FileLock
 from .line import (
     current_word,
     current_import,
@@ -36,6 +57,11 @@ from .line import (
     current_from_import_import,
 )
 
+if TYPE_CHECKING:
+    from .moduleserver import ModuleIndexClient
+
+logger = logging.getLogger(__name__)
+
 SUFFIXES = importlib.machinery.all_suffixes()
 LOADERS = (
     (
@@ -48,6 +74,24 @@ LOADERS = (
     ),
 )
 
+# Suffixes of the files the import system can load modules from
+_MODULE_SUFFIXES = tuple(
+    suffix for _, suffixes in LOADERS for suffix in suffixes
+)
+
+# Seconds to block at most while waiting for a directory to be listed
+_POLL_INTERVAL = 0.001
+
+# Version of the on-disk format written by ModuleIndex. Bump whenever the
+# layout or the semantics of a directory listing change.
+INDEX_VERSION = 3
+
+# Number of directory listings and of parsed modules the index keeps at most
+# besides those used by the session writing it. The least recently written
+# ones are dropped first.
+INDEX_MAX_DIRECTORIES = 20000
+INDEX_MAX_NAMES = 2000
+
 
 @dataclass(frozen=True, slots=True)
 class _LoadedInode:
@@ -55,46 +99,663 @@ class _LoadedInode:
     inode: int
 
 
+@dataclass(frozen=True, slots=True)
+class _DirectoryStamp:
+    dev: int
+    inode: int
+    mtime_ns: int
+
+    @classmethod
+    def from_stat(cls, st: os.stat_result) -> "_DirectoryStamp":
+        return cls(st.st_dev, st.st_ino, st.st_mtime_ns)
+
+    @property
+    def loaded_inode(self) -> _LoadedInode:
+        return _LoadedInode(self.dev, self.inode)
+
+
+@dataclass(slots=True)
+class _DirectoryListing:
+    """Modules and packages found directly inside one directory.
+
+    For zip archives, modules contains the dotted names of all modules in
+    the archive and packages is empty."""
+
+    stamp: _DirectoryStamp
+    modules: list[str] = field(default_factory=list)
+    # (name, path) of the packages to descend into
+    packages: list[tuple[str, str]] = field(default_factory=list)
+
+
+def _stat_directory(path: Path | str) -> _DirectoryStamp | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISDIR(st.st_mode):
+        return None
+    return _DirectoryStamp.from_stat(st)
+
+
+def _compile_skiplist(patterns: Iterable[str]) -> Callable[[str], bool]:
+    """Return a function checking whether a name matches any of the fnmatch
+    style patterns.
+
+    Patterns without wildcards are looked up in a set, all others are
+    combined into a single regular expression."""
+    exact: set[str] = set()
+    wildcards: list[str] = []
+    for pattern in patterns:
+        pattern = os.path.normcase(pattern)
+        if any(c in pattern for c in "*?["):
+            wildcards.append(fnmatch.translate(pattern))
+        else:
+            exact.add(pattern)
+    match = re.compile("|".join(wildcards)).match if wildcards else None
+    normcase = os.path.normcase
+
+    def is_skiplisted(name: str) -> bool:
+        name = normcase(name)
+        return name in exact or (match is not None and match(name) is not None)
+
+    return is_skiplisted
+
+
+def with_prefix(names: Sequence[str], prefix: str) -> Iterator[str]:
+    """Names in the sorted sequence `names` which start with `prefix`."""
+    for i in range(bisect.bisect_left(names, prefix), len(names)):
+        name = names[i]
+        if not name.startswith(prefix):
+            break
+        yield name
+
+
+def _resolve_paths(paths: Iterable[str | Path]) -> list[Path]:
+    return [Path(p).resolve() if p else Path.cwd() for p in paths]
+
+
+def _split_archive_path(path: str) -> tuple[str, str] | None:
+    """Split a path like `/path/to/archive.zip/lib` into the path of the
+    archive and the directory inside of it, like zipimport does."""
+    archive, inner = path, ""
+    while True:
+        try:
+            st = os.stat(archive)
+        except OSError:
+            head, tail = os.path.split(archive)
+            if head == archive or not tail:
+                return None
+            archive = head
+            inner = f"{tail}/{inner}" if inner else tail
+            continue
+        if stat.S_ISREG(st.st_mode):
+            return archive, inner
+        return None
+
+
+def _stat_root(root: Path) -> _DirectoryStamp | None:
+    stamp = _stat_directory(root)
+    if stamp is None:
+        archive = _split_archive_path(str(root))
+        if archive is not None:
+            try:
+                stamp = _DirectoryStamp.from_stat(os.stat(archive[0]))
+            except OSError:
+                pass
+    return stamp
+
+
+def _stat_roots(roots: Iterable[Path]) -> dict[Path, _DirectoryStamp | None]:
+    return {root: _stat_root(root) for root in roots}
+
+
+def _wait_for(future: Future) -> bool:
+    """Wait briefly for a future to complete and return whether it is done.
+
+    Polling with a timeout instead of spinning leaves the GIL to the worker
+    threads while keeping the caller responsive."""
+    if not future.done():
+        wait((future,), timeout=_POLL_INTERVAL)
+    return future.done()
+
+
+def module_name(filename: str, is_dir: bool) -> str | None:
+    """The name of the module or package provided by a directory entry
+    called filename, or None if nothing can be imported from it, like from
+    editor swap files or `__pycache__`."""
+    if is_dir:
+        name = filename
+    else:
+        for suffix in _MODULE_SUFFIXES:
+            if filename.endswith(suffix):
+                name = filename[: -len(suffix)]
+                break
+        else:
+            return None
+    if not name.isidentifier() or name == "__pycache__":
+        return None
+    return name
+
+
+def _is_regular_package(path: str) -> bool:
+    return any(
+        os.path.isfile(os.path.join(path, f"__init__{suffix}"))
+        for suffix in _MODULE_SUFFIXES
+    )
+
+
+@dataclass(slots=True)
+class _ModuleAttributes:
+    """Sorted dir() of a module along with the state of its namespace."""
+
+    namespace: dict[str, Any]
+    size: int
+    names: list[str]
+
+
+@dataclass(slots=True)
+class _ModuleNamesEntry:
+    """Names defined at the top level of a source file."""
+
+    mtime_ns: int
+    names: list[str]
+
+
+def _top_level_names(tree: ast.Module) -> list[str]:
+    """Names a module defines at the top level or lists in `__all__`,
+    without running it.
+
+    Definitions in top-level if, try and with statements are included since
+    they are commonly used for optional imports and compatibility code."""
+    names: set[str] = set()
+
+    def add_targets(target: ast.expr) -> None:
+        if isinstance(target, ast.Name):
+            names.add(target.id)
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            for elt in target.elts:
+                add_targets(elt)
+        elif isinstance(target, ast.Starred):
+            add_targets(target.value)
+
+    def add_all(value: ast.expr | None) -> None:
+        if isinstance(value, (ast.List, ast.Tuple)):
+            names.update(
+                elt.value
+                for elt in value.elts
+                if isinstance(elt, ast.Constant) and isinstance(elt.value, str)
+            )
+
+    def visit(body: list[ast.stmt]) -> None:
+        for node in body:
+            if isinstance(
+                node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+            ):
+                names.add(node.name)
+            elif isinstance(node, ast.Assign):
+                for target in node.targets:
+                    add_targets(target)
+                    if isinstance(target, ast.Name) and target.id == "__all__":
+                        add_all(node.value)
+            elif isinstance(node, (ast.AnnAssign, ast.AugAssign)):
+                add_targets(node.target)
+                if (
+                    isinstance(node.target, ast.Name)
+                    and node.target.id == "__all__"
+                ):
+                    add_all(node.value)
+            elif isinstance(node, ast.Import):
+                names.update(
+                    alias.asname or alias.name.partition(".")[0]
+                    for alias in node.names
+                )
+            elif isinstance(node, ast.ImportFrom):
+                names.update(
+                    alias.asname or alias.name
+                    for alias in node.names
+                    if alias.name != "*"
+                )
+            elif isinstance(node, ast.If):
+                visit(node.body)
+                visit(node.orelse)
+            elif isinstance(node, (ast.Try, ast.TryStar)):
+                visit(node.body)
+                for handler in node.handlers:
+                    visit(handler.body)
+                visit(node.orelse)
+                visit(node.finalbody)
+            elif isinstance(node, ast.With):
+                visit(node.body)
+
+    visit(tree.body)
+    return sorted(names)
+
+
+T = TypeVar("T")
+
+
+def _merge_used(
+    stored: dict[str, T], current: dict[str, T], used: set[str], limit: int
+) -> dict[str, T]:
+    """The entries of stored with the used entries of current appended, as
+    the most recent ones. Of the others, the oldest ones are dropped until
+    there are at most limit."""
+    # entries may be added by the worker threads in the meantime
+    used = {path for path in list(used) if path in current}
+    merged = {path: entry for path, entry in stored.items() if path not in used}
+    excess = len(merged) - limit
+    if excess > 0:
+        merged = dict(list(merged.items())[excess:])
+    merged.update((path, current[path]) for path in used)
+    return merged
+
+
+class ModuleIndex:
+    """Persistent cache of the directory listings gathered for import
+    completion and of the names defined by modules which have not been
+    imported.
+
+    Listings are keyed by directory path and are only reused as long as the
+    device, inode and modification time of the directory are unchanged. Names
+    are keyed by source file and reused as long as its modification time is
+    unchanged. The index is invalidated as a whole if it was written by a
+    different version of bpython, for an interpreter with different module
+    suffixes or with a different skiplist."""
+
+    def __init__(
+        self, path: Path | None = None, skiplist: Sequence[str] = ()
+    ) -> None:
+        self.path = path
+        self.header = {
+            "version": INDEX_VERSION,
+            "suffixes": list(_MODULE_SUFFIXES),
+            "skiplist": list(skiplist),
+        }
+        self.directories: dict[str, _DirectoryListing] = {}
+        self.names: dict[str, _ModuleNamesEntry] = {}
+        # directories and source files whose entries were used or updated by
+        # this session, the others are only kept for other sessions
+        self._used_directories: set[str] = set()
+        self._used_names: set[str] = set()
+        # whether directories or names differ from what is stored on disk
+        self.dirty = False
+        # entries are added from the threads listing directories while the
+        # index may be saved
+        self._lock = threading.Lock()
+        if path is not None:
+            self.load()
+
+    def get(
+        self, path: str, stamp: _DirectoryStamp
+    ) -> _DirectoryListing | None:
+        """Return the cached listing of path if it is still up to date."""
+        listing = self.directories.get(path)
+        if listing is None or listing.stamp != stamp:
+            return None
+        with self._lock:
+            self._used_directories.add(path)
+        return listing
+
+    def put(self, path: str, listing: _DirectoryListing) -> None:
+        with self._lock:
+            self.directories[path] = listing
+            self._used_directories.add(path)
+            self.dirty = True
+
+    def get_names(self, path: str) -> list[str] | None:
+        """Return the names defined at the top level of the source file
+        path, parsing it if it is not in the index or has been modified."""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        entry = self.names.get(path)
+        with self._lock:
+            self._used_names.add(path)
+        if entry is not None and entry.mtime_ns == mtime_ns:
+            return entry.names
+        try:
+            with tokenize.open(path) as f:
+                tree = ast.parse(f.read(), path)
+        except (OSError, SyntaxError, ValueError, UnicodeDecodeError):
+            names = []
+        else:
+            names = _top_level_names(tree)
+        with self._lock:
+            self.names[path] = _ModuleNamesEntry(mtime_ns, names)
+            self.dirty = True
+        return names
+
+    def load(self) -> None:
+        if self.path is None:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                with FileLock(f, filename=str(self.path)):
+                    self.directories, self.names = self._load_from(json.load(f))
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logger.debug("Could not load module index %s: %s", self.path, e)
+            self.directories = {}
+            self.names = {}
+
+    def _load_from(
+        self, data: dict
+    ) -> tuple[dict[str, _DirectoryListing], dict[str, _ModuleNamesEntry]]:
+        if any(data.get(key) != value for key, value in self.header.items()):
+            # written by a different version or configuration
+            return {}, {}
+        directories = {
+            path: _DirectoryListing(
+                _DirectoryStamp(*entry["stamp"]),
+                list(entry["modules"]),
+                [(name, pkg) for name, pkg in entry["packages"]],
+            )
+            for path, entry in data["directories"].items()
+        }
+        names = {
+            path: _ModuleNamesEntry(entry["mtime_ns"], list(entry["names"]))
+            for path, entry in data["names"].items()
+        }
+        return directories, names
+
+    def save(self) -> None:
+        """Write the index to disk if it has changed.
+
+        The entries used by this session replace those on disk. The entries
+        of other sessions are kept, but only up to INDEX_MAX_DIRECTORIES
+        listings and INDEX_MAX_NAMES modules, so that directories which are
+        not searched anymore are eventually dropped."""
+        if self.path is None or not self.dirty:
+            return
+        with self._lock:
+            current_directories = dict(self.directories)
+            used_directories = set(self._used_directories)
+            current_names = dict(self.names)
+            used_names = set(self._used_names)
+            self.dirty = False
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a+", encoding="utf-8") as f:
+                with FileLock(f, filename=str(self.path)):
+                    f.seek(0)
+                    try:
+                        directories, names = self._load_from(json.load(f))
+                    except (ValueError, TypeError, KeyError):
+                        directories, names = {}, {}
+                    self._write(
+                        _merge_used(
+                            directories,
+                            current_directories,
+                            used_directories,
+                            INDEX_MAX_DIRECTORIES,
+                        ),
+                        _merge_used(
+                            names,
+                            current_names,
+                            used_names,
+                            INDEX_MAX_NAMES,
+                        ),
+                    )
+        except OSError as e:
+            logger.debug("Could not save module index %s: %s", self.path, e)
+            self.dirty = True
+
+    def _write(
+        self,
+        directories: dict[str, _DirectoryListing],
+        names: dict[str, _ModuleNamesEntry],
+    ) -> None:
+        assert self.path is not None
+        data = dict(self.header)
+        data["directories"] = {
+            path: {
+                "stamp": [
+                    listing.stamp.dev,
+                    listing.stamp.inode,
+                    listing.stamp.mtime_ns,
+                ],
+                "modules": listing.modules,
+                "packages": listing.packages,
+            }
+            for path, listing in directories.items()
+        }
+        data["names"] = {
+            path: {"mtime_ns": entry.mtime_ns, "names": entry.names}
+            for path, entry in names.items()
+        }
+        # write to a temporary file first so that readers never see a
+        # partially written index
+        fd, tmp = tempfile.mkstemp(
+            dir=self.path.parent, prefix=f".{self.path.name}."
+        )
+        try:
+            with open(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+class _ModuleNode:
+    """Node of a ModuleNames trie, one per dotted name component."""
+
+    __slots__ = ("children", "is_module", "sorted_children")
+
+    def __init__(self) -> None:
+        self.children: dict[str, _ModuleNode] = {}
+        self.is_module = False
+        # sorted keys of children, rebuilt lazily after insertions
+        self.sorted_children: list[str] | None = []
+
+
+class ModuleNames(MutableSet[str]):
+    """Set of dotted module names, stored as a trie of name components.
+
+    Besides the usual set operations, this supports listing the direct
+    children of a package that start with a given prefix in time
+    proportional to the depth of the package, log(number of children) and
+    the size of the result."""
+
+    def __init__(self, names: Iterable[str] = ()) -> None:
+        self._root = _ModuleNode()
+        self._len = 0
+        self.update(names)
+
+    def _find(self, name: str) -> _ModuleNode | None:
+        node = self._root
+        for component in name.split("."):
+            child = node.children.get(component)
+            if child is None:
+                return None
+            node = child
+        return node
+
+    def __contains__(self, name: object) -> bool:
+        if not isinstance(name, str):
+            return False
+        node = self._find(name)
+        return node is not None and node.is_module
+
+    def __iter__(self) -> Iterator[str]:
+        stack: list[tuple[str, _ModuleNode]] = [("", self._root)]
+        while stack:
+            prefix, node = stack.pop()
+            for component, child in node.children.items():
+                name = f"{prefix}{component}"
+                if child.is_module:
+                    yield name
+                if child.children:
+                    stack.append((f"{name}.", child))
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({sorted(self)!r})"
+
+    def add(self, name: str) -> None:
+        node = self._root
+        for component in name.split("."):
+            child = node.children.get(component)
+            if child is None:
+                child = node.children[component] = _ModuleNode()
+                node.sorted_children = None
+            node = child
+        if not node.is_module:
+            node.is_module = True
+            self._len += 1
+
+    def discard(self, name: str) -> None:
+        path = [self._root]
+        components = name.split(".")
+        for component in components:
+            child = path[-1].children.get(component)
+            if child is None:
+                return
+            path.append(child)
+        if not path[-1].is_module:
+            return
+        path[-1].is_module = False
+        self._len -= 1
+        # prune nodes which neither are modules nor have children anymore
+        for component, node, parent in zip(
+            reversed(components), reversed(path), reversed(path[:-1])
+        ):
+            if node.is_module or node.children:
+                break
+            del parent.children[component]
+            parent.sorted_children = None
+
+    def update(self, names: Iterable[str]) -> None:
+        for name in names:
+            self.add(name)
+
+    def difference_update(self, names: Iterable[str]) -> None:
+        for name in names:
+            self.discard(name)
+
+    def clear(self) -> None:
+        self._root = _ModuleNode()
+        self._len = 0
+
+    def children(self, package: str, prefix: str = "") -> Iterator[str]:
+        """Names of the modules directly inside `package` (or the top-level
+        modules if `package` is empty) which start with `prefix`."""
+        node = self._find(package) if package else self._root
+        if node is None:
+            return
+        keys = node.sorted_children
+        if keys is None:
+            keys = node.sorted_children = sorted(node.children)
+        children = node.children
+        for key in with_prefix(keys, prefix):
+            if children[key].is_module:
+                yield key
+
+
 class ModuleGatherer:
     def __init__(
         self,
         paths: Iterable[str | Path] | None = None,
         skiplist: Sequence[str] | None = None,
+        cache_path: Path | None = None,
+        max_workers: int | None = None,
+        server: "ModuleIndexClient | None" = None,
     ) -> None:
         """Initialize module gatherer with all modules in `paths`, which should be a list of
-        directory names. If `paths` is not given, `sys.path` will be used."""
+        directory names. If `paths` is not given, `sys.path` will be used.
+
+        If a `server` is given, the directories it searches are left to it
+        and its matches are added to the ones found here. If it stops
+        answering, those directories are searched here again.
+
+        If `cache_path` is given, directory listings are stored in a
+        `ModuleIndex` at that location. Modules from a previous session are
+        then available right away and only directories that changed since
+        are rescanned.
+
+        Directories are listed on a pool of `max_workers` threads (the
+        default of `ThreadPoolExecutor` if None). If `max_workers` is 0, they
+        are listed on the calling thread."""
 
         # Cached list of all known modules
-        self.modules: set[str] = set()
+        self._modules = ModuleNames()
         # Set of (st_dev, st_ino) to compare against so that paths are not repeated
         self.paths: set[_LoadedInode] = set()
         # Patterns to skip
         self.skiplist: Sequence[str] = (
             skiplist if skiplist is not None else tuple()
         )
+        self._skiplist_match = _compile_skiplist(self.skiplist)
         self.fully_loaded = False
+        self.index = ModuleIndex(cache_path, self.skiplist)
+        self.max_workers = max_workers
+        self._executor: ThreadPoolExecutor | None = None
+        # Number of paths searched completely so far
+        self._paths_done = 0
+        # Modules known from the index which have not been seen again yet
+        self._stale_modules: set[str] = set()
+        # Attributes of imported modules by module name
+        self._attributes: dict[str, _ModuleAttributes] = {}
+        # The search path, or None to follow changes to sys.path
+        self._search_path = None if paths is None else list(paths)
+        self._builtin_modules: frozenset[str] = frozenset()
+        self._server = server
+        self._server_paths: frozenset[Path] = frozenset(
+            _resolve_paths(server.paths) if server is not None else ()
+        )
 
         if paths is None:
-            self.modules.update(sys.builtin_module_names)
-            paths = sys.path
+            self._builtin_modules = frozenset(sys.builtin_module_names)
+            self.modules.update(self._builtin_modules)
 
-        self.find_iterator = self.find_all_modules(
-            Path(p).resolve() if p else Path.cwd() for p in paths
-        )
+        self._roots = self._search_roots()
+        self._root_stamps = _stat_roots(self._roots)
+        self._paths_total = len(self._roots)
+        self._load_from_index(self._roots)
+        self.find_iterator = self.find_all_modules(self._roots)
+
+    @property
+    def search_paths(self) -> list[str]:
+        """The directories searched for modules."""
+        return [str(root) for root in self._roots]
+
+    @property
+    def progress(self) -> tuple[int, int]:
+        """Number of paths searched so far and number of paths to search."""
+        return self._paths_done, self._paths_total
+
+    @property
+    def modules(self) -> ModuleNames:
+        return self._modules
+
+    @modules.setter
+    def modules(self, names: Iterable[str]) -> None:
+        self._modules = ModuleNames(names)
 
     def module_matches(self, cw: str, prefix: str = "") -> set[str]:
         """Modules names to replace cw with"""
 
         full = f"{prefix}.{cw}" if prefix else cw
-        matches = (
-            name
-            for name in self.modules
-            if (name.startswith(full) and name.find(".", len(full)) == -1)
-        )
+        package, dot, name_after_dot = full.rpartition(".")
+        if dot and not package:
+            return set()
+        package_part = full[: len(package) + len(dot)]
         if prefix:
-            return {match[len(prefix) + 1 :] for match in matches}
-        else:
-            return set(matches)
+            package_part = package_part[len(prefix) + 1 :]
+        matches = {
+            f"{package_part}{name}"
+            for name in self.modules.children(package, name_after_dot)
+        }
+        if self._server is not None:
+            try:
+                matches.update(self._server.module_matches(cw, prefix))
+            except TimeoutError as e:
+                logger.debug("Module server did not answer in time: %s", e)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self._server_failed(e)
+        return matches
 
     def attr_matches(
         self, cw: str, prefix: str = "", only_modules: bool = False
@@ -102,25 +763,102 @@ class ModuleGatherer:
         """Attributes to replace name with"""
         full = f"{prefix}.{cw}" if prefix else cw
         module_name, _, name_after_dot = full.rpartition(".")
-        if module_name not in sys.modules:
+        if module_name in sys.modules:
+            names = self._module_attributes(
+                module_name, sys.modules[module_name]
+            )
+        elif only_modules or not module_name:
             return set()
-        module = sys.modules[module_name]
+        else:
+            # look at the source instead of importing the module
+            names = self.static_attr_names(module_name)
+
+        matches: Iterable[str] = with_prefix(names, name_after_dot)
         if only_modules:
-            matches = {
+            matches = (
                 name
-                for name in dir(module)
-                if name.startswith(name_after_dot)
-                and f"{module_name}.{name}" in sys.modules
-            }
-        else:
-            matches = {
-                name for name in dir(module) if name.startswith(name_after_dot)
-            }
+                for name in matches
+                if f"{module_name}.{name}" in sys.modules
+            )
         module_part = cw.rpartition(".")[0]
         if module_part:
-            matches = {f"{module_part}.{m}" for m in matches}
+            return {f"{module_part}.{m}" for m in matches}
+        return set(matches)
 
-        return matches
+    def _module_attributes(self, module_name: str, module: Any) -> list[str]:
+        """Sorted attribute names of an imported module.
+
+        They are cached as long as the module keeps its namespace and no
+        names are added to or removed from it."""
+        namespace = getattr(module, "__dict__", None)
+        if not isinstance(namespace, dict):
+            return sorted(dir(module))
+        entry = self._attributes.get(module_name)
+        if (
+            entry is None
+            or entry.namespace is not namespace
+            or entry.size != len(namespace)
+        ):
+            entry = _ModuleAttributes(
+                namespace, len(namespace), sorted(dir(module))
+            )
+            self._attributes[module_name] = entry
+        return entry.names
+
+    def static_attr_names(self, module_name: str) -> list[str]:
+        """Names defined by a module which has not been imported, as far as
+        they can be found out by parsing its source."""
+        path = self.find_source(module_name)
+        if path is not None:
+            return self.index.get_names(path) or []
+        if self._server is not None:
+            try:
+                return self._server.static_attr_names(module_name)
+            except TimeoutError as e:
+                logger.debug("Module server did not answer in time: %s", e)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self._server_failed(e)
+        return []
+
+    def find_source(self, module_name: str) -> str | None:
+        """Locate the source file of a module from the directory listings in
+        the index, without importing any of its parent packages."""
+        if module_name not in self.modules:
+            return None
+        dirs = [str(root) for root in self._roots]
+        *packages, name = module_name.split(".")
+        for package in packages:
+            # a namespace package may be spread over several directories
+            package_dirs = []
+            for path in dirs:
+                listing = self.index.directories.get(path)
+                if listing is None:
+                    continue
+                if package in listing.modules:
+                    break
+                package_path = dict(listing.packages).get(package)
+                if package_path is not None:
+                    package_dirs.append(package_path)
+                    if _is_regular_package(package_path):
+                        break
+            if not package_dirs:
+                return None
+            dirs = package_dirs
+
+        for path in dirs:
+            listing = self.index.directories.get(path)
+            if listing is None:
+                continue
+            if name in listing.modules:
+                candidate = os.path.join(path, f"{name}.py")
+            else:
+                package_path = dict(listing.packages).get(name)
+                if package_path is None:
+                    continue
+                candidate = os.path.join(package_path, "__init__.py")
+            # extension modules and bytecode can not be parsed
+            return candidate if os.path.isfile(candidate) else None
+        return None
 
     def module_attr_matches(self, name: str) -> set[str]:
         """Only attributes which are modules to replace name with"""
@@ -162,96 +900,345 @@ class ModuleGatherer:
         else:
             return None
 
-    def find_modules(self, path: Path) -> Generator[str | None, None, None]:
-        """Find all modules (and packages) for a given directory."""
-        if not path.is_dir():
-            # Perhaps a zip file
-            return
-        if any(fnmatch.fnmatch(path.name, entry) for entry in self.skiplist):
-            # Path is on skiplist
+    def _is_skiplisted(self, name: str) -> bool:
+        return self._skiplist_match(name)
+
+    def _load_from_index(self, roots: Iterable[Path]) -> None:
+        """Make the modules recorded in the index available before the
+        directories have been checked for changes."""
+        if not self.index.directories:
             return
 
-        finder = importlib.machinery.FileFinder(str(path), *LOADERS)  # type: ignore
-        try:
-            for p in path.iterdir():
-                if p.name.startswith(".") or p.name == "__pycache__":
-                    # Impossible to import from names starting with . and we can skip __pycache__
-                    continue
-                elif any(
-                    fnmatch.fnmatch(p.name, entry) for entry in self.skiplist
-                ):
-                    # Path is on skiplist
-                    continue
-                elif not any(p.name.endswith(suffix) for suffix in SUFFIXES):
-                    # Possibly a package
-                    if "." in p.name:
-                        continue
-                elif p.is_dir():
-                    # Unfortunately, CPython just crashes if there is a directory
-                    # which ends with a python extension, so work around.
-                    continue
-                name = p.name
-                for suffix in SUFFIXES:
-                    if name.endswith(suffix):
-                        name = name[: -len(suffix)]
-                        break
-                if name == "badsyntax_pep3120":
-                    # Workaround for issue #166
-                    continue
+        seen: set[_LoadedInode] = set()
 
-                package_pathname = None
-                try:
-                    with warnings.catch_warnings():
-                        warnings.simplefilter("ignore", ImportWarning)
-                        spec = finder.find_spec(name)
-                        if spec is None:
-                            continue
-                        if spec.submodule_search_locations is not None:
-                            package_pathname = spec.submodule_search_locations[
-                                0
-                            ]
-                except (ImportError, OSError, SyntaxError, UnicodeEncodeError):
-                    # UnicodeEncodeError happens with Python 3 when there is a filename in some invalid encoding
-                    continue
+        def walk(path: str) -> Generator[str, None, None]:
+            listing = self.index.directories.get(path)
+            if listing is None:
+                return
+            yield from listing.modules
+            for name, package_path in listing.packages:
+                package = self.index.directories.get(package_path)
+                if package is not None:
+                    loaded_inode = package.stamp.loaded_inode
+                    if loaded_inode not in seen:
+                        seen.add(loaded_inode)
+                        for subname in walk(package_path):
+                            if subname != "__init__":
+                                yield f"{name}.{subname}"
+                yield name
+
+        for root in roots:
+            if not self._is_skiplisted(root.name):
+                self._stale_modules.update(walk(str(root)))
+        self._stale_modules = {
+            name for name in self._stale_modules if name not in self.modules
+        }
+        self.modules.update(self._stale_modules)
 
-                if package_pathname is not None:
-                    path_real = Path(package_pathname).resolve()
+    def _scan_directory(
+        self, path: str, stamp: _DirectoryStamp
+    ) -> _DirectoryListing | None:
+        """List the modules and packages directly inside a directory.
+
+        Only the information cached in the directory entries is used, so
+        this does not need to stat every file on most platforms."""
+        listing = _DirectoryListing(stamp)
+        is_skiplisted = self._skiplist_match
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    name = entry.name
+                    if name.startswith(".") or name == "__pycache__":
+                        # Impossible to import from names starting with . and we can skip __pycache__
+                        continue
+                    elif is_skiplisted(name):
+                        # Path is on skiplist
+                        continue
                     try:
-                        stat = path_real.stat()
+                        is_dir = entry.is_dir()
+                        if not is_dir and not entry.is_file():
+                            continue
                     except OSError:
                         continue
-                    loaded_inode = _LoadedInode(stat.st_dev, stat.st_ino)
-                    if loaded_inode not in self.paths:
-                        self.paths.add(loaded_inode)
-                        for subname in self.find_modules(path_real):
-                            if subname is None:
-                                yield None  # take a break to avoid unresponsiveness
-                            elif subname != "__init__":
-                                yield f"{name}.{subname}"
-                yield name
-        except OSError:
+
+                    if is_dir:
+                        # Every directory is at least a namespace package.
+                        # CPython just crashes if there is a directory
+                        # which ends with a python extension, so skip names
+                        # containing dots.
+                        if "." not in name:
+                            listing.packages.append((name, entry.path))
+                        continue
+                    for suffix in _MODULE_SUFFIXES:
+                        if name.endswith(suffix):
+                            name = name[: -len(suffix)]
+                            break
+                    else:
+                        continue
+                    if not name or "." in name:
+                        continue
+                    if name == "badsyntax_pep3120":
+                        # Workaround for issue #166
+                        continue
+                    listing.modules.append(name)
+        except (OSError, UnicodeEncodeError):
             # Path is not readable
-            return
+            # UnicodeEncodeError happens with Python 3 when there is a filename in some invalid encoding
+            return None
+
+        if listing.packages and listing.modules:
+            # A module shadows a namespace package of the same name
+            modules = set(listing.modules)
+            listing.packages = [
+                (name, package_path)
+                for name, package_path in listing.packages
+                if name not in modules or _is_regular_package(package_path)
+            ]
+        return listing
+
+    def _list_directory(
+        self, path: str
+    ) -> tuple[_DirectoryStamp, _DirectoryListing | None] | None:
+        """Return the stamp and listing of a directory, rescanning it only
+        if it changed since it was last indexed.
+
+        This is executed on the worker threads."""
+        stamp = _stat_directory(path)
+        if stamp is None:
+            return None
+        listing = self.index.get(path, stamp)
+        if listing is None:
+            listing = self._scan_directory(path, stamp)
+            if listing is not None:
+                self.index.put(path, listing)
+        return stamp, listing
+
+    def _scan_archive(
+        self, archive: str, inner: str, stamp: _DirectoryStamp
+    ) -> _DirectoryListing | None:
+        """List all modules and packages inside a zip archive, as zipimport
+        would find them.
+
+        Only the central directory of the archive is read, nothing is
+        extracted."""
+        try:
+            with zipfile.ZipFile(archive) as zf:
+                names = zf.namelist()
+        except (OSError, zipfile.BadZipFile, ValueError):
+            # not a zip file
+            return None
+
+        prefix = f"{inner.strip('/')}/" if inner else ""
+        modules: set[str] = set()
+        for filename in names:
+            if not filename.startswith(prefix):
+                continue
+            *dirs, name = filename[len(prefix) :].split("/")
+            if not all(
+                part.isidentifier()
+                and part != "__pycache__"
+                and not self._is_skiplisted(part)
+                for part in dirs
+            ):
+                continue
+            # every directory is at least a namespace package
+            modules.update(".".join(dirs[: i + 1]) for i in range(len(dirs)))
+            for suffix in (".py", ".pyc"):
+                if name.endswith(suffix):
+                    name = name[: -len(suffix)]
+                    break
+            else:
+                continue
+            if (
+                not name.isidentifier()
+                or name in ("__init__", "badsyntax_pep3120")
+                or self._is_skiplisted(name)
+            ):
+                continue
+            modules.add(".".join((*dirs, name)))
+        return _DirectoryListing(stamp, sorted(modules))
+
+    def _list_root(
+        self, path: str
+    ) -> tuple[_DirectoryStamp, _DirectoryListing | None] | None:
+        """Like _list_directory, but entries of the search path may also be
+        zip archives or directories inside of them."""
+        result = self._list_directory(path)
+        if result is not None:
+            return result
+        archive = _split_archive_path(path)
+        if archive is None:
+            return None
+        try:
+            stamp = _DirectoryStamp.from_stat(os.stat(archive[0]))
+        except OSError:
+            return None
+        listing = self.index.get(path, stamp)
+        if listing is None:
+            listing = self._scan_archive(*archive, stamp)
+            if listing is not None:
+                self.index.put(path, listing)
+        return stamp, listing
+
+    def _submit(
+        self, path: str, root: bool = False
+    ) -> Future[tuple[_DirectoryStamp, _DirectoryListing | None] | None]:
+        """Schedule listing a directory on the thread pool."""
+        fn = self._list_root if root else self._list_directory
+        if self.max_workers == 0:
+            future: Future = Future()
+            future.set_result(fn(path))
+            return future
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                self.max_workers, thread_name_prefix="bpython-modules"
+            )
+        return self._executor.submit(fn, path)
+
+    def _shutdown_executor(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _find_modules_in(
+        self, listing: _DirectoryListing
+    ) -> Generator[str | None, None, None]:
+        """Find all modules (and packages) in a directory listing.
+
+        Listings of packages are requested from the thread pool ahead of time,
+        but they are visited in order so that the first path leading to a
+        package is the one that is reported."""
+        yield from listing.modules
+        pending = [
+            (name, self._submit(package_path))
+            for name, package_path in listing.packages
+        ]
+        for name, future in pending:
+            while not _wait_for(future):
+                yield None  # take a break to avoid unresponsiveness
+            result = future.result()
+            if result is None:
+                continue
+            package_stamp, package_listing = result
+            loaded_inode = package_stamp.loaded_inode
+            if loaded_inode not in self.paths:
+                self.paths.add(loaded_inode)
+                if package_listing is not None:
+                    for subname in self._find_modules_in(package_listing):
+                        if subname is None:
+                            yield None  # take a break to avoid unresponsiveness
+                        elif subname != "__init__":
+                            yield f"{name}.{subname}"
+            yield name
         yield None  # take a break to avoid unresponsiveness
 
+    def find_modules(self, path: Path) -> Generator[str | None, None, None]:
+        """Find all modules (and packages) for a given directory or zip
+        archive."""
+        if self._is_skiplisted(path.name):
+            # Path is on skiplist
+            return
+        result = self._list_root(str(path))
+        if result is None or result[1] is None:
+            return
+        yield from self._find_modules_in(result[1])
+
     def find_all_modules(
         self, paths: Iterable[Path]
     ) -> Generator[None, None, None]:
         """Return a list with all modules in `path`, which should be a list of
         directory names. If path is not given, sys.path will be used."""
 
-        for p in paths:
-            for module in self.find_modules(p):
-                if module is not None:
-                    self.modules.add(module)
-                yield
+        try:
+            # list all paths concurrently, but visit them in order
+            pending = [
+                self._submit(str(p), root=True)
+                for p in paths
+                if not self._is_skiplisted(p.name)
+            ]
+            self._paths_done = self._paths_total - len(pending)
+            for future in pending:
+                while not _wait_for(future):
+                    yield
+                result = future.result()
+                if result is not None and result[1] is not None:
+                    for module in self._find_modules_in(result[1]):
+                        if module is not None:
+                            self.modules.add(module)
+                            self._stale_modules.discard(module)
+                        yield
+                self._paths_done += 1
+        finally:
+            self._shutdown_executor()
+
+        # everything that is still stale has been removed since the index
+        # was written
+        self.modules.difference_update(self._stale_modules)
+        self._stale_modules.clear()
+        self.index.save()
+
+    def _search_roots(self) -> list[Path]:
+        paths = sys.path if self._search_path is None else self._search_path
+        return [
+            root
+            for root in _resolve_paths(paths)
+            if root not in self._server_paths
+        ]
+
+    def _server_failed(self, e: Exception) -> None:
+        """Stop using the server and search its directories here."""
+        assert self._server is not None
+        logger.debug("Module server failed, searching locally: %s", e)
+        self._server.close()
+        self._server = None
+        self._server_paths = frozenset()
+        self.refresh()
+
+    def save_index(self) -> None:
+        """Store names of modules parsed since the search finished."""
+        if self.fully_loaded:
+            self.index.save()
+
+    def refresh(self) -> bool:
+        """Restart the search for modules if directories were added to or
+        removed from the search path, or if their contents changed.
+
+        The search starts over from the roots, but only directories whose
+        modification time changed are listed again, the listings of all
+        others are taken from the index. The modules found so far stay
+        available until the new search is complete. Returns whether a new
+        search was started."""
+        roots = self._search_roots()
+        root_stamps = _stat_roots(roots)
+        if roots == self._roots and root_stamps == self._root_stamps:
+            return False
+
+        self.find_iterator.close()
+        self._roots = roots
+        self._root_stamps = root_stamps
+        self.paths = set()
+        self.fully_loaded = False
+        self._paths_done = 0
+        self._paths_total = len(roots)
+        self._stale_modules = {
+            name for name in self.modules if name not in self._builtin_modules
+        }
+        self.find_iterator = self.find_all_modules(roots)
+        return True
+
+    def find_coroutine(self, budget: float = 0) -> bool:
+        """Continue searching for modules.
 
-    def find_coroutine(self) -> bool:
+        At least one step of the search is performed, and further steps for
+        up to `budget` seconds. Returns False once the search is complete."""
         if self.fully_loaded:
             return False
 
+        deadline = time.monotonic() + budget
         try:
             next(self.find_iterator)
+            while time.monotonic() < deadline:
+                next(self.find_iterator)
         except StopIteration:
             self.fully_loaded = True
 
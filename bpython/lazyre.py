@@ -24,6 +24,7 @@ import re
 from collections.abc import Iterator
 from functools import cached_property
 from re import Pattern, Match
+from typing import Any
 
 
 class LazyReCompile:
@@ -43,11 +44,17 @@ class LazyReCompile:
     def finditer(self, *args, **kwargs) -> Iterator[Match[str]]:
         return self.compiled.finditer(*args, **kwargs)
 
+    def findall(self, *args, **kwargs) -> list[Any]:
+        return self.compiled.findall(*args, **kwargs)
+
     def search(self, *args, **kwargs) -> Match[str] | None:
         return self.compiled.search(*args, **kwargs)
 
     def match(self, *args, **kwargs) -> Match[str] | None:
         return self.compiled.match(*args, **kwargs)
 
+    def fullmatch(self, *args, **kwargs) -> Match[str] | None:
+        return self.compiled.fullmatch(*args, **kwargs)
+
     def sub(self, *args, **kwargs) -> str:
         return self.compiled.sub(*args, **kwargs)
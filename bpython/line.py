@@ -2,17 +2,24 @@
 
 All functions take cursor offset from the beginning of the line and the line of
 Python code, and return None, or a tuple of the start index, end index, and the
-word."""
+word.
 
+The portions are found by a LineAnalysis of the line, which is shared by all
+functions called for the same line and cursor offset, e.g. by all completers
+on a keystroke."""
+
+import functools
 import re
 
 from dataclasses import dataclass
+from functools import cached_property
 from itertools import chain
 
 from .lazyre import LazyReCompile
 
 
-@dataclass
+# frozen, as the parts are shared by everyone analysing the same line
+@dataclass(frozen=True)
 class LinePart:
     start: int
     stop: int
@@ -22,29 +29,13 @@ class LinePart:
 _current_word_re = LazyReCompile(r"(?<![)\]\w_.])" r"([\w_][\w0-9._]*[(]?)")
 CHARACTER_PAIR_MAP = {"(": ")", "{": "}", "[": "]", "'": "'", '"': '"'}
 
-
-def current_word(cursor_offset: int, line: str) -> LinePart | None:
-    """the object.attribute.attribute just before or under the cursor"""
-    start = cursor_offset
-    end = cursor_offset
-    word = None
-    for m in _current_word_re.finditer(line):
-        if m.start(1) < cursor_offset <= m.end(1):
-            start = m.start(1)
-            end = m.end(1)
-            word = m.group(1)
-    if word is None:
-        return None
-    return LinePart(start, end, word)
-
-
 # pieces of regex to match repr() of several hashable built-in types
 _match_all_dict_keys = r"""[^\]]*"""
 
 # https://docs.python.org/3/reference/lexical_analysis.html#string-and-bytes-literals
 _match_single_quote_str_bytes = r"""
     # bytes repr() begins with `b` character; bytes and str begin with `'`
-    b?'             
+    b?'
     # match escape sequence; this handles `\'` in the string repr()
     (?:\\['"nabfrtvxuU\\]|
     # or match any non-`\` and non-single-quote character (most of the string)
@@ -63,106 +54,263 @@ _match_double_quote_str_bytes = r"""
     # end matching at closing double-quote if one is present
     "?"""
 
-# match valid identifier name followed by `[` character
-_match_dict_before_key = r"""[\w_][\w0-9._]*\["""
+# capture valid identifier name if followed by `[` character
+_capture_dict_name = r"""([\w_][\w0-9._]*)\["""
 
-_current_dict_key_re = LazyReCompile(
-    f"{_match_dict_before_key}((?:"
+_current_dict_re = LazyReCompile(
+    f"{_capture_dict_name}((?:"
     f"{_match_single_quote_str_bytes}|"
     f"{_match_double_quote_str_bytes}|"
     f"{_match_all_dict_keys}|)*)",
     re.VERBOSE,
 )
 
+_current_string_re = LazyReCompile(
+    '''(?P<open>(?:""")|"|(?:''\')|')(?:((?P<closed>.+?)(?P=open))|'''
+    """(?P<unclosed>.+))"""
+)
 
-def current_dict_key(cursor_offset: int, line: str) -> LinePart | None:
-    """If in dictionary completion, return the current key"""
-    for m in _current_dict_key_re.finditer(line):
-        if m.start(1) <= cursor_offset <= m.end(1):
-            return LinePart(m.start(1), m.end(1), m.group(1))
-    return None
+_current_object_re = LazyReCompile(r"([\w_][\w0-9_]*)[.]")
 
+_current_object_attribute_re = LazyReCompile(r"([\w_][\w0-9_]*)[.]?")
 
-# capture valid identifier name if followed by `[` character
-_capture_dict_name = r"""([\w_][\w0-9._]*)\["""
+_current_from_import_from_re = LazyReCompile(
+    r"from +([\w0-9_.]*)(?:\s+import\s+([\w0-9_]+[,]?\s*)+)*"
+)
 
-_current_dict_re = LazyReCompile(
-    f"{_capture_dict_name}((?:"
-    f"{_match_single_quote_str_bytes}|"
-    f"{_match_double_quote_str_bytes}|"
-    f"{_match_all_dict_keys}|)*)",
-    re.VERBOSE,
+_current_from_import_import_re_1 = LazyReCompile(
+    r"from\s+([\w0-9_.]*)\s+import"
 )
+_current_from_import_import_re_2 = LazyReCompile(r"([\w0-9_]+)")
+_current_from_import_import_re_3 = LazyReCompile(r", *([\w0-9_]*)")
 
+_current_import_re_1 = LazyReCompile(r"import")
+_current_import_re_2 = LazyReCompile(r"([\w0-9_.]+)")
+_current_import_re_3 = LazyReCompile(r"[,][ ]*([\w0-9_.]*)")
 
-def current_dict(cursor_offset: int, line: str) -> LinePart | None:
-    """If in dictionary completion, return the dict that should be used"""
-    for m in _current_dict_re.finditer(line):
-        if m.start(2) <= cursor_offset <= m.end(2):
-            return LinePart(m.start(1), m.end(1), m.group(1))
-    return None
+_current_method_definition_name_re = LazyReCompile(r"def\s+([a-zA-Z_][\w]*)")
 
+_current_single_word_re = LazyReCompile(r"(?<![.])\b([a-zA-Z_][\w]*)")
 
-_current_string_re = LazyReCompile(
-    '''(?P<open>(?:""")|"|(?:''\')|')(?:((?P<closed>.+?)(?P=open))|'''
-    """(?P<unclosed>.+))"""
+_current_expression_attribute_re = LazyReCompile(
+    r"[.]\s*((?:[\w_][\w0-9_]*)|(?:))"
 )
 
 
+class LineAnalysis:
+    """The portions of a line around the cursor, each found at most once.
+
+    Portions which are derived from each other share their search, and the
+    searches are skipped for lines without the characters or keywords they
+    need, e.g. a `[` for dictionary keys."""
+
+    def __init__(self, cursor_offset: int, line: str) -> None:
+        self.cursor_offset = cursor_offset
+        self.line = line
+
+    @cached_property
+    def current_word(self) -> LinePart | None:
+        start = self.cursor_offset
+        end = self.cursor_offset
+        word = None
+        for m in _current_word_re.finditer(self.line):
+            if m.start(1) < self.cursor_offset <= m.end(1):
+                start = m.start(1)
+                end = m.end(1)
+                word = m.group(1)
+        if word is None:
+            return None
+        return LinePart(start, end, word)
+
+    @cached_property
+    def _dict_and_key(self) -> tuple[LinePart, LinePart] | None:
+        if "[" not in self.line:
+            return None
+        for m in _current_dict_re.finditer(self.line):
+            if m.start(2) <= self.cursor_offset <= m.end(2):
+                return (
+                    LinePart(m.start(1), m.end(1), m.group(1)),
+                    LinePart(m.start(2), m.end(2), m.group(2)),
+                )
+        return None
+
+    @property
+    def current_dict_key(self) -> LinePart | None:
+        parts = self._dict_and_key
+        return parts[1] if parts is not None else None
+
+    @property
+    def current_dict(self) -> LinePart | None:
+        parts = self._dict_and_key
+        return parts[0] if parts is not None else None
+
+    @cached_property
+    def current_string(self) -> LinePart | None:
+        if "'" not in self.line and '"' not in self.line:
+            return None
+        for m in _current_string_re.finditer(self.line):
+            i = 3 if m.group(3) else 4
+            if m.start(i) <= self.cursor_offset <= m.end(i):
+                return LinePart(m.start(i), m.end(i), m.group(i))
+        return None
+
+    @cached_property
+    def current_object(self) -> LinePart | None:
+        match = self.current_word
+        if match is None or "." not in match.word:
+            return None
+        s = ".".join(
+            m.group(1)
+            for m in _current_object_re.finditer(match.word)
+            if m.end(1) + match.start < self.cursor_offset
+        )
+        if not s:
+            return None
+        return LinePart(match.start, match.start + len(s), s)
+
+    @cached_property
+    def current_object_attribute(self) -> LinePart | None:
+        match = self.current_word
+        if match is None:
+            return None
+        matches = _current_object_attribute_re.finditer(match.word)
+        next(matches)
+        for m in matches:
+            if (
+                m.start(1) + match.start
+                <= self.cursor_offset
+                <= m.end(1) + match.start
+            ):
+                return LinePart(
+                    m.start(1) + match.start,
+                    m.end(1) + match.start,
+                    m.group(1),
+                )
+        return None
+
+    @cached_property
+    def current_from_import_from(self) -> LinePart | None:
+        # TODO allow for as's
+        if "from" not in self.line:
+            return None
+        for m in _current_from_import_from_re.finditer(self.line):
+            if (m.start(1) < self.cursor_offset <= m.end(1)) or (
+                m.start(2) < self.cursor_offset <= m.end(2)
+            ):
+                return LinePart(m.start(1), m.end(1), m.group(1))
+        return None
+
+    @cached_property
+    def current_from_import_import(self) -> LinePart | None:
+        if "from" not in self.line:
+            return None
+        baseline = _current_from_import_import_re_1.search(self.line)
+        if baseline is None:
+            return None
+        rest = self.line[baseline.end() :]
+        match1 = _current_from_import_import_re_2.search(rest)
+        if match1 is None:
+            return None
+        for m in chain(
+            (match1,), _current_from_import_import_re_3.finditer(rest)
+        ):
+            start = baseline.end() + m.start(1)
+            end = baseline.end() + m.end(1)
+            if start < self.cursor_offset <= end:
+                return LinePart(start, end, m.group(1))
+        return None
+
+    @cached_property
+    def current_import(self) -> LinePart | None:
+        # TODO allow for multiple as's
+        baseline = _current_import_re_1.search(self.line)
+        if baseline is None:
+            return None
+        rest = self.line[baseline.end() :]
+        match1 = _current_import_re_2.search(rest)
+        if match1 is None:
+            return None
+        for m in chain((match1,), _current_import_re_3.finditer(rest)):
+            start = baseline.end() + m.start(1)
+            end = baseline.end() + m.end(1)
+            if start < self.cursor_offset <= end:
+                return LinePart(start, end, m.group(1))
+        return None
+
+    @cached_property
+    def current_method_definition_name(self) -> LinePart | None:
+        if "def" not in self.line:
+            return None
+        for m in _current_method_definition_name_re.finditer(self.line):
+            if m.start(1) <= self.cursor_offset <= m.end(1):
+                return LinePart(m.start(1), m.end(1), m.group(1))
+        return None
+
+    @cached_property
+    def current_single_word(self) -> LinePart | None:
+        for m in _current_single_word_re.finditer(self.line):
+            if m.start(1) <= self.cursor_offset <= m.end(1):
+                return LinePart(m.start(1), m.end(1), m.group(1))
+        return None
+
+    @property
+    def current_dotted_attribute(self) -> LinePart | None:
+        match = self.current_word
+        if match is not None and "." in match.word[1:]:
+            return match
+        return None
+
+    @cached_property
+    def current_expression_attribute(self) -> LinePart | None:
+        if "." not in self.line:
+            return None
+        for m in _current_expression_attribute_re.finditer(self.line):
+            if m.start(1) <= self.cursor_offset <= m.end(1):
+                return LinePart(m.start(1), m.end(1), m.group(1))
+        return None
+
+
+@functools.lru_cache(maxsize=16)
+def analyze(cursor_offset: int, line: str) -> LineAnalysis:
+    """The analysis of line, shared by all callers with the same line and
+    cursor offset."""
+    return LineAnalysis(cursor_offset, line)
+
+
+def current_word(cursor_offset: int, line: str) -> LinePart | None:
+    """the object.attribute.attribute just before or under the cursor"""
+    return analyze(cursor_offset, line).current_word
+
+
+def current_dict_key(cursor_offset: int, line: str) -> LinePart | None:
+    """If in dictionary completion, return the current key"""
+    return analyze(cursor_offset, line).current_dict_key
+
+
+def current_dict(cursor_offset: int, line: str) -> LinePart | None:
+    """If in dictionary completion, return the dict that should be used"""
+    return analyze(cursor_offset, line).current_dict
+
+
 def current_string(cursor_offset: int, line: str) -> LinePart | None:
     """If inside a string of nonzero length, return the string (excluding
     quotes)
 
     Weaker than bpython.Repl's current_string, because that checks that a
     string is a string based on previous lines in the buffer."""
-    for m in _current_string_re.finditer(line):
-        i = 3 if m.group(3) else 4
-        if m.start(i) <= cursor_offset <= m.end(i):
-            return LinePart(m.start(i), m.end(i), m.group(i))
-    return None
-
-
-_current_object_re = LazyReCompile(r"([\w_][\w0-9_]*)[.]")
+    return analyze(cursor_offset, line).current_string
 
 
 def current_object(cursor_offset: int, line: str) -> LinePart | None:
     """If in attribute completion, the object on which attribute should be
     looked up."""
-    match = current_word(cursor_offset, line)
-    if match is None:
-        return None
-    s = ".".join(
-        m.group(1)
-        for m in _current_object_re.finditer(match.word)
-        if m.end(1) + match.start < cursor_offset
-    )
-    if not s:
-        return None
-    return LinePart(match.start, match.start + len(s), s)
-
-
-_current_object_attribute_re = LazyReCompile(r"([\w_][\w0-9_]*)[.]?")
+    return analyze(cursor_offset, line).current_object
 
 
 def current_object_attribute(cursor_offset: int, line: str) -> LinePart | None:
     """If in attribute completion, the attribute being completed"""
     # TODO replace with more general current_expression_attribute
-    match = current_word(cursor_offset, line)
-    if match is None:
-        return None
-    matches = _current_object_attribute_re.finditer(match.word)
-    next(matches)
-    for m in matches:
-        if m.start(1) + match.start <= cursor_offset <= m.end(1) + match.start:
-            return LinePart(
-                m.start(1) + match.start, m.end(1) + match.start, m.group(1)
-            )
-    return None
-
-
-_current_from_import_from_re = LazyReCompile(
-    r"from +([\w0-9_.]*)(?:\s+import\s+([\w0-9_]+[,]?\s*)+)*"
-)
+    return analyze(cursor_offset, line).current_object_attribute
 
 
 def current_from_import_from(cursor_offset: int, line: str) -> LinePart | None:
@@ -171,20 +319,7 @@ def current_from_import_from(cursor_offset: int, line: str) -> LinePart | None:
     returns None if cursor not in or just after one of the two interesting
     parts of an import: from (module) import (name1, name2)
     """
-    # TODO allow for as's
-    for m in _current_from_import_from_re.finditer(line):
-        if (m.start(1) < cursor_offset <= m.end(1)) or (
-            m.start(2) < cursor_offset <= m.end(2)
-        ):
-            return LinePart(m.start(1), m.end(1), m.group(1))
-    return None
-
-
-_current_from_import_import_re_1 = LazyReCompile(
-    r"from\s+([\w0-9_.]*)\s+import"
-)
-_current_from_import_import_re_2 = LazyReCompile(r"([\w0-9_]+)")
-_current_from_import_import_re_3 = LazyReCompile(r", *([\w0-9_]*)")
+    return analyze(cursor_offset, line).current_from_import_from
 
 
 def current_from_import_import(
@@ -194,81 +329,28 @@ def current_from_import_import(
 
     returns None if cursor not in or just after one of these words
     """
-    baseline = _current_from_import_import_re_1.search(line)
-    if baseline is None:
-        return None
-    match1 = _current_from_import_import_re_2.search(line[baseline.end() :])
-    if match1 is None:
-        return None
-    for m in chain(
-        (match1,),
-        _current_from_import_import_re_3.finditer(line[baseline.end() :]),
-    ):
-        start = baseline.end() + m.start(1)
-        end = baseline.end() + m.end(1)
-        if start < cursor_offset <= end:
-            return LinePart(start, end, m.group(1))
-    return None
-
-
-_current_import_re_1 = LazyReCompile(r"import")
-_current_import_re_2 = LazyReCompile(r"([\w0-9_.]+)")
-_current_import_re_3 = LazyReCompile(r"[,][ ]*([\w0-9_.]*)")
+    return analyze(cursor_offset, line).current_from_import_import
 
 
 def current_import(cursor_offset: int, line: str) -> LinePart | None:
-    # TODO allow for multiple as's
-    baseline = _current_import_re_1.search(line)
-    if baseline is None:
-        return None
-    match1 = _current_import_re_2.search(line[baseline.end() :])
-    if match1 is None:
-        return None
-    for m in chain(
-        (match1,), _current_import_re_3.finditer(line[baseline.end() :])
-    ):
-        start = baseline.end() + m.start(1)
-        end = baseline.end() + m.end(1)
-        if start < cursor_offset <= end:
-            return LinePart(start, end, m.group(1))
-    return None
-
-
-_current_method_definition_name_re = LazyReCompile(r"def\s+([a-zA-Z_][\w]*)")
+    return analyze(cursor_offset, line).current_import
 
 
 def current_method_definition_name(
     cursor_offset: int, line: str
 ) -> LinePart | None:
     """The name of a method being defined"""
-    for m in _current_method_definition_name_re.finditer(line):
-        if m.start(1) <= cursor_offset <= m.end(1):
-            return LinePart(m.start(1), m.end(1), m.group(1))
-    return None
-
-
-_current_single_word_re = LazyReCompile(r"(?<![.])\b([a-zA-Z_][\w]*)")
+    return analyze(cursor_offset, line).current_method_definition_name
 
 
 def current_single_word(cursor_offset: int, line: str) -> LinePart | None:
     """the un-dotted word just before or under the cursor"""
-    for m in _current_single_word_re.finditer(line):
-        if m.start(1) <= cursor_offset <= m.end(1):
-            return LinePart(m.start(1), m.end(1), m.group(1))
-    return None
+    return analyze(cursor_offset, line).current_single_word
 
 
 def current_dotted_attribute(cursor_offset: int, line: str) -> LinePart | None:
     """The dotted attribute-object pair before the cursor"""
-    match = current_word(cursor_offset, line)
-    if match is not None and "." in match.word[1:]:
-        return match
-    return None
-
-
-_current_expression_attribute_re = LazyReCompile(
-    r"[.]\s*((?:[\w_][\w0-9_]*)|(?:))"
-)
+    return analyze(cursor_offset, line).current_dotted_attribute
 
 
 def current_expression_attribute(
@@ -276,10 +358,7 @@ def current_expression_attribute(
 ) -> LinePart | None:
     """If after a dot, the attribute being completed"""
     # TODO replace with more general current_expression_attribute
-    for m in _current_expression_attribute_re.finditer(line):
-        if m.start(1) <= cursor_offset <= m.end(1):
-            return LinePart(m.start(1), m.end(1), m.group(1))
-    return None
+    return analyze(cursor_offset, line).current_expression_attribute
 
 
 def cursor_on_closing_char_pair(
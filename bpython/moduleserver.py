@@ -0,0 +1,312 @@
+"""Module index server shared by all bpython sessions of an interpreter.
+
+The server searches the directories belonging to the interpreter
+installation for modules and answers import completion queries over a Unix
+domain socket. Sessions which can connect to it only search the remaining
+directories of their module search path, e.g. the working directory,
+themselves. Start it with `bpython-modules` or `python -m
+bpython.moduleserver`."""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import site
+import socket
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from . import __version__, translations
+from .config import Config, default_config_path, get_cache_home
+from .importcompletion import ModuleGatherer
+from .translations import _
+
+logger = logging.getLogger(__name__)
+
+# Version of the protocol spoken between server and clients. Bump whenever
+# requests or responses change.
+PROTOCOL_VERSION = 1
+
+# Seconds a session waits for an answer of the server
+CLIENT_TIMEOUT = 0.2
+
+# Seconds a session waits before reconnecting to a server which did not
+# answer in time
+RECONNECT_INTERVAL = 5.0
+
+
+def default_index_path() -> Path:
+    """Path of the module index of the running interpreter."""
+    return (
+        get_cache_home() / f"import-index-{sys.implementation.cache_tag}.json"
+    )
+
+
+def default_socket_path() -> Path:
+    """Path of the socket of the server for the running interpreter."""
+    prefix = hashlib.sha1(sys.prefix.encode("utf-8", "surrogateescape"))
+    return (
+        get_cache_home()
+        / f"modules-{sys.implementation.cache_tag}-{prefix.hexdigest()[:12]}.sock"
+    )
+
+
+def interpreter_paths() -> list[str]:
+    """Entries of sys.path belonging to the interpreter installation, as
+    opposed to the working directory or directories from PYTHONPATH."""
+    prefixes = {
+        Path(prefix).resolve()
+        for prefix in (
+            sys.prefix,
+            sys.exec_prefix,
+            sys.base_prefix,
+            sys.base_exec_prefix,
+            site.getuserbase(),
+        )
+    }
+    return [
+        path
+        for path in sys.path
+        if path
+        and any(Path(path).resolve().is_relative_to(p) for p in prefixes)
+    ]
+
+
+class ModuleIndexClient:
+    """Connection of a bpython session to a module index server.
+
+    All methods raise OSError or ValueError if the server does not answer
+    properly. If it does not answer within the timeout, they raise
+    TimeoutError and the connection is closed, since the answer might still
+    arrive and be taken for that to the next request. Queries then raise
+    TimeoutError right away until the connection is reopened after
+    RECONNECT_INTERVAL seconds."""
+
+    def __init__(self, path: Path, timeout: float = CLIENT_TIMEOUT) -> None:
+        self.path = path
+        self.timeout = timeout
+        self._socket: socket.socket | None = None
+        self._rfile: BinaryIO | None = None
+        # when to reopen the connection after the server did not answer
+        self._reconnect_at = 0.0
+        hello = self._connect()
+        # directories the server searches for modules
+        self.paths: list[str] = list(hello["paths"])
+
+    @classmethod
+    def connect(
+        cls, path: Path, timeout: float = CLIENT_TIMEOUT
+    ) -> "ModuleIndexClient | None":
+        """Connect to the server listening on path, or return None if there
+        is none."""
+        if not hasattr(socket, "AF_UNIX") or not path.exists():
+            return None
+        try:
+            return cls(path, timeout)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.debug("Could not connect to module server %s: %s", path, e)
+            return None
+
+    def close(self) -> None:
+        if self._rfile is not None:
+            self._rfile.close()
+            self._rfile = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _connect(self) -> dict[str, Any]:
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.settimeout(self.timeout)
+            self._socket.connect(str(self.path))
+            self._rfile = self._socket.makefile("rb")
+            hello = self._exchange({"op": "hello"})
+            if hello.get("version") != PROTOCOL_VERSION:
+                raise ValueError(
+                    f"unsupported protocol {hello.get('version')!r}"
+                )
+        except BaseException:
+            self.close()
+            raise
+        return hello
+
+    def _request(self, **request: Any) -> dict[str, Any]:
+        if self._socket is None and time.monotonic() < self._reconnect_at:
+            raise TimeoutError("module server did not answer in time")
+        try:
+            if self._socket is None:
+                self._connect()
+            return self._exchange(request)
+        except TimeoutError:
+            self.close()
+            self._reconnect_at = time.monotonic() + RECONNECT_INTERVAL
+            raise
+
+    def _exchange(self, request: dict[str, Any]) -> dict[str, Any]:
+        assert self._socket is not None and self._rfile is not None
+        self._socket.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        line = self._rfile.readline()
+        if not line:
+            raise ConnectionResetError("module server closed the connection")
+        response = json.loads(line)
+        if not isinstance(response, dict):
+            raise ValueError(f"invalid response {response!r}")
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response
+
+    def module_matches(self, cw: str, prefix: str = "") -> set[str]:
+        return set(
+            self._request(op="module_matches", cw=cw, prefix=prefix)["matches"]
+        )
+
+    def static_attr_names(self, module_name: str) -> list[str]:
+        return list(
+            self._request(op="static_attr_names", module=module_name)["names"]
+        )
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: "ModuleIndexServer"
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                response = self.server.respond(json.loads(line))
+            except (ValueError, KeyError, TypeError) as e:
+                response = {"error": f"invalid request: {e}"}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class ModuleIndexServer(socketserver.ThreadingUnixStreamServer):
+    """Serve the modules found by a ModuleGatherer to bpython sessions."""
+
+    daemon_threads = True
+
+    def __init__(self, path: Path, module_gatherer: ModuleGatherer) -> None:
+        self.module_gatherer = module_gatherer
+        # the gatherer is searching on the main thread while requests are
+        # handled on their own threads
+        self.lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # create the socket accessible to the user only right away, changing
+        # its mode after binding would leave it open to others in between
+        umask = os.umask(0o177)
+        try:
+            super().__init__(str(path), _RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def respond(self, request: dict[str, Any]) -> dict[str, Any]:
+        op = request.get("op")
+        if op == "hello":
+            with self.lock:
+                return {
+                    "version": PROTOCOL_VERSION,
+                    "paths": self.module_gatherer.search_paths,
+                }
+        elif op == "module_matches":
+            with self.lock:
+                matches = self.module_gatherer.module_matches(
+                    request["cw"], request["prefix"]
+                )
+            return {"matches": sorted(matches)}
+        elif op == "static_attr_names":
+            with self.lock:
+                path = self.module_gatherer.find_source(request["module"])
+            # parse the source without holding up the search and the other
+            # requests, the index can be used from several threads
+            names = (
+                self.module_gatherer.index.get_names(path)
+                if path is not None
+                else None
+            )
+            return {"names": names or []}
+        return {"error": f"unknown operation {op!r}"}
+
+    def run(self, budget: float, refresh_interval: float) -> None:
+        """Search for modules and keep the search up to date while serving
+        requests on a separate thread."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        try:
+            while True:
+                with self.lock:
+                    searching = self.module_gatherer.find_coroutine(budget)
+                if not searching:
+                    time.sleep(refresh_interval)
+                    self.module_gatherer.save_index()
+                    with self.lock:
+                        self.module_gatherer.refresh()
+        finally:
+            self.shutdown()
+            self.server_close()
+
+
+def main(args: list[str] | None = None) -> int:
+    translations.init()
+
+    parser = argparse.ArgumentParser(
+        description=_(
+            "Search the modules of this Python installation once and share "
+            "them with all bpython sessions for import completion."
+        )
+    )
+    parser.add_argument(
+        "--config",
+        default=default_config_path(),
+        type=Path,
+        help=_("Use CONFIG instead of default config file."),
+    )
+    parser.add_argument(
+        "--socket",
+        default=default_socket_path(),
+        type=Path,
+        help=_("Listen on SOCKET instead of the default socket."),
+    )
+    parser.add_argument(
+        "--refresh-interval",
+        default=5.0,
+        type=float,
+        help=_("Seconds between checks of the module search path."),
+    )
+    parser.add_argument(
+        "--version", action="version", version=f"%(prog)s {__version__}"
+    )
+    options = parser.parse_args(args)
+    config = Config(options.config)
+
+    client = ModuleIndexClient.connect(options.socket)
+    if client is not None:
+        client.close()
+        parser.exit(1, _("A module server is already running.") + "\n")
+    # a socket left behind by a server which did not exit cleanly
+    options.socket.unlink(missing_ok=True)
+
+    module_gatherer = ModuleGatherer(
+        interpreter_paths(),
+        skiplist=config.import_completion_skiplist,
+        cache_path=(
+            default_index_path() if config.import_completion_cache else None
+        ),
+    )
+    server = ModuleIndexServer(options.socket, module_gatherer)
+    try:
+        server.run(
+            config.import_completion_budget / 1000, options.refresh_interval
+        )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        options.socket.unlink(missing_ok=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
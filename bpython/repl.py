@@ -23,6 +23,7 @@
 
 import abc
 import code
+import functools
 import inspect
 import os
 import pkgutil
@@ -51,7 +52,7 @@ from typing import (
     Union,
     cast,
 )
-from collections.abc import Callable, Iterable
+from collections.abc import Callable, Iterable, Sequence
 
 from pygments.lexers import Python3Lexer
 from pygments.token import Token, _TokenType
@@ -62,7 +63,8 @@ try:
 except ImportError:
     have_pyperclip = False
 
-from . import autocomplete, inspection, simpleeval
+from . import autocomplete, highlight, inspection, simpleeval
+from .completionstats import CompletionStats, default_stats_path
 from .config import getpreferredencoding, Config
 from .formatter import Parenthesis
 from .history import History
@@ -71,6 +73,11 @@ from .paste import PasteHelper, PastePinnwand, PasteFailed
 from .patch_linecache import filename_for_console_input
 from .translations import _, ngettext
 from .importcompletion import ModuleGatherer
+from .moduleserver import (
+    ModuleIndexClient,
+    default_index_path,
+    default_socket_path,
+)
 
 
 class RuntimeTimer:
@@ -134,6 +141,9 @@ class Interpreter(code.InteractiveInterpreter):
 
         super().__init__(locals)
         self.timer = RuntimeTimer()
+        # number of times source has been run, to tell whether the namespace
+        # might have changed
+        self.generation = 0
 
     def runsource(
         self,
@@ -148,8 +158,11 @@ class Interpreter(code.InteractiveInterpreter):
 
         if filename is None:
             filename = filename_for_console_input(source)
-        with self.timer:
-            return super().runsource(source, filename, symbol)
+        try:
+            with self.timer:
+                return super().runsource(source, filename, symbol)
+        finally:
+            self.generation += 1
 
     def showsyntaxerror(self, filename: str | None = None, **kwargs) -> None:
         """Override the regular handler, the code's copied and pasted from
@@ -214,7 +227,18 @@ class MatchesIterator:
     A MatchesIterator can be `clear`ed to reset match iteration, and
     `update`ed to set what matches will be iterated over."""
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        on_accept: (
+            Callable[[autocomplete.BaseCompletionType, str, int, str], None]
+            | None
+        ) = None,
+    ) -> None:
+        # called with the completer, the match and the original cursor
+        # offset and line when a match is kept in the line, i.e. it was
+        # selected and the line was edited further while the match stayed in
+        # place
+        self.on_accept = on_accept
         # word being replaced in the original line of text
         self.current_word = ""
         # possible replacements for current_word
@@ -291,6 +315,7 @@ class MatchesIterator:
         cseq = os.path.commonprefix(self.matches)
         new_cursor_offset, new_line = self.substitute(cseq)
         if len(self.matches) == 1:
+            self._accept(self.matches[0])
             self.clear()
         else:
             self.update(
@@ -315,6 +340,7 @@ class MatchesIterator:
         if matches is None:
             raise ValueError("Matches may not be None.")
 
+        self._accept_if_kept(cursor_offset, current_line)
         self.orig_cursor_offset = cursor_offset
         self.orig_line = current_line
         self.matches = matches
@@ -326,7 +352,30 @@ class MatchesIterator:
         self.end = lp.stop
         self.current_word = lp.word
 
-    def clear(self) -> None:
+    def _accept(self, match: str) -> None:
+        if self.on_accept is not None and self.completer is not None:
+            self.on_accept(
+                self.completer, match, self.orig_cursor_offset, self.orig_line
+            )
+
+    def _accept_if_kept(self, cursor_offset: int, line: str) -> None:
+        """Accept the selected match if line still contains it where it was
+        substituted and the cursor is behind it."""
+        if self.index == -1 or self.start is None:
+            return
+        match = self.current()
+        end = self.start + len(match)
+        if line[self.start : end] == match and cursor_offset >= end:
+            self._accept(match)
+
+    def clear(
+        self, cursor_offset: int | None = None, line: str | None = None
+    ) -> None:
+        """Reset the matches. If the line and cursor offset after the
+        selected match was substituted are given, the match is accepted if
+        it has been kept."""
+        if cursor_offset is not None and line is not None:
+            self._accept_if_kept(cursor_offset, line)
         self.matches = []
         self.orig_cursor_offset = -1
         self.orig_line = ""
@@ -386,6 +435,20 @@ class _FuncExpr:
     keyword: str | None = None
 
 
+@dataclass
+class _CompletionPool:
+    """Matches found by the last full run of the completers, kept to narrow
+    them down while the word is typed instead of computing them again."""
+
+    completer: autocomplete.BaseCompletionType
+    line_prefix: str
+    word: str
+    interp: Interpreter
+    generation: int
+    namespace_size: int
+    matches: list[str]
+
+
 class Repl(metaclass=abc.ABCMeta):
     """Implements the necessary guff for a Python-repl-alike interface
 
@@ -477,6 +540,9 @@ class Repl(metaclass=abc.ABCMeta):
         self.config = config
         self.cut_buffer = ""
         self.buffer: list[str] = []
+        # tokens and brackets of the lines of the buffer and the current line
+        self._token_cache = highlight.LineTokenCache()
+        self._brackets = highlight.BracketIndex()
         self.interp = interp
         self.interp.syntaxerror_callback = self.clear_current_line
         self.match = False
@@ -490,7 +556,17 @@ class Repl(metaclass=abc.ABCMeta):
         self.history: list[str] = []
         self.redo_stack: list[str] = []
         self.evaluating = False
-        self.matches_iter = MatchesIterator()
+        self.matches_iter = MatchesIterator(on_accept=self._record_completion)
+        self.completion_stats: CompletionStats | None = (
+            CompletionStats() if config.autocomplete_ranking else None
+        )
+        self._completion_pool: _CompletionPool | None = None
+        # runs completers which might take long in the background, set by
+        # frontends which can show their matches once they are found
+        self.completion_worker: autocomplete.CompletionWorker | None = None
+        self._pending_completion: autocomplete.CompletionRequest | None = None
+        # the completers to try if the pending one does not apply
+        self._pending_completers: Sequence[autocomplete.BaseCompletionType] = ()
         self.funcprops = None
         self.arg_pos: str | int | None = None
         self.current_func = None
@@ -518,9 +594,26 @@ class Repl(metaclass=abc.ABCMeta):
                 )
             except OSError:
                 pass
+        if self.completion_stats is not None:
+            stats_file = default_stats_path(self.config.hist_file)
+            if stats_file.exists():
+                try:
+                    self.completion_stats.load(stats_file)
+                except OSError:
+                    pass
 
         self.module_gatherer = ModuleGatherer(
-            skiplist=self.config.import_completion_skiplist
+            skiplist=self.config.import_completion_skiplist,
+            cache_path=(
+                default_index_path()
+                if self.config.import_completion_cache
+                else None
+            ),
+            server=(
+                ModuleIndexClient.connect(default_socket_path())
+                if self.config.import_completion_server
+                else None
+            ),
         )
         self.completers = autocomplete.get_default_completer(
             config.autocomplete_mode, self.module_gatherer
@@ -780,20 +873,34 @@ class Repl(metaclass=abc.ABCMeta):
         """
 
         self.set_docstring()
+        self._pending_completion = None
 
-        matches, completer = autocomplete.get_completer(
-            self.completers,
-            cursor_offset=self.cursor_offset,
-            line=self.current_line,
-            locals_=cast(dict[str, Any], self.interp.locals),
-            argspec=self.funcprops,
-            current_block="\n".join(self.buffer + [self.current_line]),
-            complete_magic_methods=self.config.complete_magic_methods,
-            history=self.history,
-        )
+        narrowed = self._narrow_completion()
+        if narrowed is not None:
+            matches, completer = narrowed
+        else:
+            matches, completer = self._get_completer(
+                self.completers, background=not tab
+            )
+            if self._pending_completion is None:
+                self._store_completion_pool(
+                    matches, completer, self.cursor_offset, self.current_line
+                )
+            else:
+                # not all completers are done, so these matches must not be
+                # narrowed down on the next keystroke
+                self._completion_pool = None
 
+        return self._show_matches(matches, completer, tab)
+
+    def _show_matches(
+        self,
+        matches: list[str],
+        completer: autocomplete.BaseCompletionType | None,
+        tab: bool = False,
+    ) -> bool | None:
         if len(matches) == 0:
-            self.matches_iter.clear()
+            self.matches_iter.clear(self.cursor_offset, self.current_line)
             return bool(self.funcprops)
 
         if completer:
@@ -820,6 +927,209 @@ class Repl(metaclass=abc.ABCMeta):
         else:
             return False
 
+    def _completion_state(self) -> tuple[Any, ...]:
+        """Everything besides the current line the matches depend on."""
+        return (
+            tuple(self.buffer),
+            self.interp,
+            getattr(self.interp, "generation", 0),
+        )
+
+    def _get_completer(
+        self,
+        completers: Sequence[autocomplete.BaseCompletionType],
+        background: bool = True,
+    ) -> tuple[list[str], autocomplete.BaseCompletionType | None]:
+        return autocomplete.get_completer(
+            completers,
+            cursor_offset=self.cursor_offset,
+            line=self.current_line,
+            locals_=cast(dict[str, Any], self.interp.locals),
+            argspec=self.funcprops,
+            current_block="\n".join(self.buffer + [self.current_line]),
+            complete_magic_methods=self.config.complete_magic_methods,
+            generation=getattr(self.interp, "generation", None),
+            stats=self.completion_stats,
+            history=self.history,
+            run_in_background=(
+                self._complete_in_background
+                if background and self.completion_worker is not None
+                else None
+            ),
+        )
+
+    def _complete_in_background(
+        self, completers: Sequence[autocomplete.BaseCompletionType]
+    ) -> tuple[list[str], autocomplete.BaseCompletionType | None] | None:
+        """Run the first of completers on the completion worker and wait for
+        its matches for autocomplete_budget milliseconds.
+
+        If they are not found in time, None is returned so that the matches
+        of the completers after it are shown meanwhile, without running any
+        other completer in the background. The matches of the first one
+        replace them in `show_background_matches` once they are found.
+
+        Only completers which do not evaluate objects of the session run
+        here. Attribute completion runs on the main thread without a time
+        limit, so objects with an expensive `__dir__` or `__getattr__` still
+        block until their attributes are listed."""
+        assert self.completion_worker is not None
+        if self._pending_completion is not None:
+            # the worker only runs the latest request
+            return None
+        request = autocomplete.CompletionRequest(
+            self.cursor_offset,
+            self.current_line,
+            self._completion_state(),
+            # the namespace is not passed on, since objects of the user must
+            # only be evaluated on the main thread
+            functools.partial(
+                autocomplete.run_completer,
+                completers[0],
+                self.cursor_offset,
+                self.current_line,
+                stats=self.completion_stats,
+                funcprops=self.funcprops,
+                current_block="\n".join(self.buffer + [self.current_line]),
+                complete_magic_methods=self.config.complete_magic_methods,
+                generation=getattr(self.interp, "generation", None),
+                # the history may grow while the completer runs
+                history=list(self.history),
+            ),
+        )
+        self.completion_worker.submit(request)
+        try:
+            result = request.future.result(
+                timeout=self.config.autocomplete_budget / 1000
+            )
+        except TimeoutError:
+            self._pending_completion = request
+            self._pending_completers = completers[1:]
+            return None
+        except Exception:
+            return None
+        request.claimed = True
+        return result
+
+    def show_background_matches(self) -> bool | None:
+        """Show the matches found in the background since the last call if
+        they still apply.
+
+        The matches of the latest request are shown as they are if neither
+        the line nor the namespace changed in the meantime. Those of earlier
+        requests are narrowed down to the current word if possible while
+        the latest request is still running. Returns whether the list of
+        matches should be visible, or None if nothing changed."""
+        if self.completion_worker is None:
+            return None
+        visible = None
+        for request in self.completion_worker.done():
+            if request.claimed or request.future.exception() is not None:
+                continue
+            result = request.future.result()
+            if (
+                request.state != self._completion_state()
+                or self._pending_completion is None
+            ):
+                continue
+            if request is self._pending_completion:
+                if (
+                    request.cursor_offset != self.cursor_offset
+                    or request.line != self.current_line
+                ):
+                    continue
+                self._pending_completion = None
+                if result is None:
+                    # the completer does not apply, try the ones after it
+                    result = self._get_completer(self._pending_completers)
+                matches, completer = result
+                if self._pending_completion is None:
+                    self._store_completion_pool(
+                        matches, completer, request.cursor_offset, request.line
+                    )
+                else:
+                    self._completion_pool = None
+                visible = self._show_matches(matches, completer)
+            elif result is not None:
+                matches, completer = result
+                self._store_completion_pool(
+                    matches, completer, request.cursor_offset, request.line
+                )
+                narrowed = self._narrow_completion()
+                if narrowed is not None:
+                    visible = self._show_matches(*narrowed)
+        return visible
+
+    def _store_completion_pool(
+        self,
+        matches: list[str],
+        completer: autocomplete.BaseCompletionType | None,
+        cursor_offset: int,
+        line: str,
+    ) -> None:
+        self._completion_pool = None
+        if not matches or completer is None or self.buffer:
+            return
+        lpart = completer.locate(cursor_offset, line)
+        if lpart is None:
+            return
+        self._completion_pool = _CompletionPool(
+            completer,
+            line[: lpart.start],
+            lpart.word,
+            self.interp,
+            getattr(self.interp, "generation", 0),
+            len(self.interp.locals),
+            matches,
+        )
+
+    def _narrow_completion(
+        self,
+    ) -> tuple[list[str], autocomplete.BaseCompletionType | None] | None:
+        """Filter the matches of the last completion if the word has only
+        been extended since and nothing was run in between.
+
+        Returns None if the completers have to be run again."""
+        pool = self._completion_pool
+        if (
+            pool is None
+            # the Jedi completer takes over in multiline blocks
+            or self.buffer
+            or pool.interp is not self.interp
+            or pool.generation != getattr(self.interp, "generation", 0)
+            or pool.namespace_size != len(self.interp.locals)
+        ):
+            return None
+        completer = pool.completer
+        lpart = completer.locate(self.cursor_offset, self.current_line)
+        if (
+            lpart is None
+            or self.current_line[: lpart.start] != pool.line_prefix
+            or not completer.narrowable(pool.word, lpart.word)
+        ):
+            return None
+        candidates = {
+            match
+            for match in pool.matches
+            if completer.still_matches(match, lpart.word)
+        }
+        if isinstance(pool.matches, autocomplete.TruncatedMatchList):
+            candidates = autocomplete.TruncatedMatches(candidates)
+        matches = autocomplete.sort_matches(
+            candidates,
+            completer,
+            self.cursor_offset,
+            self.current_line,
+            self.completion_stats,
+        )
+        if not matches:
+            # the completers after this one might have matches
+            return None
+        self._store_completion_pool(
+            matches, completer, self.cursor_offset, self.current_line
+        )
+        return matches, completer
+
     def format_docstring(
         self, docstring: str, width: int, height: int
     ) -> list[str]:
@@ -1006,12 +1316,33 @@ class Repl(metaclass=abc.ABCMeta):
         return more
 
     def insert_into_history(self, s: str):
+        # a match selected before the line was run has been kept
+        self.matches_iter.clear(len(s), s)
         try:
             self.rl_history.append_reload_and_write(
                 s, self.config.hist_file, getpreferredencoding()
             )
         except RuntimeError as e:
             self.interact.notify(f"{e}")
+        if self.completion_stats is not None:
+            try:
+                self.completion_stats.reload_and_write(
+                    default_stats_path(self.config.hist_file)
+                )
+            except OSError:
+                pass
+
+    def _record_completion(
+        self,
+        completer: autocomplete.BaseCompletionType,
+        match: str,
+        cursor_offset: int,
+        line: str,
+    ) -> None:
+        if self.completion_stats is not None:
+            self.completion_stats.record(
+                autocomplete.stats_kind(completer, cursor_offset, line), match
+            )
 
     def prompt_undo(self) -> int:
         """Returns how many lines to undo, 0 means don't undo"""
@@ -1101,91 +1432,43 @@ class Repl(metaclass=abc.ABCMeta):
         - calls reprint_line with a buffer's line's tokens and the buffer
           lineno that has changed if line other than the current line changes
         """
-        highlighted_paren = None
-
-        source = "\n".join(self.buffer + [s])
-        cursor = len(source) - self.cpos
-        if self.cpos:
-            cursor += 1
-        stack: list[Any] = list()
-        all_tokens = list(Python3Lexer().get_tokens(source))
-        # Unfortunately, Pygments adds a trailing newline and strings with
-        # no size, so strip them
-        while not all_tokens[-1][1]:
-            all_tokens.pop()
-        all_tokens[-1] = (all_tokens[-1][0], all_tokens[-1][1].rstrip("\n"))
-        line = pos = 0
-        parens = dict(zip("{([", "})]"))
-        line_tokens: list[tuple[_TokenType, str]] = list()
-        saved_tokens: list[tuple[_TokenType, str]] = list()
-        search_for_paren = True
-        for token, value in split_lines(all_tokens):
-            pos += len(value)
-            if token is Token.Text and value == "\n":
-                line += 1
-                # Remove trailing newline
-                line_tokens = list()
-                saved_tokens = list()
-                continue
-            line_tokens.append((token, value))
-            saved_tokens.append((token, value))
-            if not search_for_paren:
-                continue
-            under_cursor = pos == cursor
-            if token is Token.Punctuation:
-                if value in parens:
-                    if under_cursor:
-                        line_tokens[-1] = (Parenthesis.UnderCursor, value)
-                        # Push marker on the stack
-                        stack.append((Parenthesis, value))
-                    else:
-                        stack.append(
-                            (line, len(line_tokens) - 1, line_tokens, value)
-                        )
-                elif value in parens.values():
-                    saved_stack = list(stack)
-                    try:
-                        while True:
-                            opening = stack.pop()
-                            if parens[opening[-1]] == value:
-                                break
-                    except IndexError:
-                        # SyntaxError.. more closed parentheses than
-                        # opened or a wrong closing paren
-                        opening = None
-                        if not saved_stack:
-                            search_for_paren = False
-                        else:
-                            stack = saved_stack
-                    if opening and opening[0] is Parenthesis:
-                        # Marker found
-                        line_tokens[-1] = (Parenthesis, value)
-                        search_for_paren = False
-                    elif opening and under_cursor and not newline:
-                        if self.cpos:
-                            line_tokens[-1] = (Parenthesis.UnderCursor, value)
-                        else:
-                            # The cursor is at the end of line and next to
-                            # the paren, so it doesn't reverse the paren.
-                            # Therefore, we insert the Parenthesis token
-                            # here instead of the Parenthesis.UnderCursor
-                            # token.
-                            line_tokens[-1] = (Parenthesis, value)
-                        (lineno, i, tokens, opening) = opening
-                        if lineno == len(self.buffer):
-                            highlighted_paren = (lineno, saved_tokens)
-                            line_tokens[i] = (Parenthesis, opening)
-                        else:
-                            highlighted_paren = (lineno, list(tokens))
-                            # We need to redraw a line
-                            tokens[i] = (Parenthesis, opening)
-                            self.reprint_line(lineno, tokens)
-                        search_for_paren = False
-                elif under_cursor:
-                    search_for_paren = False
-        self.highlighted_paren = highlighted_paren
-        if line != len(self.buffer):
-            return list()
+        self.highlighted_paren = None
+        # only the lines that changed since the last call are lexed and
+        # searched for brackets again
+        all_tokens = self._token_cache.update(self.buffer + [s])
+        self._brackets.update(all_tokens)
+        lineno = len(self.buffer)
+        line_tokens = highlight.line_tokens(all_tokens[lineno])
+
+        # the bracket before the cursor at the end of the line, otherwise
+        # the one under the cursor
+        bracket = self._brackets.bracket_at(lineno, len(s) - max(self.cpos, 1))
+        if bracket is None:
+            return line_tokens
+        index, value, partner = bracket
+        if value in highlight.BRACKETS:
+            line_tokens[index] = (Parenthesis.UnderCursor, value)
+            if partner is not None:
+                line_tokens[partner[1]] = (Parenthesis, partner[2])
+        elif partner is not None and not newline:
+            saved_tokens = list(line_tokens)
+            # The cursor is at the end of line and next to the paren, so it
+            # doesn't reverse the paren. Therefore, we insert the Parenthesis
+            # token here instead of the Parenthesis.UnderCursor token.
+            line_tokens[index] = (
+                Parenthesis.UnderCursor if self.cpos else Parenthesis,
+                value,
+            )
+            opening_lineno, opening_index, opening = partner
+            if opening_lineno == lineno:
+                self.highlighted_paren = (lineno, saved_tokens)
+                line_tokens[opening_index] = (Parenthesis, opening)
+            else:
+                tokens = highlight.line_tokens(all_tokens[opening_lineno])
+                self.highlighted_paren = (opening_lineno, list(tokens))
+                # We need to redraw a line
+                tokens[opening_index] = (Parenthesis, opening)
+                self.reprint_line(opening_lineno, tokens)
         return line_tokens
 
     def clear_current_line(self) -> None:
@@ -1268,17 +1551,6 @@ def next_indentation(line, tab_length) -> int:
     return indentation
 
 
-def split_lines(tokens):
-    for token, value in tokens:
-        if not value:
-            continue
-        while value:
-            head, newline, value = value.partition("\n")
-            yield (token, head)
-            if newline:
-                yield (Token.Text, newline)
-
-
 def token_is(token_type):
     """Return a callable object that returns whether a token is of the
     given type `token_type`."""
@@ -1,7 +1,11 @@
+import abc
 import inspect
 import keyword
+import os
+import tempfile
 import unittest
 from collections import namedtuple
+from pathlib import Path
 from unittest import mock
 
 try:
@@ -14,8 +18,6 @@ except ImportError:
 from bpython import autocomplete, inspection
 from bpython.line import LinePart
 
-glob_function = "glob.iglob"
-
 
 class TestSafeEval(unittest.TestCase):
     def test_catches_syntax_error(self):
@@ -79,6 +81,91 @@ class TestGetCompleter(unittest.TestCase):
         b = completer(["a"])
         self.assertEqual(autocomplete.get_completer([a, b], 0, ""), (["a"], b))
 
+    def test_only_background_completers_run_in_background(self):
+        a = completer(None)
+        b = completer(None)
+        b.background = True
+        b.applies = mock.Mock(return_value=True)
+        c = completer(["c"])
+        run_in_background = mock.Mock(return_value=None)
+        self.assertEqual(
+            autocomplete.get_completer(
+                [a, b, c], 0, "", run_in_background=run_in_background
+            ),
+            (["c"], c),
+        )
+        run_in_background.assert_called_once_with([b, c])
+        b.matches.assert_not_called()
+        a.matches.assert_called_once()
+        c.matches.assert_called_once()
+
+    def test_background_completers_not_applying_skipped(self):
+        a = completer(None)
+        a.background = True
+        a.applies = mock.Mock(return_value=False)
+        b = completer(["b"])
+        run_in_background = mock.Mock()
+        self.assertEqual(
+            autocomplete.get_completer(
+                [a, b], 0, "", run_in_background=run_in_background
+            ),
+            (["b"], b),
+        )
+        run_in_background.assert_not_called()
+        a.matches.assert_not_called()
+
+
+class TestStatsKind(unittest.TestCase):
+    def test_without_context(self):
+        self.assertEqual(
+            autocomplete.stats_kind(autocomplete.GlobalCompletion(), 2, "ab"),
+            "GlobalCompletion",
+        )
+
+    def test_context(self):
+        com = autocomplete.ImportCompletion(mock.Mock())
+        self.assertEqual(
+            autocomplete.stats_kind(com, 17, "from os import pa"),
+            "ImportCompletion:os",
+        )
+        self.assertEqual(
+            autocomplete.stats_kind(com, 9, "import os"), "ImportCompletion"
+        )
+        self.assertEqual(
+            autocomplete.stats_kind(
+                autocomplete.DictKeyCompletion(), 6, "d.e['a"
+            ),
+            "DictKeyCompletion:d.e",
+        )
+
+
+class TestFuzzyMatching(unittest.TestCase):
+    def test_match(self):
+        match = autocomplete._method_match_fuzzy
+        self.assertTrue(match("process_event", 3, "pev"))
+        self.assertTrue(match("a.b", 2, ".b"))
+        self.assertFalse(match("process_event", 3, "vep"))
+        self.assertFalse(match("axb", 2, ".b"))
+
+    def test_score(self):
+        score = autocomplete._fuzzy_score
+        self.assertIsNone(score("process_event", "vep"))
+        # consecutive matches beat scattered ones
+        self.assertGreater(score("events", "ev"), score("element_view", "ev"))
+        # matches at word boundaries beat matches inside words
+        self.assertGreater(score("get_value", "gv"), score("govern", "gv"))
+
+    def test_get_completer_ranks_matches(self):
+        com = autocomplete.GlobalCompletion(
+            mode=autocomplete.AutocompleteModes.FUZZY
+        )
+        locals_ = {"xyz_vw": 1, "x_y_z": 2, "xyzzy": 3}
+        matches, completer = autocomplete.get_completer(
+            [com], 3, "xyz", locals_=locals_
+        )
+        self.assertIs(completer, com)
+        self.assertListEqual(matches, ["xyzzy", "xyz_vw", "x_y_z"])
+
 
 class TestCumulativeCompleter(unittest.TestCase):
     def completer(self, matches):
@@ -119,6 +206,9 @@ class TestCumulativeCompleter(unittest.TestCase):
 class TestFilenameCompletion(unittest.TestCase):
     def setUp(self):
         self.completer = autocomplete.FilenameCompletion()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = Path(self.temp_dir.name)
 
     def test_locate_fails_when_not_in_string(self):
         self.assertEqual(self.completer.locate(4, "abcd"), None)
@@ -131,44 +221,89 @@ class TestFilenameCompletion(unittest.TestCase):
     def test_issue_491(self):
         self.assertNotEqual(self.completer.matches(9, '"a[a.l-1]'), None)
 
-    @mock.patch(glob_function, new=lambda text: [])
     def test_match_returns_none_if_not_in_string(self):
         self.assertEqual(self.completer.matches(2, "abcd"), None)
 
-    @mock.patch(glob_function, new=lambda text: [])
     def test_match_returns_empty_list_when_no_files(self):
-        self.assertEqual(self.completer.matches(2, '"a'), set())
+        self.assertEqual(self.completer.matches(4, f'"{self.path}/a'), set())
 
-    @mock.patch(glob_function, new=lambda text: ["abcde", "aaaaa"])
-    @mock.patch("os.path.expanduser", new=lambda text: text)
-    @mock.patch("os.path.isdir", new=lambda text: False)
-    @mock.patch("os.path.sep", new="/")
     def test_match_returns_files_when_files_exist(self):
+        (self.path / "abcde").touch()
+        (self.path / "aaaaa").touch()
         self.assertEqual(
-            sorted(self.completer.matches(2, '"x')), ["aaaaa", "abcde"]
+            sorted(self.completer.matches(4, f'"{self.path}/a')),
+            [f"{self.path}/aaaaa", f"{self.path}/abcde"],
         )
 
-    @mock.patch(glob_function, new=lambda text: ["abcde", "aaaaa"])
-    @mock.patch("os.path.expanduser", new=lambda text: text)
-    @mock.patch("os.path.isdir", new=lambda text: True)
-    @mock.patch("os.path.sep", new="/")
     def test_match_returns_dirs_when_dirs_exist(self):
+        (self.path / "abcde").mkdir()
+        (self.path / "aaaaa").mkdir()
         self.assertEqual(
-            sorted(self.completer.matches(2, '"x')), ["aaaaa/", "abcde/"]
+            sorted(self.completer.matches(4, f'"{self.path}/a')),
+            [f"{self.path}/aaaaa/", f"{self.path}/abcde/"],
         )
 
-    @mock.patch(
-        glob_function, new=lambda text: ["/expand/ed/abcde", "/expand/ed/aaaaa"]
-    )
-    @mock.patch(
-        "os.path.expanduser", new=lambda text: text.replace("~", "/expand/ed")
-    )
-    @mock.patch("os.path.isdir", new=lambda text: False)
-    @mock.patch("os.path.sep", new="/")
-    def test_tilde_stays_pretty(self):
+    def test_hidden_files(self):
+        (self.path / ".abc").touch()
+        (self.path / "abc").touch()
+        word = f"{self.path}/"
         self.assertEqual(
-            sorted(self.completer.matches(4, '"~/a')), ["~/aaaaa", "~/abcde"]
+            self.completer.matches(len(word) + 1, f'"{word}'), {f"{word}abc"}
         )
+        self.assertEqual(
+            self.completer.matches(len(word) + 2, f'"{word}.'),
+            {f"{word}.abc"},
+        )
+
+    @mock.patch.object(autocomplete, "FILENAME_MATCHES_LIMIT", new=2)
+    def test_matches_limited(self):
+        for name in ("abc", "abd", "abe"):
+            (self.path / name).touch()
+        matches = self.completer.matches(4, f'"{self.path}/ab')
+        self.assertEqual(matches, {f"{self.path}/abc", f"{self.path}/abd"})
+        self.assertIsInstance(matches, autocomplete.TruncatedMatches)
+        matches = self.completer.matches(4, f'"{self.path}/abe')
+        self.assertEqual(matches, {f"{self.path}/abe"})
+        self.assertNotIsInstance(matches, autocomplete.TruncatedMatches)
+
+    def test_relative(self):
+        (self.path / "abc").mkdir()
+        with mock.patch("os.getcwd", new=lambda: str(self.path)):
+            self.assertEqual(self.completer.matches(2, '"a'), {"abc/"})
+
+    def test_directory_changed(self):
+        (self.path / "abc").touch()
+        self.assertEqual(
+            self.completer.matches(4, f'"{self.path}/a'), {f"{self.path}/abc"}
+        )
+        (self.path / "abd").touch()
+        os.utime(self.path, ns=(0, 0))
+        self.assertEqual(
+            self.completer.matches(4, f'"{self.path}/a'),
+            {f"{self.path}/abc", f"{self.path}/abd"},
+        )
+
+    def test_large_directory_not_cached(self):
+        (self.path / "abc").touch()
+        (self.path / "abd").touch()
+        self.completer._directories.max_entries = 1
+        self.assertEqual(
+            self.completer.matches(4, f'"{self.path}/a'),
+            {f"{self.path}/abc", f"{self.path}/abd"},
+        )
+        self.assertFalse(self.completer._directories._listings)
+
+    def test_tilde_stays_pretty(self):
+        (self.path / "abcde").touch()
+        (self.path / "aaaaa").touch()
+        with mock.patch(
+            "os.path.expanduser",
+            new=lambda text: text.replace("~", str(self.path)),
+        ):
+            self.assertEqual(
+                sorted(self.completer.matches(4, '"~/a')),
+                ["~/aaaaa", "~/abcde"],
+            )
 
     @mock.patch("os.path.sep", new="/")
     def test_formatting_takes_just_last_part(self):
@@ -215,6 +350,61 @@ class TestDictKeyCompletion(unittest.TestCase):
         local = {"mNumPy": MockNumPy()}
         self.assertEqual(com.matches(7, "mNumPy[", locals_=local), None)
 
+    def test_keys_changed(self):
+        com = autocomplete.DictKeyCompletion()
+        local = {"d": {"ab": 1}}
+        self.assertSetEqual(com.matches(4, "d['a", locals_=local), {"'ab']"})
+        local["d"]["ac"] = 2
+        self.assertSetEqual(
+            com.matches(4, "d['a", locals_=local), {"'ab']", "'ac']"}
+        )
+        local["d"] = {"ad": 3, "ae": 4}
+        self.assertSetEqual(
+            com.matches(4, "d['a", locals_=local), {"'ad']", "'ae']"}
+        )
+
+    def test_same_generation(self):
+        com = autocomplete.DictKeyCompletion()
+        local = {"d": {"ab": 1}}
+        com.matches(4, "d['a", locals_=local, generation=1)
+        del local["d"]["ab"]
+        local["d"]["ac"] = 2
+        self.assertSetEqual(
+            com.matches(4, "d['a", locals_=local, generation=1), {"'ab']"}
+        )
+        self.assertSetEqual(
+            com.matches(4, "d['a", locals_=local, generation=2), {"'ac']"}
+        )
+
+    @mock.patch.object(autocomplete, "DICT_KEY_SCAN_BUDGET", new=2)
+    def test_truncated(self):
+        com = autocomplete.DictKeyCompletion()
+        local = {"d": {"ab": 1, "ac": 2}}
+        matches = com.matches(4, "d['a", locals_=local)
+        self.assertSetEqual(matches, {"'ab']", "'ac']"})
+        self.assertNotIsInstance(matches, autocomplete.TruncatedMatches)
+        local["d"]["ad"] = 3
+        matches = com.matches(4, "d['a", locals_=local)
+        self.assertSetEqual(matches, {"'ab']", "'ac']"})
+        self.assertIsInstance(matches, autocomplete.TruncatedMatches)
+
+    def test_same_length_without_generation(self):
+        com = autocomplete.DictKeyCompletion()
+        local = {"d": {"ab": 1}}
+        com.matches(4, "d['a", locals_=local)
+        del local["d"]["ab"]
+        local["d"]["ac"] = 2
+        self.assertSetEqual(com.matches(4, "d['a", locals_=local), {"'ac']"})
+
+    def test_other_dict_of_same_length(self):
+        com = autocomplete.DictKeyCompletion()
+        local = {"d": {"ab": 1}}
+        com.matches(4, "d['a", locals_=local, generation=1)
+        local["d"] = {"ac": 2}
+        self.assertSetEqual(
+            com.matches(4, "d['a", locals_=local, generation=1), {"'ac']"}
+        )
+
 
 class Foo:
     a = 10
@@ -273,6 +463,71 @@ class TestAttrCompletion(unittest.TestCase):
             {"A.b", "A.a"},
         )
 
+    def test_instance_attributes_found(self):
+        a = Foo()
+        a.spam = 1
+        self.assertSetEqual(
+            self.com.matches(3, "a.s", locals_={"a": a}), {"a.spam"}
+        )
+
+    def test_class_attributes_cached(self):
+        class Spam:
+            ham = 1
+
+        self.assertIs(
+            autocomplete._class_members(Spam), autocomplete._class_members(Spam)
+        )
+        self.assertSetEqual(
+            self.com.matches(3, "s.h", locals_={"s": Spam()}), {"s.ham"}
+        )
+
+    def test_class_attribute_changes_picked_up(self):
+        class Spam:
+            ham = 1
+
+        class SubSpam(Spam):
+            pass
+
+        locals_ = {"s": SubSpam()}
+        self.assertSetEqual(
+            self.com.matches(3, "s.h", locals_=locals_), {"s.ham"}
+        )
+        del Spam.ham
+        Spam.hamster = 2
+        self.assertSetEqual(
+            self.com.matches(3, "s.h", locals_=locals_), {"s.hamster"}
+        )
+
+    def test_class_name_found(self):
+        self.assertSetEqual(
+            self.com.matches(8, "Foo.__na", locals_={"Foo": Foo}),
+            {"Foo.__name__"},
+        )
+
+        class Meta(type):
+            def __dir__(cls):
+                return ["spam"]
+
+        class Spam(metaclass=Meta):
+            pass
+
+        self.assertSetEqual(
+            self.com.matches(9, "Spam.__na", locals_={"Spam": Spam}),
+            {"Spam.__name__"},
+        )
+
+    def test_abstract_methods_only_on_instances_of_abcs(self):
+        class Spam(abc.ABC):
+            pass
+
+        self.assertSetEqual(
+            self.com.matches(8, "S.__abst", locals_={"S": Spam}), set()
+        )
+        self.assertSetEqual(
+            self.com.matches(8, "s.__abst", locals_={"s": Spam()}),
+            {"s.__abstractmethods__"},
+        )
+
 
 class TestExpressionAttributeCompletion(unittest.TestCase):
     @classmethod
@@ -400,6 +655,68 @@ class TestMultilineJediCompletion(unittest.TestCase):
         history = ("import asyncio", "@asyncio.coroutin")
         com.matches(3, "def", current_block=code, history=history)
 
+    def test_context_only_referenced_statements(self):
+        index = autocomplete._HistoryIndex()
+        index.update(
+            [
+                "import os",
+                "from spam import *",
+                "def f(x):",
+                "    return os.path.join(x)",
+                "",
+                "y = 1",
+                "z = f(",
+                "    2)",
+            ]
+        )
+        self.assertEqual(
+            index.context("if True:\n    z."),
+            "import os\nfrom spam import *\n"
+            "def f(x):\n    return os.path.join(x)\n\nz = f(\n    2)",
+        )
+        self.assertEqual(index.context("y"), "from spam import *\ny = 1")
+
+    def test_context_bounded(self):
+        index = autocomplete._HistoryIndex()
+        for i in range(1000):
+            index.update(index.statements + [f"spam = {'1' * 100} + spam"])
+        self.assertLessEqual(
+            len(index.context("spam")), autocomplete.JEDI_CONTEXT_SIZE
+        )
+
+    def test_index_extended(self):
+        index = autocomplete._HistoryIndex()
+        history = ["spam = 1"]
+        index.update(history)
+        history.append("eggs = 2")
+        index.update(history)
+        self.assertEqual(index.statements, ["spam = 1", "eggs = 2"])
+        index.update(["ham = 3"])
+        self.assertEqual(index.statements, ["ham = 3"])
+
+    def test_history_extended(self):
+        com = autocomplete.MultilineJediCompletion()
+        history = ["spam = 1", "if True:"]
+        block = "if True:\n    sp"
+        self.assertSetEqual(
+            com.matches(6, "    sp", current_block=block, history=history),
+            {"spam"},
+        )
+        history[1:] = ["spammer = 2", "if True:"]
+        self.assertSetEqual(
+            com.matches(6, "    sp", current_block=block, history=history),
+            {"spam", "spammer"},
+        )
+
+    def test_locate_earlier_matches(self):
+        com = autocomplete.MultilineJediCompletion()
+        com.warm_up()
+        history = ["spam = 1", "if True:"]
+        block = "if True:\n    sp"
+        com.matches(6, "    sp", current_block=block, history=history)
+        com.matches(7, "    spa", current_block=block + "a", history=history)
+        self.assertEqual(com.locate(6, "    sp"), LinePart(4, 6, "sp"))
+
 
 class TestGlobalCompletion(unittest.TestCase):
     def setUp(self):
@@ -426,6 +743,56 @@ class TestGlobalCompletion(unittest.TestCase):
         with mock.patch.object(keyword, "kwlist", new=["abcß"]):
             self.assertEqual(self.com.matches(3, "abc", locals_={}), None)
 
+    def test_locals_changed(self):
+        locals_ = {"zqc": 1, "zqd": 2}
+        self.assertSetEqual(
+            self.com.matches(2, "zq", locals_=locals_), {"zqc", "zqd"}
+        )
+        del locals_["zqd"]
+        locals_["zqe"] = len
+        locals_[1] = "not a name"
+        self.assertSetEqual(
+            self.com.matches(2, "zq", locals_=locals_), {"zqc", "zqe("}
+        )
+
+    def test_locals_rebound(self):
+        locals_ = {"zqc": 1}
+        self.assertSetEqual(self.com.matches(2, "zq", locals_=locals_), {"zqc"})
+        locals_["zqc"] = len
+        self.assertSetEqual(
+            self.com.matches(2, "zq", locals_=locals_), {"zqc("}
+        )
+
+    def test_many_locals_changed(self):
+        locals_ = {f"zqc{i}": i for i in range(100)}
+        self.assertEqual(len(self.com.matches(2, "zq", locals_=locals_)), 100)
+        locals_ = {f"zqd{i}": i for i in range(100)}
+        self.assertSetEqual(
+            self.com.matches(4, "zqd1", locals_=locals_),
+            {"zqd1"} | {f"zqd1{i}" for i in range(10)},
+        )
+
+    def test_same_generation(self):
+        locals_ = {"zqc": 1}
+        self.com.matches(2, "zq", locals_=locals_, generation=1)
+        locals_["zqd"] = 2
+        self.assertSetEqual(
+            self.com.matches(2, "zq", locals_=locals_, generation=1), {"zqc"}
+        )
+        self.assertSetEqual(
+            self.com.matches(2, "zq", locals_=locals_, generation=2),
+            {"zqc", "zqd"},
+        )
+
+    def test_substring(self):
+        com = autocomplete.GlobalCompletion(
+            mode=autocomplete.AutocompleteModes.SUBSTRING
+        )
+        self.assertSetEqual(
+            com.matches(2, "qc", locals_={"zqc": 1, "qcd": 2, "cde": 3}),
+            {"zqc", "qcd"},
+        )
+
 
 class TestParameterNameCompletion(unittest.TestCase):
     def test_set_of_params_returns_when_matches_found(self):
@@ -0,0 +1,89 @@
+import math
+import tempfile
+import unittest
+from pathlib import Path
+
+from bpython.completionstats import (
+    HALF_LIFE,
+    CompletionStats,
+    default_stats_path,
+)
+
+
+class TestCompletionStats(unittest.TestCase):
+    def setUp(self):
+        self.stats = CompletionStats()
+
+    def test_unknown_ranked_last(self):
+        self.stats.record("Global", "abc", when=0)
+        self.assertGreater(
+            self.stats.rank("Global", "abc"), self.stats.rank("Global", "abd")
+        )
+        self.assertEqual(self.stats.rank("Attr", "abc"), -math.inf)
+
+    def test_frequency(self):
+        for _ in range(3):
+            self.stats.record("Global", "abc", when=0)
+        self.stats.record("Global", "abd", when=0)
+        self.assertGreater(
+            self.stats.rank("Global", "abc"), self.stats.rank("Global", "abd")
+        )
+
+    def test_recency(self):
+        for _ in range(3):
+            self.stats.record("Global", "abc", when=0)
+        self.stats.record("Global", "abd", when=HALF_LIFE)
+        self.assertGreater(
+            self.stats.rank("Global", "abc"), self.stats.rank("Global", "abd")
+        )
+        self.stats.record("Global", "abd", when=3 * HALF_LIFE)
+        self.assertGreater(
+            self.stats.rank("Global", "abd"), self.stats.rank("Global", "abc")
+        )
+
+
+class TestCompletionStatsFileAccess(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.filename = default_stats_path(
+            Path(self.tempdir.name) / "history_temp_file"
+        )
+
+    def test_reload_and_write(self):
+        stats = CompletionStats()
+        stats.record("Global", "abc", when=0)
+        stats.reload_and_write(self.filename)
+
+        other = CompletionStats()
+        other.record("Global", "abd", when=0)
+        other.record("Global", "abd", when=0)
+        other.reload_and_write(self.filename)
+        self.assertGreater(
+            other.rank("Global", "abd"), other.rank("Global", "abc")
+        )
+        self.assertGreater(other.rank("Global", "abc"), -math.inf)
+
+        loaded = CompletionStats()
+        loaded.load(self.filename)
+        self.assertEqual(
+            loaded.rank("Global", "abd"), other.rank("Global", "abd")
+        )
+
+    def test_max_entries(self):
+        stats = CompletionStats(max_entries=2)
+        for i, match in enumerate(("abc", "abd", "abe")):
+            stats.record("Global", match, when=i)
+        stats.reload_and_write(self.filename)
+        self.assertEqual(stats.rank("Global", "abc"), -math.inf)
+        self.assertGreater(stats.rank("Global", "abd"), -math.inf)
+
+    def test_invalid_file(self):
+        self.filename.write_text("[1, 2")
+        stats = CompletionStats()
+        stats.load(self.filename)
+        self.assertEqual(stats.rank("Global", "abc"), -math.inf)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -143,6 +143,23 @@ class TestCurtsiesPaintingSimple(CurtsiesPaintingTest):
         )
         self.assert_paint_ignoring_formatting(screen, (0, 4))
 
+    def test_completion_truncated(self):
+        self.repl.height, self.repl.width = (6, 32)
+        self.repl.interp.locals["d"] = {"ab": 1, "ac": 2, "ad": 3}
+        with mock.patch("bpython.autocomplete.DICT_KEY_SCAN_BUDGET", new=2):
+            self.repl.current_line = "d['a"
+            self.repl.cursor_offset = 4
+            screen = self.process_box_characters(
+                [
+                    ">>> d['a",
+                    "┌──────────────────────────────┐",
+                    "│ 'ab'  'ac'                   │",
+                    "│ (search truncated)           │",
+                    "└──────────────────────────────┘",
+                ]
+            )
+            self.assert_paint_ignoring_formatting(screen, (0, 8))
+
     def test_argspec(self):
         def foo(x, y, z=10):
             "docstring!"
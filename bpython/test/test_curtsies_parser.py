@@ -1,6 +1,10 @@
 from bpython.test import unittest
 from bpython.curtsiesfrontend import parse
+from bpython.formatter import BPythonFormatter, Parenthesis
 from curtsies.fmtfuncs import yellow, cyan, green, bold
+from pygments import format as pygformat
+from pygments.lexers import Python3Lexer
+from pygments.token import Token
 
 
 class TestExecArgs(unittest.TestCase):
@@ -35,3 +39,46 @@ class TestExecArgs(unittest.TestCase):
                 "asdf",
             ),
         )
+
+
+class TestFmtStrFormatter(unittest.TestCase):
+    def setUp(self):
+        self.color_scheme = {
+            "keyword": "y",
+            "name": "c",
+            "comment": "b",
+            "string": "m",
+            "error": "r",
+            "number": "G",
+            "operator": "Y",
+            "punctuation": "y",
+            "token": "C",
+            "background": "d",
+            "paren": "R",
+        }
+        self.formatter = parse.FmtStrFormatter(self.color_scheme)
+
+    def assertSameAsParsed(self, tokens):
+        expected = parse.parse(
+            pygformat(tokens, BPythonFormatter(self.color_scheme))
+        )
+        formatted = self.formatter.format(tokens)
+        self.assertEqual(formatted, expected)
+        self.assertEqual(
+            [(chunk.s, chunk.atts) for chunk in formatted.chunks],
+            [(chunk.s, chunk.atts) for chunk in expected.chunks],
+        )
+
+    def test_format(self):
+        self.assertSameAsParsed(
+            list(Python3Lexer().get_tokens("print(1 + x.y, 'z')  # comment"))
+        )
+        self.assertSameAsParsed(
+            [
+                (Parenthesis, "("),
+                (Parenthesis.UnderCursor, ")"),
+                (Token.Text, "\n"),
+                (Token.Literal.String.Escape, "\x1b[31mred\x1b[0m"),
+            ]
+        )
+        self.assertEqual(self.formatter.format([]), parse.parse(""))
@@ -74,6 +74,30 @@ class TestCurtsiesRepl(TestCase):
             self.repl.all_logical_lines.append(('"åß∂ƒ"', LineType.INPUT))
             self.repl.send_session_to_external_editor()
 
+    def test_import_completion_progress(self):
+        self.repl.module_gatherer = MagicIterMock()
+        self.repl.module_gatherer.fully_loaded = False
+        self.repl.module_gatherer.progress = (1, 3)
+        self.assertTrue(self.repl.update_import_completion_progress())
+        self.assertIn("1/3", self.repl.status_bar.current_line)
+        self.assertFalse(self.repl.update_import_completion_progress())
+
+        self.repl.module_gatherer.fully_loaded = True
+        self.assertTrue(self.repl.update_import_completion_progress())
+        self.assertEqual(self.repl.status_bar.current_line, "")
+
+    def test_import_paths_changed(self):
+        self.repl.module_gatherer = mock.Mock()
+        self.repl.module_gatherer.refresh.return_value = False
+        self.repl.process_event(bpythonevents.ImportPathsChangedEvent())
+        self.repl.module_gatherer.refresh.assert_called_once_with()
+
+    def test_completion_ready(self):
+        self.repl.show_background_matches = mock.Mock(return_value=True)
+        self.repl.list_win_visible = False
+        self.repl.process_event(bpythonevents.CompletionReadyEvent())
+        self.assertTrue(self.repl.list_win_visible)
+
     def test_get_last_word(self):
         self.repl.rl_history.entries = ["1", "2 3", "4 5 6"]
         self.repl._set_current_line("abcde")
@@ -3,7 +3,10 @@ import unittest
 
 try:
     import watchdog
-    from bpython.curtsiesfrontend.filewatch import ModuleChangedEventHandler
+    from bpython.curtsiesfrontend.filewatch import (
+        ImportPathsChangedEventHandler,
+        ModuleChangedEventHandler,
+    )
 
     has_watchdog = True
 except ImportError:
@@ -32,3 +35,65 @@ class TestModuleChangeEventHandler(unittest.TestCase):
         self.module.activated = True
         with self.assertRaises(ValueError):
             self.module.activate()
+
+
+@unittest.skipUnless(has_watchdog, "watchdog required")
+class TestImportPathsChangedEventHandler(unittest.TestCase):
+    def setUp(self):
+        self.on_change = mock.Mock()
+        self.handler = ImportPathsChangedEventHandler(self.on_change)
+        self.handler.observer = mock.Mock()
+
+    def test_watch(self):
+        path = os.path.dirname(__file__)
+        self.handler.watch([path, os.path.join(path, "missing")])
+        self.assertSetEqual(self.handler.dirs, {path})
+        self.handler.observer.schedule.assert_called_once_with(
+            self.handler, path, recursive=False
+        )
+        self.handler.observer.start.assert_called_once_with()
+
+        self.handler.watch([path])
+        self.handler.observer.schedule.assert_called_once()
+
+    def test_stop(self):
+        self.handler.stop()
+        self.handler.observer.stop.assert_not_called()
+        self.handler.watch([os.path.dirname(__file__)])
+        self.handler.stop()
+        self.handler.observer.stop.assert_called_once_with()
+        self.handler.observer.join.assert_called_once_with()
+
+    def event(self, event_type, src_path, is_directory=False, dest_path=""):
+        return mock.Mock(
+            event_type=event_type,
+            src_path=src_path,
+            dest_path=dest_path,
+            is_directory=is_directory,
+        )
+
+    def test_on_any_event(self):
+        self.handler.on_any_event(self.event("modified", "/site/spam.py"))
+        self.on_change.assert_not_called()
+        self.handler.on_any_event(self.event("created", "/site/spam.py"))
+        self.on_change.assert_called_once_with()
+
+    def test_not_importable_ignored(self):
+        for event in (
+            self.event("created", "/site/.spam.py.swp"),
+            self.event("created", "/site/4913"),
+            self.event("deleted", "/site/spam.py~"),
+            self.event("created", "/site/__pycache__", is_directory=True),
+            self.event("created", "/site/.git", is_directory=True),
+            self.event("moved", "/site/spam.py.tmp", dest_path="/site/x.txt"),
+        ):
+            self.handler.on_any_event(event)
+        self.on_change.assert_not_called()
+
+        self.handler.on_any_event(
+            self.event("moved", "/site/spam.py.tmp", dest_path="/site/spam.py")
+        )
+        self.handler.on_any_event(
+            self.event("deleted", "/site/spam", is_directory=True)
+        )
+        self.assertEqual(self.on_change.call_count, 2)
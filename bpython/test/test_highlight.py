@@ -0,0 +1,167 @@
+import unittest
+from unittest import mock
+
+from pygments.lexers import Python3Lexer
+from pygments.token import Token
+
+from bpython.highlight import (
+    BracketIndex,
+    LineTokenCache,
+    lex_line,
+    scan_line,
+)
+
+
+def without_newlines(tokens):
+    return [(token, value) for token, value in tokens if value.strip("\n")]
+
+
+class TestLineTokenCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = LineTokenCache()
+
+    def assertSameAsPygments(self, lines):
+        expected = list(Python3Lexer().get_tokens("\n".join(lines)))
+        self.assertEqual(
+            without_newlines(self.cache.tokens(lines)),
+            without_newlines(expected),
+        )
+
+    def test_same_as_pygments(self):
+        self.assertSameAsPygments(["x = 1"])
+        self.assertSameAsPygments(["def f(a,", "      b):", "    return a"])
+        self.assertSameAsPygments(['s = """abc', "def", '"""', "s"])
+        self.assertSameAsPygments(["x = f'{a", "}'"])
+
+    def test_no_trailing_newline(self):
+        tokens = list(self.cache.tokens(["x", ""]))
+        self.assertEqual(tokens[-1], (Token.Text.Whitespace, "\n"))
+        tokens = list(self.cache.tokens(["x"]))
+        self.assertEqual(tokens, [(Token.Name, "x")])
+
+    def test_only_changed_lines_lexed(self):
+        lines = ["def f():", "    x = 1", "    y"]
+        self.cache.tokens(lines)
+        with mock.patch.object(
+            self.cache, "_lex", wraps=self.cache._lex
+        ) as lex:
+            self.cache.tokens(lines[:2] + ["    y = 2"])
+            self.assertEqual(lex.call_count, 1)
+
+    def test_state_changes_lexed(self):
+        lines = ["x = 1", "y = 2"]
+        self.assertEqual(
+            without_newlines(self.cache.tokens(lines))[-1],
+            (Token.Literal.Number.Integer, "2"),
+        )
+        tokens = without_newlines(self.cache.tokens(['x = """1'] + lines[1:]))
+        self.assertEqual(tokens[-1], (Token.Literal.String.Double, "y = 2"))
+        self.assertSameAsPygments(['x = """1', "y = 2"])
+
+    def test_fast_same_as_slow(self):
+        lines = ["class A:", "    def f(self, x=f'{1}'):", "        return x"]
+        self.assertEqual(
+            without_newlines(self.cache.tokens(lines)),
+            without_newlines(LineTokenCache(fast=False).tokens(lines)),
+        )
+
+    def test_without_lexer_rules(self):
+        lines = ["def f(a,", "      b):", "    return a", ""]
+        expected = self.cache.update(lines)
+        with mock.patch("bpython.highlight._token_defs", return_value=None):
+            cache = LineTokenCache()
+            self.assertFalse(cache.incremental)
+            self.assertEqual(cache.update(lines), expected)
+            self.assertEqual(cache.update([]), [])
+
+
+class TestScanLine(unittest.TestCase):
+    def assertSameAsPygments(self, line):
+        tokens, state = lex_line(Python3Lexer(), line)
+        self.assertEqual(state, ("root",))
+        self.assertEqual(
+            scan_line(line),
+            [(token, value) for token, value in tokens if value],
+        )
+
+    def test_names(self):
+        self.assertSameAsPygments("print(self.len, len, True, __name__)")
+        self.assertSameAsPygments("if x is not None and y: yield from z")
+        self.assertSameAsPygments("def __init__(self, *args): pass")
+        self.assertSameAsPygments("class A(B, metaclass=M):")
+        self.assertSameAsPygments("@decorator.attr @ x")
+
+    def test_imports(self):
+        self.assertSameAsPygments("from ..a.b import c as d, e")
+        self.assertSameAsPygments("import a.b as c, d")
+        self.assertSameAsPygments("raise ValueError from None")
+
+    def test_numbers(self):
+        self.assertSameAsPygments("1.5.3j + 0x1g + 1e5j - 0o17 * 0b1 // 1_000")
+
+    def test_strings(self):
+        self.assertSameAsPygments("""'%s {0} \\n' + b"\\x00 \\N{x}" + rb'\\'""")
+        self.assertSameAsPygments("x = ur'x' + 'unclosed")
+
+    def test_errors(self):
+        self.assertSameAsPygments("a!b$c?")
+
+    def test_left_to_pygments(self):
+        self.assertIsNone(scan_line("f'{x}'"))
+        self.assertIsNone(scan_line('x = """'))
+        self.assertIsNone(scan_line("match x:"))
+        self.assertIsNone(scan_line("x = 'ä'"))
+        self.assertIsNone(scan_line("x = 1 + \\"))
+        self.assertIsNone(scan_line("from "))
+
+
+class TestBracketIndex(unittest.TestCase):
+    def setUp(self):
+        self.cache = LineTokenCache()
+        self.brackets = BracketIndex()
+
+    def update(self, lines):
+        self.brackets.update(self.cache.update(lines))
+
+    def partner(self, lineno, column):
+        bracket = self.brackets.bracket_at(lineno, column)
+        return bracket.partner if bracket is not None else None
+
+    def test_same_line(self):
+        self.update(["f(x[0], {})"])
+        self.assertEqual(self.partner(0, 1), (0, 10, ")"))
+        self.assertEqual(self.partner(0, 10), (0, 1, "("))
+        self.assertEqual(self.partner(0, 5), (0, 3, "["))
+        self.assertIsNone(self.brackets.bracket_at(0, 2))
+
+    def test_previous_lines(self):
+        self.update(["f(x,", "  [y],", "  z)"])
+        self.assertEqual(self.partner(2, 3), (0, 1, "("))
+        self.assertEqual(self.partner(1, 4), (1, 1, "["))
+        # the partner of an opening bracket on another line is not known
+        self.assertIsNone(self.partner(0, 1))
+
+    def test_strings_and_comments_ignored(self):
+        self.update(["f('(', # (", ")"])
+        self.assertEqual(self.partner(1, 0), (0, 1, "("))
+
+    def test_unmatched(self):
+        self.update(["(]", ")"])
+        self.assertIsNone(self.partner(0, 1))
+        self.assertEqual(self.partner(1, 0), (0, 0, "("))
+        self.update(["x)", "(x)"])
+        self.assertIsNone(self.brackets.bracket_at(1, 0))
+
+    def test_only_changed_lines_scanned(self):
+        lines = ["f(x,", "  y", "  z"]
+        self.update(lines)
+        with mock.patch.object(
+            BracketIndex, "_scan", wraps=BracketIndex._scan
+        ) as scan:
+            self.update(lines[:2] + ["  z)"])
+            self.assertEqual(scan.call_count, 1)
+        self.assertEqual(self.partner(2, 3), (0, 1, "("))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,13 @@
 import os
 import tempfile
+import sys
+import types
 import unittest
+import unittest.mock
+import zipfile
 
 from pathlib import Path
-from bpython.importcompletion import ModuleGatherer
+from bpython.importcompletion import ModuleGatherer, ModuleIndex, ModuleNames
 
 
 class TestSimpleComplete(unittest.TestCase):
@@ -127,6 +131,62 @@ class TestRealComplete(unittest.TestCase):
         )
 
 
+class TestModuleAttributes(unittest.TestCase):
+    def setUp(self):
+        self.module_gatherer = ModuleGatherer(())
+        self.module = types.ModuleType("bpython_fake")
+        self.module.spam = self.module.spammer = self.module.eggs = 1
+        patcher = unittest.mock.patch.dict(
+            sys.modules, {"bpython_fake": self.module}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_prefix(self):
+        self.assertSetEqual(
+            self.module_gatherer.attr_matches("bpython_fake.spa"),
+            {"bpython_fake.spam", "bpython_fake.spammer"},
+        )
+        self.assertSetEqual(
+            self.module_gatherer.attr_matches("spa", "bpython_fake"),
+            {"spam", "spammer"},
+        )
+
+    def test_cached(self):
+        self.module_gatherer.attr_matches("bpython_fake.spa")
+        with unittest.mock.patch("builtins.dir") as dir_:
+            self.module_gatherer.attr_matches("bpython_fake.egg")
+        dir_.assert_not_called()
+
+    def test_invalidated(self):
+        self.module_gatherer.attr_matches("bpython_fake.spa")
+        self.module.spanish = 1
+        self.assertIn(
+            "spanish", self.module_gatherer.attr_matches("spa", "bpython_fake")
+        )
+        del self.module.spam
+        self.assertNotIn(
+            "spam", self.module_gatherer.attr_matches("spa", "bpython_fake")
+        )
+
+    def test_replaced_module(self):
+        self.module_gatherer.attr_matches("bpython_fake.spa")
+        module = types.ModuleType("bpython_fake")
+        module.spa = module.bacon = module.ham = 1
+        sys.modules["bpython_fake"] = module
+        self.assertSetEqual(
+            self.module_gatherer.attr_matches("spa", "bpython_fake"), {"spa"}
+        )
+
+    def test_only_modules(self):
+        self.module.submodule = types.ModuleType("bpython_fake.submodule")
+        sys.modules["bpython_fake.submodule"] = self.module.submodule
+        self.assertSetEqual(
+            self.module_gatherer.module_attr_matches("bpython_fake.s"),
+            {"bpython_fake.submodule"},
+        )
+
+
 class TestAvoidSymbolicLinks(unittest.TestCase):
     def setUp(self):
         with tempfile.TemporaryDirectory() as import_test_folder:
@@ -219,5 +279,474 @@ class TestBugReports(unittest.TestCase):
             )
 
 
+class TestModuleNames(unittest.TestCase):
+    def setUp(self):
+        self.names = ModuleNames(
+            ["os", "os.path", "xml", "xml.dom", "xml.dom.minidom", "xml.etree"]
+        )
+
+    def test_set_operations(self):
+        self.assertEqual(len(self.names), 6)
+        self.assertIn("xml.dom", self.names)
+        self.assertNotIn("xml.do", self.names)
+        self.assertNotIn("xml.dom.", self.names)
+        self.names.add("xml.dom")
+        self.assertEqual(len(self.names), 6)
+        self.names.discard("xml.dom.minidom")
+        self.assertNotIn("xml.dom.minidom", self.names)
+        self.assertEqual(len(self.names), 5)
+        self.assertSetEqual(
+            set(self.names), {"os", "os.path", "xml", "xml.dom", "xml.etree"}
+        )
+
+    def test_intermediate_names(self):
+        names = ModuleNames(["a.b.c"])
+        self.assertNotIn("a", names)
+        self.assertNotIn("a.b", names)
+        self.assertListEqual(list(names.children("a")), [])
+        self.assertListEqual(list(names.children("a.b")), ["c"])
+        names.discard("a.b.c")
+        self.assertEqual(len(names), 0)
+        self.assertListEqual(list(names), [])
+
+    def test_children(self):
+        self.assertListEqual(list(self.names.children("")), ["os", "xml"])
+        self.assertListEqual(list(self.names.children("", "x")), ["xml"])
+        self.assertListEqual(list(self.names.children("xml")), ["dom", "etree"])
+        self.assertListEqual(list(self.names.children("xml", "e")), ["etree"])
+        self.assertListEqual(list(self.names.children("xml", "z")), [])
+        self.assertListEqual(list(self.names.children("json")), [])
+
+    def test_children_after_insert(self):
+        self.assertListEqual(list(self.names.children("xml")), ["dom", "etree"])
+        self.names.add("xml.sax")
+        self.names.add("xml.parsers")
+        self.assertListEqual(
+            list(self.names.children("xml")),
+            ["dom", "etree", "parsers", "sax"],
+        )
+
+
+class TestFindModules(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        base_path = Path(self.temp_dir.name)
+        (base_path / "pkg" / "sub").mkdir(parents=True)
+        (base_path / "pkg" / "__init__.py").touch()
+        (base_path / "pkg" / "mod.py").touch()
+        (base_path / "pkg" / "sub" / "leaf.py").touch()
+        (base_path / "namespace").mkdir()
+        (base_path / "namespace" / "inner.py").touch()
+        (base_path / "shadowed").mkdir()
+        (base_path / "shadowed" / "hidden.py").touch()
+        (base_path / "shadowed.py").touch()
+        (base_path / "compiled.pyc").touch()
+        (base_path / "notes.txt").touch()
+        (base_path / "dotted.name.py").touch()
+        (base_path / "weird.py").mkdir()
+        (base_path / ".hidden.py").touch()
+        (base_path / "skipped").mkdir()
+        (base_path / "skipped" / "__init__.py").touch()
+        self.base_path = base_path
+
+    def gather(self, **kwargs):
+        module_gatherer = ModuleGatherer(
+            (self.base_path,), skiplist=("skip*",), **kwargs
+        )
+        while module_gatherer.find_coroutine():
+            pass
+        return set(module_gatherer.modules)
+
+    def test_modules(self):
+        self.assertSetEqual(
+            self.gather(max_workers=0),
+            {
+                "pkg",
+                "pkg.mod",
+                "pkg.sub",
+                "pkg.sub.leaf",
+                "namespace",
+                "namespace.inner",
+                "shadowed",
+            },
+        )
+
+    def test_budget(self):
+        module_gatherer = ModuleGatherer((self.base_path,), max_workers=0)
+        self.assertTupleEqual(module_gatherer.progress, (0, 1))
+        self.assertTrue(module_gatherer.find_coroutine(60))
+        self.assertTrue(module_gatherer.fully_loaded)
+        self.assertTupleEqual(module_gatherer.progress, (1, 1))
+        self.assertFalse(module_gatherer.find_coroutine(60))
+        self.assertIn("pkg.sub.leaf", module_gatherer.modules)
+
+    def test_threaded(self):
+        self.assertSetEqual(
+            self.gather(max_workers=4), self.gather(max_workers=0)
+        )
+
+
+class TestArchives(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.archive = Path(self.temp_dir.name) / "modules.zip"
+        with zipfile.ZipFile(self.archive, "w") as zf:
+            for name in (
+                "top.py",
+                "compiled.pyc",
+                "pkg/__init__.py",
+                "pkg/sub.py",
+                "pkg/__pycache__/sub.cpython-311.pyc",
+                "namespace/nested/mod.py",
+                "lib/inner.py",
+                "foo-1.0.dist-info/METADATA",
+                "skipped/mod.py",
+                "data.txt",
+            ):
+                zf.writestr(name, "")
+
+    def gather(self, *paths):
+        module_gatherer = CountingModuleGatherer(
+            paths, skiplist=("skip*",), max_workers=0
+        )
+        while module_gatherer.find_coroutine():
+            pass
+        return module_gatherer
+
+    def test_modules(self):
+        module_gatherer = self.gather(self.archive)
+        self.assertSetEqual(
+            set(module_gatherer.modules),
+            {
+                "top",
+                "compiled",
+                "pkg",
+                "pkg.sub",
+                "namespace",
+                "namespace.nested",
+                "namespace.nested.mod",
+                "lib",
+                "lib.inner",
+            },
+        )
+
+    def test_inner_directory(self):
+        module_gatherer = self.gather(self.archive / "lib")
+        self.assertSetEqual(set(module_gatherer.modules), {"inner"})
+
+    def test_not_an_archive(self):
+        path = Path(self.temp_dir.name) / "file.txt"
+        path.write_text("spam")
+        module_gatherer = self.gather(path)
+        self.assertSetEqual(set(module_gatherer.modules), set())
+
+    def test_cached(self):
+        cache_path = Path(self.temp_dir.name) / "index.json"
+
+        def gather():
+            module_gatherer = ModuleGatherer(
+                (self.archive,), cache_path=cache_path, max_workers=0
+            )
+            with unittest.mock.patch(
+                "zipfile.ZipFile", wraps=zipfile.ZipFile
+            ) as zip_file:
+                while module_gatherer.find_coroutine():
+                    pass
+            self.assertIn("pkg.sub", module_gatherer.modules)
+            return zip_file.called
+
+        self.assertTrue(gather())
+        self.assertFalse(gather())
+        os.utime(self.archive, ns=(0, 0))
+        self.assertTrue(gather())
+
+
+class TestSkiplist(unittest.TestCase):
+    def test_patterns(self):
+        module_gatherer = ModuleGatherer(
+            (), skiplist=("node_modules", "*.egg-info", "test_?", "[ab]c", "")
+        )
+        for name in ("node_modules", "foo.egg-info", "test_1", "ac", "bc"):
+            self.assertTrue(module_gatherer._is_skiplisted(name), name)
+        for name in ("node", "foo.egg", "test_12", "cc", "egg-info", "x"):
+            self.assertFalse(module_gatherer._is_skiplisted(name), name)
+
+    def test_empty(self):
+        module_gatherer = ModuleGatherer(())
+        self.assertFalse(module_gatherer._is_skiplisted("anything"))
+
+
+class CountingModuleGatherer(ModuleGatherer):
+    def __init__(self, *args, **kwargs):
+        self.scanned = []
+        super().__init__(*args, **kwargs)
+
+    def _scan_directory(self, path, stamp):
+        self.scanned.append(os.path.basename(path))
+        return super()._scan_directory(path, stamp)
+
+
+class TestModuleIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        base_path = Path(self.temp_dir.name)
+        self.import_path = base_path / "site"
+        self.cache_path = base_path / "cache" / "index.json"
+
+        (self.import_path / "spam" / "eggs").mkdir(parents=True)
+        (self.import_path / "spam" / "__init__.py").touch()
+        (self.import_path / "spam" / "ham.py").touch()
+        (self.import_path / "spam" / "eggs" / "__init__.py").touch()
+        (self.import_path / "bacon.py").touch()
+
+    def gather(self):
+        module_gatherer = CountingModuleGatherer(
+            (self.import_path,), cache_path=self.cache_path
+        )
+        initial = set(module_gatherer.modules)
+        while module_gatherer.find_coroutine():
+            pass
+        return module_gatherer, initial
+
+    def test_index_written(self):
+        module_gatherer, initial = self.gather()
+        self.assertSetEqual(initial, set())
+        self.assertTrue(self.cache_path.exists())
+        self.assertSetEqual(
+            set(module_gatherer.modules),
+            {"spam", "spam.ham", "spam.eggs", "bacon"},
+        )
+
+    def test_modules_available_before_scan(self):
+        self.gather()
+        module_gatherer, initial = self.gather()
+        self.assertSetEqual(initial, {"spam", "spam.ham", "spam.eggs", "bacon"})
+        self.assertListEqual(module_gatherer.scanned, [])
+
+    def test_only_changed_directories_rescanned(self):
+        self.gather()
+        (self.import_path / "spam" / "sausage.py").touch()
+        os.utime(self.import_path / "spam", ns=(0, 0))
+        module_gatherer, _ = self.gather()
+        self.assertListEqual(module_gatherer.scanned, ["spam"])
+        self.assertIn("spam.sausage", module_gatherer.modules)
+
+    def test_removed_modules_dropped(self):
+        self.gather()
+        (self.import_path / "bacon.py").unlink()
+        os.utime(self.import_path, ns=(0, 0))
+        module_gatherer, initial = self.gather()
+        self.assertIn("bacon", initial)
+        self.assertNotIn("bacon", module_gatherer.modules)
+
+    def test_version_mismatch(self):
+        self.gather()
+        index = ModuleIndex(self.cache_path)
+        self.assertTrue(index.directories)
+        with unittest.mock.patch("bpython.importcompletion.INDEX_VERSION", -1):
+            index = ModuleIndex(self.cache_path)
+        self.assertDictEqual(index.directories, {})
+
+    def test_entries_of_other_sessions_bounded(self):
+        other_path = Path(self.temp_dir.name) / "other"
+        other_path.mkdir()
+        (other_path / "sausage.py").touch()
+        module_gatherer = ModuleGatherer(
+            (other_path,), cache_path=self.cache_path, max_workers=0
+        )
+        while module_gatherer.find_coroutine():
+            pass
+
+        self.gather()
+        index = ModuleIndex(self.cache_path)
+        self.assertIn(str(other_path.resolve()), index.directories)
+
+        (self.import_path / "sausage.py").touch()
+        os.utime(self.import_path, ns=(0, 0))
+        with unittest.mock.patch(
+            "bpython.importcompletion.INDEX_MAX_DIRECTORIES", 0
+        ):
+            self.gather()
+        index = ModuleIndex(self.cache_path)
+        self.assertNotIn(str(other_path.resolve()), index.directories)
+        self.assertIn(str(self.import_path.resolve()), index.directories)
+
+    def test_entries_added_while_saving_saved_later(self):
+        self.gather()
+        index = ModuleIndex(self.cache_path)
+        bacon = str(self.import_path / "bacon.py")
+        write = index._write
+
+        def write_while_parsing(*args):
+            # as if a listing thread added an entry in the meantime
+            index.get_names(bacon)
+            write(*args)
+
+        index.dirty = True
+        with unittest.mock.patch.object(
+            index, "_write", side_effect=write_while_parsing
+        ):
+            index.save()
+        self.assertNotIn(bacon, ModuleIndex(self.cache_path).names)
+        self.assertTrue(index.dirty)
+        index.save()
+        self.assertIn(bacon, ModuleIndex(self.cache_path).names)
+
+    def test_corrupt_index(self):
+        self.cache_path.parent.mkdir(parents=True)
+        self.cache_path.write_text("{")
+        module_gatherer, initial = self.gather()
+        self.assertSetEqual(initial, set())
+        self.assertIn("bacon", module_gatherer.modules)
+
+
+class TestStaticNames(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.import_path = Path(self.temp_dir.name)
+        self.cache_path = self.import_path / "index.json"
+
+        package = self.import_path / "bpython_unimported"
+        package.mkdir()
+        (package / "__init__.py").write_text(
+            "import os.path\n"
+            "from sys import argv as args, version\n"
+            "__all__ = ['exported']\n"
+            "def function(): pass\n"
+            "class Class: attribute = 1\n"
+            "a, (b, *c) = 1, (2, 3)\n"
+            "try:\n"
+            "    import json\n"
+            "except ImportError:\n"
+            "    json = None\n"
+            "if True:\n"
+            "    conditional = 1\n"
+            "def outer():\n"
+            "    inner = 1\n"
+        )
+        (package / "broken.py").write_text("def (:\n")
+
+    def gather(self):
+        module_gatherer = ModuleGatherer(
+            (self.import_path,), cache_path=self.cache_path, max_workers=0
+        )
+        while module_gatherer.find_coroutine():
+            pass
+        return module_gatherer
+
+    def test_names(self):
+        module_gatherer = self.gather()
+        self.assertListEqual(
+            module_gatherer.static_attr_names("bpython_unimported"),
+            [
+                "Class",
+                "__all__",
+                "a",
+                "args",
+                "b",
+                "c",
+                "conditional",
+                "exported",
+                "function",
+                "json",
+                "os",
+                "outer",
+                "version",
+            ],
+        )
+        self.assertNotIn("bpython_unimported", sys.modules)
+
+    def test_syntax_error(self):
+        module_gatherer = self.gather()
+        self.assertListEqual(
+            module_gatherer.static_attr_names("bpython_unimported.broken"), []
+        )
+
+    def test_unknown_module(self):
+        module_gatherer = self.gather()
+        self.assertListEqual(module_gatherer.static_attr_names("spam"), [])
+
+    def test_complete(self):
+        module_gatherer = self.gather()
+        self.assertSetEqual(
+            module_gatherer.complete(32, "from bpython_unimported import f"),
+            {"function"},
+        )
+        self.assertSetEqual(
+            module_gatherer.complete(32, "from bpython_unimported import b"),
+            {"b", "broken"},
+        )
+
+    def test_names_cached(self):
+        module_gatherer = self.gather()
+        module_gatherer.static_attr_names("bpython_unimported")
+        module_gatherer.save_index()
+        with unittest.mock.patch("ast.parse") as parse:
+            self.assertIn(
+                "function",
+                self.gather().static_attr_names("bpython_unimported"),
+            )
+        parse.assert_not_called()
+
+
+class TestRefresh(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.import_path = Path(self.temp_dir.name)
+
+        (self.import_path / "spam").mkdir()
+        (self.import_path / "spam" / "__init__.py").touch()
+        (self.import_path / "bacon.py").touch()
+
+        self.module_gatherer = CountingModuleGatherer(
+            (self.import_path,), max_workers=0
+        )
+        self.finish()
+
+    def finish(self):
+        self.module_gatherer.scanned.clear()
+        while self.module_gatherer.find_coroutine():
+            pass
+
+    def test_unchanged(self):
+        self.assertFalse(self.module_gatherer.refresh())
+        self.assertTrue(self.module_gatherer.fully_loaded)
+
+    def test_added_module(self):
+        (self.import_path / "eggs.py").touch()
+        os.utime(self.import_path, ns=(0, 0))
+        self.assertTrue(self.module_gatherer.refresh())
+        self.assertFalse(self.module_gatherer.fully_loaded)
+        self.finish()
+        self.assertIn("eggs", self.module_gatherer.modules)
+        self.assertListEqual(
+            self.module_gatherer.scanned, [self.import_path.name]
+        )
+
+    def test_removed_module(self):
+        (self.import_path / "bacon.py").unlink()
+        os.utime(self.import_path, ns=(0, 0))
+        self.assertTrue(self.module_gatherer.refresh())
+        self.assertIn("bacon", self.module_gatherer.modules)
+        self.finish()
+        self.assertNotIn("bacon", self.module_gatherer.modules)
+        self.assertIn("spam", self.module_gatherer.modules)
+
+    def test_sys_path_changed(self):
+        module_gatherer = ModuleGatherer(max_workers=0)
+        extra_path = self.import_path / "spam"
+        with unittest.mock.patch.object(
+            sys, "path", sys.path + [str(extra_path)]
+        ):
+            self.assertTrue(module_gatherer.refresh())
+            self.assertIn(str(extra_path), module_gatherer.search_paths)
+        self.assertFalse(module_gatherer.fully_loaded)
+
+
 if __name__ == "__main__":
     unittest.main()
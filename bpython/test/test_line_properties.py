@@ -3,7 +3,9 @@ from typing import Optional, Tuple
 import unittest
 
 from bpython.line import (
+    LineAnalysis,
     LinePart,
+    analyze,
     current_word,
     current_dict_key,
     current_dict,
@@ -402,5 +404,20 @@ class TestCurrentDottedAttribute(LineTestCase):
         self.assertAccess("m.body[0].attr.value|")
 
 
+class TestLineAnalysis(unittest.TestCase):
+    def test_shared(self):
+        analysis = analyze(*cursor("d['a|"))
+        self.assertIs(analyze(*cursor("d['a|")), analysis)
+        self.assertIs(
+            current_dict_key(*cursor("d['a|")), analysis.current_dict_key
+        )
+        self.assertIsNot(analyze(*cursor("d['|a")), analysis)
+
+    def test_dict_and_key(self):
+        analysis = LineAnalysis(*cursor("abc[ab|"))
+        self.assertEqual(analysis.current_dict, LinePart(0, 3, "abc"))
+        self.assertEqual(analysis.current_dict_key, LinePart(4, 6, "ab"))
+
+
 if __name__ == "__main__":
     unittest.main()
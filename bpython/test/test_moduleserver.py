@@ -0,0 +1,131 @@
+import os
+import socket
+import stat
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from bpython.importcompletion import ModuleGatherer
+from bpython import moduleserver
+from bpython.moduleserver import ModuleIndexClient, ModuleIndexServer
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "Unix domain sockets required")
+class TestModuleIndexServer(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        base_path = Path(self.temp_dir.name)
+        self.shared_path = base_path / "shared"
+        self.local_path = base_path / "local"
+        self.socket_path = base_path / "server.sock"
+
+        (self.shared_path / "spam").mkdir(parents=True)
+        (self.shared_path / "spam" / "__init__.py").write_text(
+            "def sausage(): pass\n"
+        )
+        (self.shared_path / "spam" / "ham.py").touch()
+        self.local_path.mkdir()
+        (self.local_path / "spammer.py").touch()
+
+        server_gatherer = ModuleGatherer((self.shared_path,), max_workers=0)
+        while server_gatherer.find_coroutine():
+            pass
+        self.server = ModuleIndexServer(self.socket_path, server_gatherer)
+        thread = threading.Thread(
+            target=self.server.serve_forever, kwargs={"poll_interval": 0.01}
+        )
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def gather(self, timeout=moduleserver.CLIENT_TIMEOUT):
+        client = ModuleIndexClient.connect(self.socket_path, timeout)
+        self.assertIsNotNone(client)
+        module_gatherer = ModuleGatherer(
+            (self.shared_path, self.local_path), max_workers=0, server=client
+        )
+        self.addCleanup(lambda: client.close())
+        while module_gatherer.find_coroutine():
+            pass
+        return module_gatherer
+
+    def test_socket_private(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self.socket_path).st_mode), 0o600)
+
+    def test_no_server(self):
+        self.assertIsNone(
+            ModuleIndexClient.connect(Path(self.temp_dir.name) / "missing")
+        )
+
+    def test_only_local_paths_searched(self):
+        module_gatherer = self.gather()
+        self.assertListEqual(
+            module_gatherer.search_paths, [str(self.local_path)]
+        )
+        self.assertSetEqual(set(module_gatherer.modules), {"spammer"})
+
+    def test_module_matches(self):
+        module_gatherer = self.gather()
+        self.assertSetEqual(
+            module_gatherer.complete(10, "import spa"), {"spam", "spammer"}
+        )
+        self.assertSetEqual(
+            module_gatherer.complete(13, "import spam.h"), {"spam.ham"}
+        )
+
+    def test_static_attr_names(self):
+        module_gatherer = self.gather()
+        self.assertSetEqual(
+            module_gatherer.complete(18, "from spam import s"), {"sausage"}
+        )
+
+    def test_fallback(self):
+        module_gatherer = self.gather()
+        self.server.shutdown()
+        self.server.server_close()
+        # the open connection is still served, so break it from this side
+        module_gatherer._server._socket.shutdown(socket.SHUT_RDWR)
+
+        self.assertSetEqual(
+            module_gatherer.complete(10, "import spa"), {"spammer"}
+        )
+        self.assertFalse(module_gatherer.fully_loaded)
+        while module_gatherer.find_coroutine():
+            pass
+        self.assertSetEqual(
+            module_gatherer.complete(10, "import spa"), {"spam", "spammer"}
+        )
+
+    def test_timeout(self):
+        module_gatherer = self.gather(timeout=0.05)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        respond = self.server.respond
+
+        def slow_respond(request):
+            release.wait()
+            return respond(request)
+
+        with mock.patch.object(self.server, "respond", slow_respond):
+            self.assertSetEqual(
+                module_gatherer.complete(10, "import spa"), {"spammer"}
+            )
+        release.set()
+        # the server is not given up on, and nothing is searched here
+        self.assertTrue(module_gatherer.fully_loaded)
+        self.assertSetEqual(
+            module_gatherer.complete(10, "import spa"), {"spammer"}
+        )
+        # until the connection is reopened
+        module_gatherer._server._reconnect_at = 0
+        self.assertSetEqual(
+            module_gatherer.complete(10, "import spa"), {"spam", "spammer"}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
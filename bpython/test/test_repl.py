@@ -4,6 +4,8 @@ import os
 import socket
 import sys
 import tempfile
+import threading
+import time
 import unittest
 
 from typing import List, Tuple
@@ -12,6 +14,8 @@ from pathlib import Path
 from unittest import mock
 
 from bpython import config, repl, autocomplete
+from bpython.formatter import Parenthesis
+from bpython import line as lineparts
 from bpython.line import LinePart
 from bpython.test import (
     MagicIterMock,
@@ -25,8 +29,9 @@ pypy = "PyPy" in sys.version
 
 def setup_config(conf):
     config_struct = config.Config(TEST_CONFIG)
-    if conf is not None and "autocomplete_mode" in conf:
-        config_struct.autocomplete_mode = conf["autocomplete_mode"]
+    if conf is not None:
+        for key, value in conf.items():
+            setattr(config_struct, key, value)
     return config_struct
 
 
@@ -68,6 +73,30 @@ class FakeRepl(repl.Repl):
         raise NotImplementedError
 
 
+class SlowCompletion(autocomplete.BaseCompletionType):
+    """Completes the attributes of `slow`, once release is set."""
+
+    background = True
+
+    def __init__(self, release):
+        super().__init__()
+        self.release = release
+
+    def matches(self, cursor_offset, line, **kwargs):
+        self.release.wait()
+        r = self.locate(cursor_offset, line)
+        if r is None:
+            return None
+        return {m for m in ("slow.spam", "slow.eggs") if m.startswith(r.word)}
+
+    def locate(self, cursor_offset, line):
+        r = lineparts.current_word(cursor_offset, line)
+        return r if r is not None and r.word.startswith("slow.") else None
+
+    def narrowable(self, word, new_word):
+        return new_word.startswith(word)
+
+
 class TestMatchesIterator(unittest.TestCase):
     def setUp(self):
         self.matches = ["bobby", "bobbies", "bobberina"]
@@ -149,6 +178,23 @@ class TestMatchesIterator(unittest.TestCase):
     def test_is_cseq(self):
         self.assertTrue(self.matches_iterator.is_cseq())
 
+    def test_accepted_only_if_kept(self):
+        on_accept = mock.Mock()
+        matches_iterator = repl.MatchesIterator(on_accept=on_accept)
+        completer = mock.Mock()
+        completer.locate.return_value = LinePart(0, 3, "bob")
+        matches_iterator.update(3, "bob", self.matches, completer)
+        next(matches_iterator)
+        # the match was deleted again
+        matches_iterator.clear(3, "bob")
+        on_accept.assert_not_called()
+
+        matches_iterator.update(3, "bob", self.matches, completer)
+        next(matches_iterator)
+        completer.locate.return_value = LinePart(0, 6, "bobby.")
+        matches_iterator.update(6, "bobby.", self.matches, completer)
+        on_accept.assert_called_once_with(completer, "bobby", 3, "bob")
+
 
 class TestArgspec(unittest.TestCase):
     def setUp(self):
@@ -383,6 +429,36 @@ class TestRepl(unittest.TestCase):
         self.set_input_line('a = "2" + 2')
         self.assertEqual(self.repl.current_string(), "")
 
+    def test_tokenize_matching_paren(self):
+        self.repl.cpos = 0
+        tokens = self.repl.tokenize("f(x)")
+        self.assertEqual(tokens[1], (Parenthesis, "("))
+        self.assertEqual(tokens[-1], (Parenthesis, ")"))
+        self.assertEqual(self.repl.highlighted_paren[0], 0)
+
+        self.repl.cpos = 3
+        tokens = self.repl.tokenize("f(x)")
+        self.assertEqual(tokens[1], (Parenthesis.UnderCursor, "("))
+        self.assertEqual(tokens[-1], (Parenthesis, ")"))
+        self.assertIsNone(self.repl.highlighted_paren)
+
+    def test_tokenize_matching_paren_on_previous_line(self):
+        self.repl.buffer = ["f(x,", "  [y],"]
+        self.repl.cpos = 0
+        with mock.patch.object(self.repl, "reprint_line") as reprint_line:
+            tokens = self.repl.tokenize("  z)")
+        self.assertEqual(tokens[-1], (Parenthesis, ")"))
+        lineno, line_tokens = reprint_line.call_args.args
+        self.assertEqual(lineno, 0)
+        self.assertEqual(line_tokens[1], (Parenthesis, "("))
+        self.assertEqual(self.repl.highlighted_paren[0], 0)
+        self.assertNotIn((Parenthesis, "("), self.repl.highlighted_paren[1])
+
+        with mock.patch.object(self.repl, "reprint_line") as reprint_line:
+            self.repl.tokenize("  z)", newline=True)
+        reprint_line.assert_not_called()
+        self.assertIsNone(self.repl.highlighted_paren)
+
     def test_push(self):
         self.repl = FakeRepl()
         self.repl.push("foobar = 2")
@@ -425,7 +501,7 @@ class TestRepl(unittest.TestCase):
         self.assertTrue(hasattr(self.repl.matches_iter, "matches"))
         self.assertEqual(
             self.repl.matches_iter.matches,
-            ["ChildProcessError(", "UnboundLocalError(", "__doc__"],
+            ["__doc__", "UnboundLocalError(", "ChildProcessError("],
         )
 
     # 2. Attribute tests
@@ -543,6 +619,209 @@ class TestRepl(unittest.TestCase):
                 self.repl.matches_iter.matches, ["apple2=", "apple="]
             )
 
+    # 5. Narrowing the previous matches
+    def complete_without_completers(self, line):
+        self.set_input_line(line)
+        with mock.patch.object(
+            autocomplete, "get_completer", side_effect=AssertionError
+        ):
+            return self.repl.complete()
+
+    def test_narrowing_global_complete(self):
+        self.repl = FakeRepl(
+            {"autocomplete_mode": autocomplete.AutocompleteModes.SIMPLE}
+        )
+        self.set_input_line("d")
+        self.assertTrue(self.repl.complete())
+
+        self.assertTrue(self.complete_without_completers("di"))
+        self.assertEqual(
+            self.repl.matches_iter.matches, ["dict(", "dir(", "divmod("]
+        )
+        self.assertTrue(self.complete_without_completers("dic"))
+        self.assertEqual(self.repl.matches_iter.matches, ["dict("])
+
+    def test_narrowing_attribute_complete(self):
+        self.repl = FakeRepl(
+            {"autocomplete_mode": autocomplete.AutocompleteModes.FUZZY}
+        )
+        self.repl.push("class Foo: bar = baz = brr = 1")
+        self.repl.push("")
+        self.set_input_line("Foo.b")
+        self.assertTrue(self.repl.complete())
+
+        self.assertTrue(self.complete_without_completers("Foo.br"))
+        self.assertEqual(self.repl.matches_iter.matches, ["Foo.brr", "Foo.bar"])
+
+    def test_ranking(self):
+        self.repl = FakeRepl({"autocomplete_ranking": True})
+        self.set_input_line("di")
+        self.assertTrue(self.repl.complete())
+        self.assertEqual(
+            self.repl.matches_iter.matches, ["dict(", "dir(", "divmod("]
+        )
+        # select divmod( and go on typing
+        for _ in range(3):
+            next(self.repl.matches_iter)
+        self.set_input_line("divmod(")
+        self.repl.complete()
+
+        self.set_input_line("di")
+        self.assertTrue(self.repl.complete())
+        self.assertEqual(
+            self.repl.matches_iter.matches, ["divmod(", "dict(", "dir("]
+        )
+
+    def test_ranking_by_context(self):
+        self.repl = FakeRepl({"autocomplete_ranking": True})
+        self.repl.interp.locals["d"] = {"ab": 1, "ac": 2}
+        self.repl.interp.locals["e"] = {"ab": 1, "ac": 2}
+        self.set_input_line("d['a")
+        self.assertTrue(self.repl.complete())
+        self.assertEqual(self.repl.matches_iter.matches, ["'ab']", "'ac']"])
+        # select 'ac'] and go on typing
+        for _ in range(2):
+            next(self.repl.matches_iter)
+        self.set_input_line("d['ac'] ")
+        self.repl.complete()
+
+        self.set_input_line("d['a")
+        self.assertTrue(self.repl.complete())
+        self.assertEqual(self.repl.matches_iter.matches, ["'ac']", "'ab']"])
+        self.set_input_line("e['a")
+        self.assertTrue(self.repl.complete())
+        self.assertEqual(self.repl.matches_iter.matches, ["'ab']", "'ac']"])
+
+    def test_no_narrowing_after_namespace_change(self):
+        self.repl = FakeRepl(
+            {"autocomplete_mode": autocomplete.AutocompleteModes.SIMPLE}
+        )
+        self.set_input_line("foo")
+        self.assertFalse(self.repl.complete())
+        self.set_input_line("f")
+        self.assertTrue(self.repl.complete())
+        self.repl.push("foobar = 2")
+
+        self.set_input_line("foo")
+        self.assertTrue(self.repl.complete())
+        self.assertEqual(self.repl.matches_iter.matches, ["foobar"])
+
+    def test_no_narrowing_to_private_attributes(self):
+        self.repl = FakeRepl(
+            {"autocomplete_mode": autocomplete.AutocompleteModes.SIMPLE}
+        )
+        self.repl.push("class Foo: _bar = 1")
+        self.repl.push("")
+        self.set_input_line("Foo.")
+        self.repl.complete()
+        self.assertNotIn("Foo._bar", self.repl.matches_iter.matches)
+
+        self.set_input_line("Foo._")
+        self.repl.complete()
+        self.assertIn("Foo._bar", self.repl.matches_iter.matches)
+
+    # 6. Completers running in the background
+    def background_repl(self, budget):
+        self.repl = FakeRepl(
+            {"autocomplete_mode": autocomplete.AutocompleteModes.SIMPLE}
+        )
+        self.repl.config.autocomplete_budget = budget
+        ready = threading.Semaphore(0)
+        self.repl.completion_worker = autocomplete.CompletionWorker(
+            ready.release
+        )
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.repl.completers = (
+            SlowCompletion(self.release),
+        ) + self.repl.completers
+        return ready
+
+    def test_background_matches_within_budget(self):
+        self.background_repl(10000)
+        self.release.set()
+        self.set_input_line("slow.s")
+        self.assertTrue(self.repl.complete())
+        self.assertEqual(self.repl.matches_iter.matches, ["slow.spam"])
+
+    def test_background_matches_shown_later(self):
+        ready = self.background_repl(1)
+        self.set_input_line("slow.s")
+        self.assertFalse(self.repl.complete())
+        self.assertEqual(self.repl.matches_iter.matches, [])
+
+        self.release.set()
+        self.assertTrue(ready.acquire(timeout=5))
+        self.assertTrue(self.repl.show_background_matches())
+        self.assertEqual(self.repl.matches_iter.matches, ["slow.spam"])
+
+    def test_stale_background_matches_discarded(self):
+        ready = self.background_repl(1)
+        self.set_input_line("slow.s")
+        self.assertFalse(self.repl.complete())
+        self.set_input_line("slow.")
+
+        self.release.set()
+        self.assertTrue(ready.acquire(timeout=5))
+        self.assertIsNone(self.repl.show_background_matches())
+        self.assertEqual(self.repl.matches_iter.matches, [])
+
+    def test_stale_background_matches_narrowed(self):
+        ready = self.background_repl(1)
+        self.set_input_line("slow.")
+        self.repl.complete()
+        self.set_input_line("slow.s")
+        self.repl.complete()
+
+        self.release.set()
+        self.assertTrue(ready.acquire(timeout=5))
+        self.assertTrue(self.repl.show_background_matches())
+        self.assertEqual(self.repl.matches_iter.matches, ["slow.spam"])
+
+    def test_other_matches_shown_while_waiting(self):
+        ready = self.background_repl(1)
+        self.repl.interp.locals["slow"] = collections.namedtuple(
+            "Slow", ["sausage"]
+        )(1)
+        self.set_input_line("slow.s")
+        self.assertTrue(self.repl.complete())
+        self.assertEqual(self.repl.matches_iter.matches, ["slow.sausage"])
+
+        self.release.set()
+        self.assertTrue(ready.acquire(timeout=5))
+        self.assertTrue(self.repl.show_background_matches())
+        self.assertEqual(self.repl.matches_iter.matches, ["slow.spam"])
+
+    def test_busy_worker_not_waited_for_if_not_applying(self):
+        self.background_repl(1)
+        self.repl.push("spam = 1")
+        self.set_input_line("slow.s")
+        self.repl.complete()
+
+        # the worker is still busy with slow.s
+        self.repl.config.autocomplete_budget = 10000
+        self.set_input_line("sp")
+        started = time.monotonic()
+        self.assertTrue(self.repl.complete())
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(self.repl.matches_iter.matches, ["spam"])
+
+    def test_attributes_completed_on_main_thread(self):
+        self.background_repl(10000)
+        self.release.set()
+        threads = []
+
+        class Proxy:
+            def __dir__(self):
+                threads.append(threading.current_thread())
+                return ["spam"]
+
+        self.repl.interp.locals["proxy"] = Proxy()
+        self.set_input_line("proxy.s")
+        self.assertTrue(self.repl.complete())
+        self.assertEqual(self.repl.matches_iter.matches, ["proxy.spam"])
+        self.assertEqual(threads, [threading.main_thread()])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1314,7 +1314,9 @@ def main(args=None, locals_=None, banner=None):
         # This bypasses main_loop.set_alarm_in because we must *not*
         # hit the draw_screen call (it's unnecessary and slow).
         def run_find_coroutine():
-            if myrepl.module_gatherer.find_coroutine():
+            if myrepl.module_gatherer.find_coroutine(
+                config.import_completion_budget / 1000
+            ):
                 main_loop.event_loop.alarm(0, run_find_coroutine)
 
         run_find_coroutine()
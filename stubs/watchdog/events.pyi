@@ -1,5 +1,9 @@
 class FileSystemEvent:
     @property
     def src_path(self) -> str: ...
+    @property
+    def event_type(self) -> str: ...
+    @property
+    def is_directory(self) -> bool: ...
 
 class FileSystemEventHandler: ...
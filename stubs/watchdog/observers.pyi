@@ -6,3 +6,5 @@ class Observer:
         self, observer: FileSystemEventHandler, dirname: str, recursive: bool
     ): ...
     def unschedule_all(self): ...
+    def stop(self): ...
+    def join(self, timeout: float | None = None): ...
@@ -2,3 +2,4 @@ from typing import ClassVar
 
 class BaseDirectory:
     xdg_config_home: ClassVar[str]
+    xdg_cache_home: ClassVar[str]